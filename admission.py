@@ -0,0 +1,212 @@
+"""
+admission.py
+
+Admission control in front of Graph.run_once.
+
+Turns the supervisor routes to an expensive node (the recipe node, with its
+paid LLM call) have to be admitted before they run:
+
+- each user has a token bucket; a user over their rate is turned away at once
+  (rejected), however idle the service is,
+- a global token bucket (the LLM quota) and a cap on expensive turns in
+  flight; while either is exhausted turns wait in a bounded queue. The queue
+  is fair: waiting users are served round-robin, one turn each, so a user
+  with many queued turns cannot hold up everyone else,
+- a turn that finds the queue full, or is still waiting after max_wait
+  seconds, is shed: `shed_node` runs instead, which serves a cached or
+  catalog recipe without calling the LLM.
+
+Cheap turns (greetings, preferences, step-by-step, chat) skip admission.
+
+Outcomes are counted in chef_admission_total{outcome=admitted|queued|rejected|shed}
+(a queued turn is counted again once admitted or shed) and queue waits in
+chef_admission_wait_seconds; stats() has the same numbers for one controller.
+
+The decision core (submit, dispatch, cancel, release) never blocks and reads
+time only from `clock`, so a simulation can drive it with a fake clock
+(benchmarks/bench_admission.py). run_once() wraps it for threaded callers.
+"""
+
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from metrics import inc, observe
+from ratelimit import TokenBucket
+
+USER_PER_MIN = float(os.getenv("ADMISSION_USER_PER_MIN") or 6)
+USER_BURST = float(os.getenv("ADMISSION_USER_BURST") or 3)
+GLOBAL_PER_SEC = float(os.getenv("ADMISSION_GLOBAL_PER_SEC") or 5)
+GLOBAL_BURST = float(os.getenv("ADMISSION_GLOBAL_BURST") or 10)
+MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT") or 16)
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE") or 64)
+MAX_WAIT_SEC = float(os.getenv("ADMISSION_MAX_WAIT_SEC") or 10)
+
+ADMITTED, QUEUED, REJECTED, SHED = "admitted", "queued", "rejected", "shed"
+REJECT_TEXT = "You're asking faster than I can cook! Give me {wait:.0f} seconds and ask again."
+
+
+class Ticket:
+    __slots__ = ("user_id", "submitted", "granted")
+
+    def __init__(self, user_id: str, submitted: float):
+        self.user_id = user_id
+        self.submitted = submitted
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    AdmissionController: wraps a Graph; run_once() has Graph.run_once's
+    signature, so it can stand in for the graph.
+    """
+
+    def __init__(self, graph=None, user_per_min: float = USER_PER_MIN, user_burst: float = USER_BURST,
+                 global_per_sec: float = GLOBAL_PER_SEC, global_burst: float = GLOBAL_BURST,
+                 max_inflight: int = MAX_INFLIGHT, max_queue: int = MAX_QUEUE, max_wait: float = MAX_WAIT_SEC,
+                 expensive: Tuple[str, ...] = ("recipe",), shed_node: str = "recipe_offline",
+                 clock: Callable[[], float] = time.monotonic, max_users: int = 100_000):
+        self.graph = graph
+        self.user_rate = user_per_min / 60.0
+        self.user_burst = user_burst
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.expensive = frozenset(expensive)
+        self.shed_node = shed_node
+        self.clock = clock
+        self.max_users = max_users
+        self.inflight = 0
+        self.counts: Counter = Counter()
+        self._global = TokenBucket(global_per_sec, global_burst, clock=clock)
+        # user_id -> bucket, least recently seen first; an evicted user starts again with a full bucket
+        self._users: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # user_id -> that user's waiting tickets; users are served in this order, round-robin
+        self._waiting: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()
+        self._queued = 0
+        self._cond = threading.Condition()
+
+    def _count(self, outcome: str) -> str:
+        self.counts[outcome] += 1
+        inc("chef_admission_total", outcome=outcome)
+        return outcome
+
+    def _bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst, clock=self.clock)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    def _grantable(self) -> bool:
+        # takes a global token when it says yes
+        return self.inflight < self.max_inflight and self._global.try_acquire()
+
+    def _grant(self, ticket: Ticket) -> None:
+        ticket.granted = True
+        self.inflight += 1
+        self._count(ADMITTED)
+
+    def submit(self, user_id: str) -> Tuple[str, Optional[Ticket]]:
+        """
+        Ask to run one expensive turn: (ADMITTED, ticket) to run it now,
+        (QUEUED, ticket) to wait for dispatch(), or (REJECTED | SHED, None).
+        An admitted ticket must be given back with release().
+        """
+        with self._cond:
+            if not self._bucket(user_id).try_acquire():
+                return self._count(REJECTED), None
+            ticket = Ticket(user_id, self.clock())
+            # nobody may jump the queue
+            if not self._queued and self._grantable():
+                self._grant(ticket)
+                return ADMITTED, ticket
+            if self._queued >= self.max_queue:
+                return self._count(SHED), None
+            self._waiting.setdefault(user_id, deque()).append(ticket)
+            self._queued += 1
+            return self._count(QUEUED), ticket
+
+    def dispatch(self) -> List[Ticket]:
+        """Admit waiting tickets, one per user in turn, while there is capacity; returns them."""
+        granted = []
+        with self._cond:
+            while self._waiting and self._grantable():
+                user_id, waiting = next(iter(self._waiting.items()))
+                ticket = waiting.popleft()
+                if waiting:
+                    self._waiting.move_to_end(user_id)
+                else:
+                    del self._waiting[user_id]
+                self._queued -= 1
+                self._grant(ticket)
+                observe("chef_admission_wait_seconds", self.clock() - ticket.submitted)
+                granted.append(ticket)
+            if granted:
+                self._cond.notify_all()
+        return granted
+
+    def cancel(self, ticket: Ticket) -> bool:
+        """Give up on a waiting ticket (it is shed); False if it was admitted meanwhile."""
+        with self._cond:
+            if ticket.granted:
+                return False
+            waiting = self._waiting.get(ticket.user_id)
+            if waiting is None or ticket not in waiting:
+                return False
+            waiting.remove(ticket)
+            if not waiting:
+                del self._waiting[ticket.user_id]
+            self._queued -= 1
+            self._count(SHED)
+            return True
+
+    def release(self, ticket: Ticket) -> List[Ticket]:
+        """An admitted turn finished; returns the waiting tickets its slot let in."""
+        with self._cond:
+            self.inflight -= 1
+            return self.dispatch()
+
+    def retry_after(self, user_id: str) -> float:
+        """Seconds until `user_id` may start another expensive turn."""
+        with self._cond:
+            return self._bucket(user_id).wait_time()
+
+    def _wait(self, ticket: Ticket) -> str:
+        deadline = ticket.submitted + self.max_wait
+        with self._cond:
+            while not ticket.granted:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return SHED if self.cancel(ticket) else ADMITTED
+                # global tokens come back with time, not with release(): wake up to dispatch them
+                self._cond.wait(min(remaining, max(self._global.wait_time(), 0.005)))
+                self.dispatch()
+        return ADMITTED
+
+    def run_once(self, ctx: Dict[str, Any], message: str,
+                 on_event: Optional[Callable[[str, str, Any], None]] = None):
+        node_key = self.graph.route(ctx, message)
+        if node_key not in self.expensive:
+            return self.graph.run_once(ctx, message, on_event, node_key=node_key)
+        user_id = ctx.get("user_id", "anonymous")
+        outcome, ticket = self.submit(user_id)
+        if outcome == QUEUED:
+            outcome = self._wait(ticket)
+        if outcome == REJECTED:
+            return REJECT_TEXT.format(wait=max(1.0, self.retry_after(user_id))), ctx
+        if outcome == SHED:
+            return self.graph.run_once(ctx, message, on_event, node_key=self.shed_node)
+        try:
+            return self.graph.run_once(ctx, message, on_event, node_key=node_key)
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self.counts, inflight=self.inflight, waiting=self._queued, users=len(self._users))
@@ -1 +1,17 @@
-from . import greeting, preference, recipe, regular_chat, step_by_step, feedback
+"""
+Agent modules are imported on first use: agents.recipe pulls in the OpenAI SDK,
+pydantic and the recipe catalog, which a worker does not need to render its
+first page or answer a greeting.
+"""
+
+import importlib
+
+__all__ = ["greeting", "preference", "recipe", "regular_chat", "step_by_step", "feedback"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f".{name}", __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
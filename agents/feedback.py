@@ -1,11 +1,22 @@
+from typing import Any, Dict, Optional
+
+from catalog import recipe_key
 from memory import store_feedback
 
-def collect_feedback(user_id: str, score: int, comment: str = ""):
+def collect_feedback(user_id: str, score: int, comment: str = "", recipe: Optional[Dict[str, Any]] = None,
+                     prefs: Optional[Dict[str, Any]] = None):
     try:
         score_int = int(score)
     except Exception:
         return {"error":"score must be integer 1-5"}
     if score_int < 1 or score_int > 5:
         return {"error":"score must be 1-5"}
-    store_feedback(user_id, score_int, comment)
+    # link the score to the recipe it rates and the preferences it was made for
+    key = title = region = spice = None
+    if recipe:
+        key, title = recipe_key(recipe), recipe.get("title")
+    if prefs:
+        region = str(prefs.get("region_preference") or "").strip().lower() or None
+        spice = prefs.get("spice_level")
+    store_feedback(user_id, score_int, comment, key, title, region, spice)
     return {"agent":"feedback", "text":"Thanks for your feedback!"}
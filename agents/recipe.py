@@ -1,83 +1,268 @@
+import asyncio
 import os
 import json
-from dotenv import load_dotenv
-from openai import OpenAI
+import hashlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 
-load_dotenv()
+import catalog
+import prompts
+import ratings
+import recipe_parser
+from cache import RecipeCache, cache_key
+from json_stream import IncrementalJSONParser
+from llm import get_gateway
+from metrics import inc, span
+from ratelimit import TokenBucket
 
-API_KEY = os.getenv("OPENAI_API_KEY")
+# .env is loaded once by the entry points (app.py, prewarm.py) before this import
 MODEL = os.getenv("OPENAI_MODEL") or "gpt-4o-mini"
-client = OpenAI(api_key=API_KEY)
-
-SYSTEM_PROMPT = """
-You are Chef Raghav — a seasoned Indian chef with 30+ years across India and Italy.
-When user asks, produce JSON only with keys:
-title, cultural_note, ingredients (list), steps (list of {text, optional timer_sec, optional timer_label}), tips (list).
-- At least one step must include timer_sec (an integer, seconds).
-- Respect allergies/dislikes.
-- Adapt spice_level and number_of_people in ingredient quantities.
-- Keep steps short and actionable.
-"""
-
-def _build_user_prompt(prefs):
-    # prefs is Pydantic Preferences or dict
-    if hasattr(prefs, "dict"):
-        p = prefs.dict()
-    else:
-        p = prefs
-    return f"""Generate a recipe personalized to:
-number_of_people={p.get('number_of_people')}, spice_level={p.get('spice_level')}, region={p.get('region_preference')},
-preference_type={p.get('preference_type')}, allergies={p.get('allergies')}, dislikes={p.get('dislikes')}.
-Return ONLY valid JSON matching the schema. Keep text natural and chef-like.
-"""
-
-def generate(prefs):
+# None: the shared pooled gateway (deadlines, retries, per-user token accounting),
+# resolved on first call; tests and benchmarks assign their own
+gateway = None
+
+# the persona-based system prompt, compact preferences and max_tokens sizing live in prompts.py
+SYSTEM_PROMPT = prompts.system_prompt()
+RECIPE_MAX_TOKENS = prompts.recipe_max_tokens()
+
+# bump when the prompt or model changes so old cached generations stop matching
+PROMPT_VERSION = hashlib.sha256((MODEL + SYSTEM_PROMPT + prompts.USER_PREFIX).encode("utf-8")).hexdigest()[:16]
+
+def _rating(recipe):
+    # feedback score of a cached variant; ranking must never break serving
+    try:
+        return ratings.get_ratings().score("recipe", catalog.recipe_key(recipe))
+    except sqlite3.Error:
+        return None
+
+recipe_cache = RecipeCache(
+    max_size=int(os.getenv("RECIPE_CACHE_SIZE") or 1024),
+    ttl=float(os.getenv("RECIPE_CACHE_TTL") or 7 * 24 * 3600),
+    variants=int(os.getenv("RECIPE_CACHE_VARIANTS") or 1),
+    rating=_rating,
+)
+
+def _fallback_recipe():
+    # fallback: create a simple templated recipe (should rarely happen)
+    return {
+        "title": "Simple Tomato Curry",
+        "cultural_note": "A quick fallback recipe blended from Indian and Italian ideas.",
+        "ingredients": ["Tomatoes 500g", "Onion 1", "Salt", "Oil 2 tbsp"],
+        "steps": [
+            {"text": "Chop vegetables."},
+            {"text": "Sauté onion.", "timer_sec": 60, "timer_label": "saute onion"},
+            {"text": "Add tomatoes and simmer.", "timer_sec": 300, "timer_label": "simmer tomatoes"}
+        ],
+        "tips": ["Use ripe tomatoes", "Add a pinch of sugar to balance acidity"]
+    }
+
+# completion budget for a repair reply: it only carries the broken fields
+REPAIR_MAX_TOKENS = int(os.getenv("RECIPE_REPAIR_MAX_TOKENS") or 400)
+
+def _parsed(content: str, truncated: bool = False):
+    """Locally parsed ParseResult for a reply, counted by outcome."""
+    result = recipe_parser.parse_recipe(content, truncated)
+    if result.recipe is not None:
+        inc("chef_recipe_parse_total", result="repaired" if result.repaired else "ok")
+    return result
+
+def _repaired(result, reply: str):
+    recipe = recipe_parser.apply_repair(result, reply)
+    inc("chef_recipe_parse_total", result="reprompted" if recipe is not None else "failed")
+    return recipe
+
+def _parse_recipe(content: str, user_id=None, truncated: bool = False):
     """
-    Calls OpenAI Chat Completions (chat.completions.create) via the OpenAI client.
-    Expects returned message content to be raw JSON.
+    Parse the assistant reply into a validated recipe dict. Fields that fail
+    validation, or that a reply cut off at max_tokens (`truncated`) did not
+    finish, are sent back for a short repair call rather than regenerating
+    the recipe; returns None if there is no JSON object or the repair fails.
     """
-    prompt = _build_user_prompt(prefs)
-    resp = client.chat.completions.create(
-        model=MODEL,
-        temperature=0.8,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=1000
-    )
-    content = resp.choices[0].message.content
-    # Clean up if assistant wrapped in markdown
-    content = content.strip()
-    # attempt to find first JSON object in content
+    result = _parsed(content, truncated)
+    if result.recipe is not None or result.data is None:
+        return result.recipe
+    try:
+        resp = _gateway().chat(recipe_parser.repair_messages(result), node="recipe_repair", user_id=user_id,
+                               model=MODEL, temperature=0, max_tokens=REPAIR_MAX_TOKENS)
+    except Exception:
+        return None
+    return _repaired(result, resp.choices[0].message.content)
+
+async def _aparse_recipe(content: str, user_id=None, truncated: bool = False):
+    """Async variant of _parse_recipe()."""
+    result = _parsed(content, truncated)
+    if result.recipe is not None or result.data is None:
+        return result.recipe
+    try:
+        resp = await _gateway().achat(recipe_parser.repair_messages(result), node="recipe_repair", user_id=user_id,
+                                      model=MODEL, temperature=0, max_tokens=REPAIR_MAX_TOKENS)
+    except Exception:
+        return None
+    return _repaired(result, resp.choices[0].message.content)
+
+def _truncated(choice) -> bool:
+    # the reply stopped at max_tokens
+    return getattr(choice, "finish_reason", None) == "length"
+
+def _servings(prefs):
+    p = prefs.dict() if hasattr(prefs, "dict") else prefs
+    return p.get("number_of_people")
+
+def _gateway():
+    return gateway or get_gateway()
+
+def _fallback(reason: str):
+    inc("chef_llm_fallbacks_total", reason=reason)
+    return _fallback_recipe()
+
+def _call_llm(prefs, user_id=None):
+    """
+    Calls OpenAI Chat Completions through the LLM gateway (retries and deadline
+    included). Expects returned message content to be raw JSON; returns None if
+    it is not. Raises once the gateway gives up.
+    """
+    resp = _gateway().chat(prompts.recipe_messages(prefs), node="recipe", user_id=user_id,
+                           model=MODEL, temperature=0.8, max_tokens=RECIPE_MAX_TOKENS)
+    choice = resp.choices[0]
+    return _parse_recipe(choice.message.content, user_id, _truncated(choice))
+
+def _stored(key, prefs):
+    """The cached generation for `key`, else a close catalog recipe; None when neither has one."""
+    cached = recipe_cache.get(key)
+    if cached is not None:
+        return json.loads(json.dumps(cached))
+    return catalog.lookup(prefs)
+
+def generate(prefs, use_cache: bool = True, user_id=None):
+    """
+    Return a recipe for `prefs`, serving it from recipe_cache when an identical
+    request (same canonical Preferences, prompt and model) was generated before,
+    then from the offline catalog when a stored recipe fits closely enough.
+    Fallback recipes are never cached.
+    """
+    key = cache_key(prefs, PROMPT_VERSION) if use_cache else None
+    if key:
+        found = _stored(key, prefs)
+        if found is not None:
+            return found
+    try:
+        recipe = _call_llm(prefs, user_id)
+    except Exception:
+        return _fallback("error")
+    if recipe is None:
+        return _fallback("parse")
+    recipe.setdefault("servings", _servings(prefs))
+    if key:
+        recipe_cache.put(key, json.loads(json.dumps(recipe)))
+    return recipe
+
+def offline(prefs, min_score=None):
+    """
+    A recipe for `prefs` without an LLM call: the cached generation, else a
+    catalog recipe scoring at least `min_score`; None when neither has one.
+    """
+    cached = recipe_cache.get(cache_key(prefs, PROMPT_VERSION))
+    if cached is not None:
+        return json.loads(json.dumps(cached))
+    return catalog.lookup(prefs, min_score)
+
+async def agenerate(prefs, use_cache: bool = True, user_id=None):
+    """Async variant of generate() using the gateway's async client."""
+    key = cache_key(prefs, PROMPT_VERSION) if use_cache else None
+    if key:
+        # the cache's persistent tier and the catalog read SQLite: keep them off the event loop
+        found = await asyncio.get_running_loop().run_in_executor(None, _stored, key, prefs)
+        if found is not None:
+            return found
+    try:
+        resp = await _gateway().achat(prompts.recipe_messages(prefs), node="recipe", user_id=user_id,
+                                      model=MODEL, temperature=0.8, max_tokens=RECIPE_MAX_TOKENS)
+    except Exception:
+        return _fallback("error")
+    choice = resp.choices[0]
+    recipe = await _aparse_recipe(choice.message.content, user_id, _truncated(choice))
+    if recipe is None:
+        return _fallback("parse")
+    recipe.setdefault("servings", _servings(prefs))
+    if key:
+        recipe_cache.put(key, json.loads(json.dumps(recipe)))
+    return recipe
+
+def generate_batch(prefs_list, max_workers: int = 8, requests_per_sec: float = 5.0, force: bool = False):
+    """
+    Generate recipes for many Preferences at once, e.g. to prewarm the cache
+    with popular combinations. Identical inputs (same cache key) are generated
+    once, keys already cached are skipped unless `force`, and LLM calls are
+    spread over a bounded worker pool paced by a token bucket. Results are
+    stored in recipe_cache and returned in input order (None where the
+    generation failed).
+    """
+    keys = [cache_key(p, PROMPT_VERSION) for p in prefs_list]
+    todo = {}
+    for key, prefs in zip(keys, prefs_list):
+        if key in todo:
+            continue
+        if not force and recipe_cache.get(key) is not None:
+            continue
+        todo[key] = prefs
+    limiter = TokenBucket(requests_per_sec)
+
+    def work(item):
+        key, prefs = item
+        limiter.acquire()
+        try:
+            recipe = _call_llm(prefs)
+        except Exception:
+            return key, None
+        if recipe is not None:
+            recipe.setdefault("servings", _servings(prefs))
+            recipe_cache.put(key, json.loads(json.dumps(recipe)))
+        return key, recipe
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = dict(pool.map(work, todo.items()))
+    return [results[k] if k in results else recipe_cache.get(k) for k in keys]
+
+def generate_stream(prefs, use_cache: bool = True, user_id=None):
+    """
+    Streaming variant of generate(). Yields (kind, key, value) events:
+    ("field", key, value) once a top-level recipe field is complete,
+    ("item", key, value) once an ingredient/step/tip is complete, and finally
+    ("done", "recipe", recipe) with the full recipe (the fallback recipe if the
+    streamed reply did not parse). Cache and catalog hits are replayed as events.
+    """
+    key = cache_key(prefs, PROMPT_VERSION) if use_cache else None
+    if key:
+        cached = recipe_cache.get(key)
+        recipe = json.loads(json.dumps(cached)) if cached is not None else catalog.lookup(prefs)
+        if recipe is not None:
+            for k, v in recipe.items():
+                yield ("field", k, v)
+            yield ("done", "recipe", recipe)
+            return
+    parser = IncrementalJSONParser()
+    truncated = False
     try:
-        # if the assistant returns markdown/code fences, strip them
-        if content.startswith("```"):
-            # remove code fence
-            parts = content.split("```")
-            # choose the middle portion if present
-            for part in parts:
-                part = part.strip()
-                if part.startswith("{"):
-                    content = part
-                    break
-        recipe = json.loads(content)
-        # minimal schema checks
-        recipe.setdefault("tips", [])
-        recipe.setdefault("ingredients", [])
-        recipe.setdefault("steps", [])
-        return recipe
-    except Exception as e:
-        # fallback: create a simple templated recipe (should rarely happen)
-        fallback = {
-            "title": "Simple Tomato Curry",
-            "cultural_note": "A quick fallback recipe blended from Indian and Italian ideas.",
-            "ingredients": ["Tomatoes 500g", "Onion 1", "Salt", "Oil 2 tbsp"],
-            "steps": [
-                {"text": "Chop vegetables."},
-                {"text": "Sauté onion.", "timer_sec": 60, "timer_label": "saute onion"},
-                {"text": "Add tomatoes and simmer.", "timer_sec": 300, "timer_label": "simmer tomatoes"}
-            ],
-            "tips": ["Use ripe tomatoes", "Add a pinch of sugar to balance acidity"]
-        }
-        return fallback
+        with span("llm_stream", model=MODEL):
+            # usage only appears on the final chunk when the server reports it;
+            # the gateway accounts for it
+            for chunk in _gateway().stream(prompts.recipe_messages(prefs), node="recipe", user_id=user_id,
+                                           model=MODEL, temperature=0.8, max_tokens=RECIPE_MAX_TOKENS):
+                if not chunk.choices:
+                    continue
+                truncated = truncated or _truncated(chunk.choices[0])
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield from parser.feed(delta)
+    except Exception:
+        # fields already streamed stay on screen; the turn ends with the fallback
+        yield ("done", "recipe", _fallback("error"))
+        return
+    recipe = _parse_recipe(parser.text, user_id, truncated)
+    if recipe is None:
+        yield ("done", "recipe", _fallback("parse"))
+        return
+    recipe.setdefault("servings", _servings(prefs))
+    if key:
+        recipe_cache.put(key, json.loads(json.dumps(recipe)))
+    yield ("done", "recipe", recipe)
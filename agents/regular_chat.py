@@ -1,9 +1,39 @@
+import os
+
+from metrics import inc, span
+from semantic_cache import SemanticCache
 from utils import guardrail, scrub_pii
 
+# repeated questions ("how do I make rice fluffy") are answered from here
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE", "1") == "1"
+chat_cache = SemanticCache(
+    max_size=int(os.getenv("CHAT_CACHE_SIZE") or 10000),
+    threshold=float(os.getenv("CHAT_CACHE_THRESHOLD") or 0.8),
+)
+
+# answers are cached with {question} left in, and filled in with the question
+# being asked: a paraphrase that hits the cache must not get someone else's words back
+QUESTION = "{question}"
+
+def _answer(text: str) -> str:
+    # light chit-chat style; the slow, paid part once this calls an LLM
+    return f"Ah! About '{QUESTION}', here's a short chef tip — taste as you go and balance salt and acid."
+
+def _fill(answer: str, text: str) -> str:
+    return answer.replace(QUESTION, text)
+
 def reply(user_text: str):
     ok, reason = guardrail(user_text)
     if not ok:
         return {"agent": "regular", "text": f"I can help only with cooking topics: {reason}"}
     text = scrub_pii(user_text)
-    # light chit-chat style
-    return {"agent": "regular", "text": f"Ah! About '{text}', here's a short chef tip — taste as you go and balance salt and acid."}
+    if CHAT_CACHE_ENABLED:
+        with span("chat_cache"):
+            cached = chat_cache.get(text)
+        inc("chef_chat_cache_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            return {"agent": "regular", "text": _fill(cached, text)}
+    answer = _answer(text)
+    if CHAT_CACHE_ENABLED:
+        chat_cache.put(text, answer)
+    return {"agent": "regular", "text": _fill(answer, text)}
@@ -1,21 +1,100 @@
+"""
+step_by_step.py
+
+Step-by-step guidance as a small state machine over the recipe's steps.
+
+The position is only the step index kept on the session (ctx["step_index"]),
+so each command (next, repeat, slow, back, jump to step N) costs the same
+however long the recipe is, and nothing is copied per turn. A step's timer is
+armed when that step starts, once per recipe (`armed` is a bitmask of step
+indexes kept in ctx["_armed_steps"]). Going past the last step leaves running
+timers alone (the final simmer is still on the stove); all of the user's
+pending timers are cancelled together when another recipe replaces this one.
+"""
+
+import re
 import time
-from memory import add_timer
-from typing import Dict, Any
+from memory import add_timer, cancel_timers
+from typing import Dict, Any, Optional, Tuple
+
+COMMANDS = {"next": "next", "n": "next", "repeat": "repeat", "r": "repeat", "slow": "slow", "s": "slow",
+            "back": "back", "b": "back", "previous": "back", "prev": "back"}
+# "step 3", "go to step 3", "jump to 3", "skip to step 3"; a bare number is a feedback score
+_JUMP_RE = re.compile(r"^(?:(?:go|jump|skip|goto)(?: to)? )?(?:step )?(\d{1,3})$")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+|,\s+")
+HELP = "Say next, repeat, slow, back or step <number>."
+
+
+def parse_command(message: str) -> Tuple[Optional[str], Optional[int]]:
+    """(command, zero-based step for "jump") for a navigation message, or (None, None)."""
+    text = " ".join(message.lower().split()).strip(" .!?")
+    if text in COMMANDS:
+        return COMMANDS[text], None
+    m = _JUMP_RE.match(text)
+    if m and not text.isdigit():
+        return "jump", int(m.group(1)) - 1
+    return None, None
+
+
+def _arm(user_id: str, steps, index: int, armed: int, now: int) -> int:
+    step = steps[index]
+    if step.get("timer_sec") and not armed >> index & 1:
+        add_timer(user_id, step.get("timer_label") or "timer", now + int(step["timer_sec"]))
+        armed |= 1 << index
+    return armed
+
+
+def _reply(steps, index: int, armed: int, text: str, done: bool = False) -> Dict[str, Any]:
+    return {"agent": "step", "current_step": steps[index] if steps else {}, "index": index,
+            "total": len(steps), "armed": armed, "done": done, "text": text}
 
-def start_step_by_step(user_id: str, recipe: Dict[str,Any]):
+
+def _show(steps, index: int) -> str:
+    return f"Step {index + 1} of {len(steps)}: {steps[index].get('text')}"
+
+
+def start_step_by_step(user_id: str, recipe: Dict[str, Any], now: Optional[int] = None):
     """
-    Prepare step state, register timers for steps that include timer_sec, and return
-    the first step alongside remaining steps. This returns a dict:
-    {'agent':'step', 'current_step': {...}, 'remaining': [...]}
+    Start at the first step and arm its timer, if it has one. Returns
+    {'agent':'step', 'current_step': {...}, 'index': 0, 'total': n, 'armed': mask, 'done': bool, 'text': str}
     """
     steps = recipe.get("steps", [])
     if not steps:
-        return {"agent":"step", "current_step": {}, "remaining": []}
-    now = int(time.time())
-    # register timers for any steps that include timer_sec
-    for s in steps:
-        if "timer_sec" in s:
-            add_timer(user_id, s.get("timer_label", "timer"), now + int(s["timer_sec"]))
-    current = steps[0]
-    remaining = steps[1:]
-    return {"agent":"step", "current_step": current, "remaining": remaining}
+        return _reply(steps, 0, 0, "This recipe has no steps to guide you through.", done=True)
+    armed = _arm(user_id, steps, 0, 0, now or int(time.time()))
+    return _reply(steps, 0, armed, "Starting step-by-step. " + _show(steps, 0))
+
+
+def navigate(user_id: str, recipe: Dict[str, Any], index: int, command: Optional[str],
+             target: Optional[int] = None, armed: int = 0, now: Optional[int] = None):
+    """Apply one command at step `index`; same result shape as start_step_by_step()."""
+    steps = recipe.get("steps", [])
+    if not steps:
+        return _reply(steps, 0, armed, "This recipe has no steps to guide you through.", done=True)
+    index = min(max(index, 0), len(steps) - 1)
+    if command == "next":
+        if index + 1 == len(steps):
+            return _reply(steps, index, armed, "That was the last step, enjoy your meal! "
+                          "How did it turn out? Rate it 1-5, with a comment if you like.", done=True)
+        index += 1
+    elif command == "back":
+        if index == 0:
+            return _reply(steps, index, armed, "This is the first step. " + _show(steps, index))
+        index -= 1
+    elif command == "jump":
+        if target is None or not 0 <= target < len(steps):
+            return _reply(steps, index, armed, f"There are {len(steps)} steps. " + _show(steps, index))
+        index = target
+    elif command == "slow":
+        # the same step again, one phrase per line
+        parts = [p for p in _SENTENCE_RE.split(steps[index].get("text") or "") if p]
+        return _reply(steps, index, armed, f"Step {index + 1}, slowly:\n" + "\n".join(f"- {p}" for p in parts))
+    elif command != "repeat":
+        return _reply(steps, index, armed, f"{HELP} " + _show(steps, index))
+    armed = _arm(user_id, steps, index, armed, now or int(time.time()))
+    return _reply(steps, index, armed, _show(steps, index))
+
+
+def finish_steps(user_id: str) -> None:
+    """Another recipe replaces this one: cancel every timer still pending for this user."""
+    cancel_timers(user_id)
@@ -1,44 +1,142 @@
+import os
 import streamlit as st
-import uuid
 import time
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from memory import init_db, fetch_due_timers
+import catalog
+from memory import init_db
+from timer_service import TimerService
+from maintenance import MaintenanceJob
+from session import SessionBusy, SessionStore, SQLiteSessionBackend
 from workflow import build_graph
+from admission import AdmissionController
+from metrics import capture, serve_prometheus
+import tokens
 
-# init DB
+# migrate the DB; after the first run in this process this returns immediately
 init_db()
+# load the offline recipe catalog in the background; lookups miss until it is ready
+catalog.start()
 
 st.set_page_config(page_title="Chef Raghav — LangGraph Chef", layout="centered")
 
+
+@st.cache_resource
+def metrics_server(port: int):
+    # one /metrics endpoint per process, not per script rerun
+    return serve_prometheus(port)
+
+
+if os.getenv("METRICS_PORT"):
+    metrics_server(int(os.getenv("METRICS_PORT")))
+
+
+@st.cache_resource
+def maintenance_job():
+    # retention, archival and incremental vacuum, every MAINTENANCE_INTERVAL_SEC
+    return MaintenanceJob()
+
+
+@st.cache_resource
+def shared_graph():
+    # the graph holds no per-user state, so one per process serves every session;
+    # recipe turns go through admission control (per-user and LLM quotas, shedding)
+    return AdmissionController(build_graph())
+
+
+@st.cache_resource
+def session_store():
+    # conversation state lives in SQLite so it survives restarts and can move
+    # between workers; hot sessions are served from the store's cache
+    return SessionStore(SQLiteSessionBackend())
+
+
+def push_timer_messages(store, user_id, labels):
+    def add(sess):
+        for label in labels:
+            sess.history.append("chef", f"⏰ Timer finished: {label}. Continue with next step!")
+
+    store.run_turn(user_id, add)
+
+
+@st.cache_resource
+def timer_service():
+    # one background timer thread per process, shared by every session; fired
+    # timers go into the stored session, which every worker renders from
+    store = session_store()
+    return TimerService(deliver=lambda user_id, labels: push_timer_messages(store, user_id, labels))
+
+
+# longest a blocked run goes without handing control back to Streamlit, which
+# only notices a click (and interrupts the run) when the script calls into it
+TIMER_WAIT_SEC = float(os.getenv("TIMER_WAIT_SEC") or 1.0)
+
 if "uid" not in st.session_state:
-    st.session_state.uid = str(uuid.uuid4())
+    # keep the id in the URL so a reload or another worker resumes the same conversation
+    params = st.experimental_get_query_params()
+    st.session_state.uid = params.get("uid", [None])[0] or str(uuid.uuid4())
+    st.experimental_set_query_params(uid=st.session_state.uid)
 
-if "state" not in st.session_state:
-    st.session_state.state = {"user_id": st.session_state.uid}
+uid = st.session_state.uid
+maintenance_job()
+graph = shared_graph()
+sessions = session_store()
 
-if "history" not in st.session_state:
-    st.session_state.history = []
+timers = timer_service()
+timers.watch(uid)
+
+
+def render_partial_recipe(partial):
+    parts = []
+    if partial.get("title"):
+        parts.append(f"### {partial['title']}")
+    if partial.get("cultural_note"):
+        parts.append(f"*{partial['cultural_note']}*")
+    if partial.get("ingredients"):
+        parts.append("**Ingredients:**")
+        parts.extend(f"- {i}" for i in partial["ingredients"])
+    if partial.get("steps"):
+        parts.append("**Method:**")
+        parts.extend(f"{idx}. {s.get('text') if isinstance(s, dict) else s}"
+                     for idx, s in enumerate(partial["steps"], start=1))
+    if partial.get("tips"):
+        parts.append("**Tips:**")
+        parts.extend(f"- {t}" for t in partial["tips"])
+    return "\n\n".join(parts) or "_Chef Raghav is thinking..._"
 
-if "graph" not in st.session_state:
-    st.session_state.graph = build_graph()
 
 st.title("🍲 Chef Raghav — LangGraph Multi-Agent Chef")
 
 # sidebar for profile
 with st.sidebar:
     st.header("Profile")
-    name = st.text_input("Name", value=st.session_state.state.get("user_name",""))
+    name = st.text_input("Name", value=sessions.get(uid).state.get("user_name",""))
     if st.button("Save name"):
-        st.session_state.state["user_name"] = name
+        def set_name(sess):
+            sess.state["user_name"] = name
+
+        sessions.run_turn(uid, set_name)
         from memory import save_user_profile
-        save_user_profile(st.session_state.uid, {"name": name})
+        save_user_profile(uid, {"name": name})
         st.success("Saved")
+    if st.session_state.get("last_trace"):
+        with st.expander("Last turn timing"):
+            st.code(st.session_state.last_trace)
+    # process-wide: prompt/completion tokens, latency and cost of LLM calls by node
+    llm_usage = tokens.report()
+    if llm_usage:
+        with st.expander("LLM tokens per node"):
+            st.code(tokens.format_report(llm_usage))
 
 # Chat history display
-for who, text in st.session_state.history:
+history = sessions.get(uid).history
+if history.spilled and st.button("Show earlier messages"):
+    for who, text in history.older():
+        st.markdown(f"**{'You' if who == 'you' else 'Chef Raghav'}:** {text}")
+for who, text in history:
     if who == "you":
         st.markdown(f"**You:** {text}")
     else:
@@ -49,25 +147,45 @@ user_input = col1.text_input("You:", key="input_text")
 if col2.button("Send"):
     user_msg = user_input.strip()
     if user_msg:
-        # run graph once
-        out_text, new_ctx = st.session_state.graph.run_once(st.session_state.state, user_msg)
-        # ensure user_id remains
-        new_ctx["user_id"] = st.session_state.uid
-        st.session_state.state = new_ctx
-        st.session_state.history.append(("you", user_msg))
-        st.session_state.history.append(("chef", out_text))
-        # clear
-        st.session_state.input_text = ""
-        st.experimental_rerun()
+        # run graph once, rendering streamed recipe fields as they arrive
+        preview = st.empty()
+        partial = {}
+
+        def on_event(kind, key, value):
+            if kind == "item":
+                partial.setdefault(key, []).append(value)
+            else:
+                partial[key] = value
+            preview.markdown(render_partial_recipe(partial))
+
+        def turn(sess):
+            out_text, new_ctx = graph.run_once(sess.state, user_msg, on_event=on_event)
+            # ensure user_id remains
+            new_ctx["user_id"] = uid
+            sess.state = new_ctx
+            sess.history.append("you", user_msg)
+            sess.history.append("chef", out_text)
 
-# Poll timers every few seconds (frontend poll)
-if "last_timer_poll" not in st.session_state:
-    st.session_state["last_timer_poll"] = 0
+        try:
+            with capture() as trace:
+                sessions.run_turn(uid, turn)
+        except SessionBusy:
+            # another tab or worker is still answering for this conversation
+            st.warning("I'm still working on your last message. Send this one again in a moment.")
+        else:
+            st.session_state.last_trace = trace.flame()
+            # clear
+            st.session_state.input_text = ""
+            st.experimental_rerun()
 
-if time.time() - st.session_state["last_timer_poll"] > 3:
-    due = fetch_due_timers(int(time.time()))
-    if due:
-        for tid, label in due:
-            st.session_state.history.append(("chef", f"⏰ Timer finished: {label}. Continue with next step!"))
+# While this session has timers pending, block until the service delivers the
+# next one and re-render only then; the database is only touched by the service
+# when a timer is actually due.
+countdown = st.empty()
+while timers.has_pending(uid):
+    wake = timers.next_wake(uid)
+    if wake is not None:
+        countdown.caption(f"⏱ Next timer in {max(0, int(wake - time.time()))}s")
+    if timers.wait(uid, TIMER_WAIT_SEC):
         st.experimental_rerun()
-    st.session_state["last_timer_poll"] = time.time()
+countdown.empty()
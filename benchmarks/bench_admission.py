@@ -0,0 +1,258 @@
+"""
+bench_admission.py
+
+Admission control (admission.py) under a synthetic burst of recipe requests.
+
+Part 1 drives AdmissionController's decision core with a fake clock in a
+discrete-event simulation, so minutes of traffic take a fraction of a second
+and every run is the same: steady users ask for a recipe now and then, a few
+users hammer the service, and a spike of new users arrives at once. Each
+admitted request holds an LLM slot for --llm-latency seconds. Without
+admission every request is an LLM call; with it the report shows how many
+calls were made, how many requests were rejected or shed (served from the
+cache or catalog instead), the queue waits, and the share each kind of user
+got through.
+
+Part 2 (--threads) sends a real burst through AdmissionController.run_once
+and the workflow graph, with the stub LLM from bench_load.py and a catalog
+that only matches loosely, which the shed node serves.
+
+    python benchmarks/bench_admission.py --duration 300 --spike 400
+    python benchmarks/bench_admission.py --threads 64 --llm-latency 0.5
+"""
+
+import argparse
+import heapq
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import admission  # noqa: E402
+from admission import ADMITTED, QUEUED, REJECTED, SHED, AdmissionController  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def workload(args, rng: random.Random):
+    """(time, user, kind) recipe requests, in time order."""
+    reqs = []
+    for u in range(args.users):
+        t = rng.uniform(0, args.user_gap)
+        while t < args.duration:
+            reqs.append((t, f"steady-{u}", "steady"))
+            t += rng.expovariate(1 / args.user_gap)
+    for u in range(args.hammers):
+        t = rng.uniform(0, 1)
+        while t < args.duration:
+            reqs.append((t, f"hammer-{u}", "hammer"))
+            t += rng.expovariate(1 / args.hammer_gap)
+    for u in range(args.spike):
+        reqs.append((args.spike_at + rng.uniform(0, args.spike_len), f"spike-{u}", "spike"))
+    reqs.sort()
+    return reqs
+
+
+def pct(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def peak_concurrency(intervals):
+    edges = sorted([(s, 1) for s, _ in intervals] + [(e, -1) for _, e in intervals])
+    peak = cur = 0
+    for _, d in edges:
+        cur += d
+        peak = max(peak, cur)
+    return peak
+
+
+def peak_rate(starts):
+    per_sec = Counter(int(s) for s in starts)
+    return max(per_sec.values()) if per_sec else 0
+
+
+def simulate_without(reqs, args, rng):
+    latency = [max(0.0, args.llm_latency + rng.uniform(-args.llm_jitter, args.llm_jitter)) for _ in reqs]
+    intervals = [(t, t + d) for (t, _, _), d in zip(reqs, latency)]
+    return {"calls": len(reqs), "peak_inflight": peak_concurrency(intervals),
+            "peak_per_sec": peak_rate([t for t, _, _ in reqs])}
+
+
+def simulate_with(reqs, args, rng):
+    clock = FakeClock()
+    ctl = AdmissionController(None, user_per_min=args.user_per_min, user_burst=args.user_burst,
+                              global_per_sec=args.global_per_sec, global_burst=args.global_burst,
+                              max_inflight=args.max_inflight, max_queue=args.max_queue, max_wait=args.max_wait,
+                              clock=clock)
+    events = []
+    seq = 0
+
+    def at(t, kind, item):
+        nonlocal seq
+        seq += 1
+        heapq.heappush(events, (t, seq, kind, item))
+
+    for t, user, kind in reqs:
+        at(t, "arrive", (user, kind))
+    t = 0.0
+    while t < args.duration + args.max_wait + args.llm_latency * 4:
+        # global tokens come back with time; a server dispatches them as its waiters wake
+        at(t, "tick", None)
+        t += args.tick
+
+    kind_of = {}
+    outcomes = defaultdict(Counter)
+    waits = defaultdict(list)
+    starts, intervals = [], []
+
+    def start(ticket):
+        latency = max(0.0, args.llm_latency + rng.uniform(-args.llm_jitter, args.llm_jitter))
+        waits[kind_of[ticket]].append(clock.now - ticket.submitted)
+        outcomes[kind_of[ticket]][ADMITTED] += 1
+        starts.append(clock.now)
+        intervals.append((clock.now, clock.now + latency))
+        at(clock.now + latency, "done", ticket)
+
+    while events:
+        clock.now, _, kind, item = heapq.heappop(events)
+        if kind == "arrive":
+            user, cls = item
+            outcome, ticket = ctl.submit(user)
+            if ticket is None:
+                outcomes[cls][outcome] += 1
+                continue
+            kind_of[ticket] = cls
+            if outcome == ADMITTED:
+                start(ticket)
+            else:
+                outcomes[cls][QUEUED] += 1
+                at(ticket.submitted + args.max_wait, "deadline", ticket)
+        elif kind == "done":
+            for ticket in ctl.release(item):
+                start(ticket)
+        elif kind == "deadline":
+            if ctl.cancel(item):
+                outcomes[kind_of[item]][SHED] += 1
+        else:
+            for ticket in ctl.dispatch():
+                start(ticket)
+    return ctl, outcomes, waits, starts, intervals
+
+
+def part1(args):
+    rng = random.Random(args.seed)
+    reqs = workload(args, rng)
+    by_kind = Counter(k for _, _, k in reqs)
+    print(f"{len(reqs):,} recipe requests over {args.duration:g}s: "
+          + ", ".join(f"{n:,} {k}" for k, n in by_kind.items()))
+    base = simulate_without(reqs, args, random.Random(args.seed))
+    print(f"  no admission   {base['calls']:6,} LLM calls, peak {base['peak_per_sec']} calls/s "
+          f"(quota {args.global_per_sec:g}/s), peak {base['peak_inflight']} in flight")
+
+    start = time.perf_counter()
+    ctl, outcomes, waits, starts, intervals = simulate_with(reqs, args, random.Random(args.seed))
+    took = time.perf_counter() - start
+    total = Counter()
+    for c in outcomes.values():
+        total.update(c)
+    all_waits = [w for ws in waits.values() for w in ws]
+    print(f"  admission      {total[ADMITTED]:6,} LLM calls, peak {peak_rate(starts)} calls/s, "
+          f"peak {peak_concurrency(intervals)} in flight; {total[REJECTED]:,} rejected, {total[SHED]:,} shed, "
+          f"{total[QUEUED]:,} queued (wait p50 {pct(all_waits, 0.5):.2f}s p99 {pct(all_waits, 0.99):.2f}s) "
+          f"[simulated in {took * 1000:.0f} ms]")
+    for kind in by_kind:
+        c, n = outcomes[kind], by_kind[kind]
+        print(f"    {kind:<7} {n:6,} requests: {c[ADMITTED] / n:6.1%} to the LLM, {c[SHED] / n:6.1%} shed, "
+              f"{c[REJECTED] / n:6.1%} rejected; wait p99 {pct(waits[kind], 0.99):.2f}s")
+    stats = ctl.stats()
+    assert stats["inflight"] == 0 and stats["waiting"] == 0, stats
+
+
+def part2(args):
+    import catalog
+    import memory
+    import workflow
+    from benchmarks import bench_load
+    from benchmarks.fake_openai import RECIPE
+
+    db = Path(tempfile.mkdtemp()) / "admission.db"
+    graph = bench_load._setup({"db": str(db), "cache": True, "llm_latency": args.llm_latency,
+                               "llm_jitter": args.llm_jitter, "seed": args.seed, "threads": args.threads})
+    # a catalog recipe stored without preferences matches any request loosely:
+    # below the catalog's min_score, above workflow.SHED_MIN_SCORE
+    memory.push_recipe("seed", RECIPE["title"], RECIPE, None)
+    memory.get_storage().flush()
+    catalog.wait_ready()
+    ctl = AdmissionController(graph, user_per_min=args.user_per_min, user_burst=args.user_burst,
+                              global_per_sec=args.global_per_sec, global_burst=args.global_burst,
+                              max_inflight=args.max_inflight, max_queue=args.max_queue, max_wait=args.max_wait)
+    replies = Counter()
+    lock = threading.Lock()
+
+    def user(i):
+        # distinct preferences, so the recipe cache has nothing to serve
+        ctx = {"user_id": f"burst-{i % (args.threads * 2 // 3 or 1)}",
+               "preferences": {"number_of_people": 1 + i % 20, "spice_level": i // 20 % 11,
+                               "region_preference": ["north", "south", "east", "west"][i // 220 % 4],
+                               "preference_type": "none", "allergies": []}}
+        text, _ = ctl.run_once(ctx, "recipe please")
+        kind = ("rejected" if text.startswith("You're asking faster") else
+                "shed" if text.startswith("It's a busy kitchen") else
+                "busy" if text == workflow.BUSY_TEXT else "llm")
+        with lock:
+            replies[kind] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(user, range(args.threads * 3)))
+    took = time.perf_counter() - start
+    memory.get_storage().flush()
+    print(f"threaded burst: {args.threads * 3} recipe turns on {args.threads} threads in {took:.1f}s; "
+          f"replies {dict(replies)}; controller {ctl.stats()}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--duration", type=float, default=300)
+    ap.add_argument("--users", type=int, default=300, help="steady users")
+    ap.add_argument("--user-gap", type=float, default=120, help="mean seconds between a steady user's requests")
+    ap.add_argument("--hammers", type=int, default=5)
+    ap.add_argument("--hammer-gap", type=float, default=1.0)
+    ap.add_argument("--spike", type=int, default=400, help="users arriving at once")
+    ap.add_argument("--spike-at", type=float, default=60)
+    ap.add_argument("--spike-len", type=float, default=5)
+    ap.add_argument("--llm-latency", type=float, default=3.0)
+    ap.add_argument("--llm-jitter", type=float, default=1.0)
+    ap.add_argument("--tick", type=float, default=0.05)
+    ap.add_argument("--user-per-min", type=float, default=admission.USER_PER_MIN)
+    ap.add_argument("--user-burst", type=float, default=admission.USER_BURST)
+    ap.add_argument("--global-per-sec", type=float, default=admission.GLOBAL_PER_SEC)
+    ap.add_argument("--global-burst", type=float, default=admission.GLOBAL_BURST)
+    ap.add_argument("--max-inflight", type=int, default=admission.MAX_INFLIGHT)
+    ap.add_argument("--max-queue", type=int, default=admission.MAX_QUEUE)
+    ap.add_argument("--max-wait", type=float, default=admission.MAX_WAIT_SEC)
+    ap.add_argument("--threads", type=int, default=0, help="also run a threaded burst through the graph")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    part1(args)
+    if args.threads:
+        part2(args)
+
+
+if __name__ == "__main__":
+    main()
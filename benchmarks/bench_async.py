@@ -0,0 +1,119 @@
+"""
+bench_async.py
+
+Drive many simulated conversations concurrently through workflow.build_async_graph()
+with a stubbed async LLM, and compare with the sync graph on a thread pool.
+
+    python benchmarks/bench_async.py --sessions 500 --llm-latency 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import memory  # noqa: E402
+from benchmarks.fake_openai import RECIPE  # noqa: E402
+
+# greeting, the five preference answers, then a recipe request
+SCRIPT = ["hello", "start", "2", "5", "north", "none", "nuts", "recipe please"]
+
+
+def _response():
+    msg = SimpleNamespace(content=json.dumps(RECIPE))
+    return SimpleNamespace(choices=[SimpleNamespace(message=msg)])
+
+
+class StubAsyncCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _response()
+
+
+class StubCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        if kwargs.get("stream"):
+            content = json.dumps(RECIPE)
+            return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])]
+        return _response()
+
+
+async def _async_session(graph, uid: str, latencies):
+    ctx = {"user_id": uid}
+    for msg in SCRIPT:
+        start = time.perf_counter()
+        _, ctx = await graph.arun_once(ctx, msg)
+        latencies.append(time.perf_counter() - start)
+
+
+def _sync_session(graph, uid: str, latencies):
+    ctx = {"user_id": uid}
+    for msg in SCRIPT:
+        start = time.perf_counter()
+        _, ctx = graph.run_once(ctx, msg)
+        latencies.append(time.perf_counter() - start)
+
+
+def _report(name: str, sessions: int, elapsed: float, latencies):
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name}: {sessions} sessions in {elapsed:.2f}s, {len(latencies) / elapsed:,.0f} turns/s, "
+          f"p50 {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=500)
+    ap.add_argument("--llm-latency", type=float, default=0.5)
+    ap.add_argument("--threads", type=int, default=32)
+    args = ap.parse_args()
+
+    memory.DB = Path(tempfile.mkdtemp()) / "bench.db"
+    memory.init_db()
+
+    from agents import recipe
+    import catalog
+    import workflow
+    # measure the LLM path, not catalog hits on recipes earlier sessions stored
+    catalog.CATALOG_ENABLED = False
+    from llm import LLMGateway
+    recipe.gateway = LLMGateway(
+        client=SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(args.llm_latency))),
+        async_client=SimpleNamespace(chat=SimpleNamespace(completions=StubAsyncCompletions(args.llm_latency))),
+        max_concurrency=args.sessions)
+
+    graph = workflow.build_async_graph()
+    latencies = []
+
+    async def run_all():
+        await asyncio.gather(*[_async_session(graph, f"a{i}", latencies) for i in range(args.sessions)])
+
+    start = time.perf_counter()
+    asyncio.run(run_all())
+    _report("async graph", args.sessions, time.perf_counter() - start, latencies)
+
+    sync_graph = workflow.build_graph()
+    latencies = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda i: _sync_session(sync_graph, f"s{i}", latencies), range(args.sessions)))
+    _report(f"sync graph ({args.threads} threads)", args.sessions, time.perf_counter() - start, latencies)
+
+
+if __name__ == "__main__":
+    main()
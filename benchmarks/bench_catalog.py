@@ -0,0 +1,119 @@
+"""
+bench_catalog.py
+
+Builds a catalog of synthetic recipes through the ingestion pipeline (recipes
+table -> catalog.RecipeCatalog) and times Preferences lookups with allergies
+and dislikes, against a linear scan over the same recipes.
+
+    python benchmarks/bench_catalog.py --recipes 100000 --queries 2000
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import catalog  # noqa: E402
+import memory  # noqa: E402
+
+INGREDIENTS = [
+    "Paneer", "Tomatoes", "Onion", "Garlic", "Ginger", "Basmati rice", "Toor dal", "Chickpeas", "Spinach",
+    "Potatoes", "Cauliflower", "Chicken", "Mutton", "Fish", "Prawns", "Coconut milk", "Tamarind",
+    "Curry leaves", "Mustard seeds", "Cumin", "Butter", "Cream", "Ghee", "Curd", "Cashews", "Peanuts",
+    "Almonds", "Wheat flour", "Semolina", "Eggs", "Tofu", "Brinjal", "Okra", "Green peas", "Carrots",
+    "French beans", "Lemon", "Coriander", "Mint", "Green chillies", "Turmeric", "Garam masala",
+    "Olive oil", "Basil", "Parmesan", "Pasta", "Mushrooms", "Bell peppers", "Jaggery", "Fenugreek",
+]
+REGIONS = ["north", "south", "east", "west"]
+ALLERGIES = [[], [], ["dairy"], ["nuts"], ["gluten"], ["shellfish"], ["dairy", "nuts"], ["egg"]]
+DISLIKES = [[], [], ["okra"], ["mushrooms"], ["brinjal", "fish"], ["coconut"]]
+
+
+def fill_table(n: int, seed: int) -> None:
+    rng = random.Random(seed)
+    for i in range(n):
+        recipe = {
+            "title": f"Recipe {i}",
+            "ingredients": [f"{x} {rng.randint(1, 500)}g" for x in rng.sample(INGREDIENTS, rng.randint(5, 10))],
+            "steps": [{"text": "Prep everything."},
+                      {"text": "Cook until done.", "timer_sec": rng.choice([60, 300, 600]), "timer_label": "cook"}],
+            "tips": [],
+        }
+        prefs = {"number_of_people": rng.randint(1, 6), "spice_level": rng.randint(0, 10),
+                 "region_preference": rng.choice(REGIONS), "preference_type": "none"}
+        memory.push_recipe(f"u{i % 500}", recipe["title"], recipe, prefs)
+    memory.get_storage().flush()
+
+
+def queries(n: int, seed: int):
+    rng = random.Random(seed)
+    return [{"number_of_people": 2, "spice_level": rng.randint(0, 10), "region_preference": rng.choice(REGIONS),
+             "preference_type": "none", "allergies": rng.choice(ALLERGIES), "dislikes": rng.choice(DISLIKES)}
+            for _ in range(n)]
+
+
+def linear_scan(docs, prefs):
+    """Baseline: check every recipe's tokens against the expanded exclusions."""
+    banned = set()
+    for term in prefs["allergies"] + prefs["dislikes"]:
+        for tok in catalog.normalize_tokens(term):
+            banned |= catalog.ALLERGEN_GROUPS.get(tok, set()) | {tok}
+    best = None
+    for recipe, meta, tokens in docs:
+        if meta["region_preference"] != prefs["region_preference"] or tokens & banned:
+            continue
+        d = abs(meta["spice_level"] - prefs["spice_level"])
+        if d <= 2 and (best is None or d < best[0]):
+            best = (d, recipe)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--recipes", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    memory.DB = Path(tempfile.mkdtemp()) / "bench.db"
+    memory.init_db()
+    start = time.perf_counter()
+    fill_table(args.recipes, args.seed)
+    print(f"stored {args.recipes:,} recipes in {time.perf_counter() - start:.1f}s")
+
+    cat = catalog.RecipeCatalog()
+    start = time.perf_counter()
+    cat.refresh()
+    print(f"ingested {len(cat):,} recipes into the catalog in {time.perf_counter() - start:.2f}s")
+
+    qs = queries(args.queries, args.seed + 1)
+    timings, hits = [], 0
+    for q in qs:
+        t = time.perf_counter()
+        found = cat.match(q, k=5)
+        timings.append(time.perf_counter() - t)
+        hits += bool(found)
+    timings.sort()
+    print(f"catalog match: p50 {statistics.median(timings) * 1e6:,.0f} us, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1e6:,.0f} us, hit rate {hits / len(qs):.0%}")
+
+    docs = []
+    for _rid, payload, prefs in memory.iter_recipes():
+        import json
+        recipe = json.loads(payload)
+        docs.append((recipe, json.loads(prefs), catalog.recipe_tokens(recipe)))
+    timings = []
+    for q in qs[:200]:
+        t = time.perf_counter()
+        linear_scan(docs, q)
+        timings.append(time.perf_counter() - t)
+    print(f"linear scan:   p50 {statistics.median(timings) * 1e3:,.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+bench_feedback.py
+
+Feedback analytics at scale: millions of feedback rows linked to recipes.
+
+- insert throughput through the write-behind queue with the feedback_stats
+  triggers, against the same inserts into a table without them,
+- top/bottom-rated queries served off the aggregate index, against the
+  full-table GROUP BY a report would otherwise run,
+- a check that the trigger-maintained aggregates match that GROUP BY,
+- ratings.Ratings: the first full load and an incremental refresh.
+
+    python benchmarks/bench_feedback.py --rows 2000000 --recipes 50000
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import memory  # noqa: E402
+import ratings  # noqa: E402
+
+REGIONS = ["north", "south", "east", "west"]
+SQL_PLAIN = "INSERT INTO feedback_plain(user_id,score,comment,recipe_key,title,region,spice_level) VALUES (?,?,?,?,?,?,?)"
+SQL_SCAN_TOP = """
+    SELECT recipe_key, AVG(score), COUNT(*),
+           (SUM(score) + ?) / (COUNT(*) + ?) AS ranked
+    FROM feedback WHERE recipe_key IS NOT NULL
+    GROUP BY recipe_key ORDER BY ranked DESC LIMIT ?"""
+
+
+def feedback_rows(n: int, recipes: int, rng: random.Random):
+    # each recipe has its own quality; popular recipes get most of the feedback
+    quality = [rng.uniform(1.5, 4.8) for _ in range(recipes)]
+    for i in range(n):
+        r = min(recipes - 1, int(rng.paretovariate(1.2)) - 1) if rng.random() < 0.5 else rng.randrange(recipes)
+        score = max(1, min(5, round(rng.gauss(quality[r], 0.8))))
+        yield (f"u{i % 10000}", score, "", f"recipe-{r}", f"Dish {r}", REGIONS[r % 4], r % 11)
+
+
+def timed(fn, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - start) / repeat, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    ap.add_argument("--recipes", type=int, default=50_000)
+    ap.add_argument("--plain-rows", type=int, default=200_000, help="rows for the no-trigger comparison")
+    ap.add_argument("--seed", type=int, default=11)
+    args = ap.parse_args()
+
+    memory.DB = Path(tempfile.mkdtemp()) / "feedback.db"
+    memory.init_db()
+    store = memory.get_storage()
+    store.execute("CREATE TABLE feedback_plain AS SELECT * FROM feedback WHERE 0")
+
+    rng = random.Random(args.seed)
+    rows = list(feedback_rows(args.plain_rows, args.recipes, rng))
+    took, _ = timed(lambda: ([store.enqueue(SQL_PLAIN, r) for r in rows], store.flush()))
+    plain_rate = len(rows) / took
+    took, _ = timed(lambda: ([store.enqueue(memory.SQL_STORE_FEEDBACK, r) for r in rows], store.flush()))
+    print(f"insert {len(rows):,} rows: {plain_rate:,.0f} rows/s without triggers, "
+          f"{len(rows) / took:,.0f} rows/s with aggregates maintained")
+
+    start = time.perf_counter()
+    for i, r in enumerate(feedback_rows(args.rows - len(rows), args.recipes, rng)):
+        store.enqueue(memory.SQL_STORE_FEEDBACK, r)
+    store.flush()
+    took = time.perf_counter() - start
+    print(f"loaded {args.rows:,} feedback rows in {took:.1f}s ({(args.rows - len(rows)) / took:,.0f} rows/s)")
+
+    prior = (memory.FEEDBACK_PRIOR_MEAN * memory.FEEDBACK_PRIOR_WEIGHT, memory.FEEDBACK_PRIOR_WEIGHT)
+    fast, top = timed(lambda: memory.top_rated("recipe", 10), repeat=200)
+    worst_t, _ = timed(lambda: memory.top_rated("recipe", 10, worst=True), repeat=200)
+    scan, scanned = timed(lambda: store.query(SQL_SCAN_TOP, (prior[0], prior[1], 10)))
+    print(f"top 10 recipes: {fast * 1e6:,.0f} us (bottom 10: {worst_t * 1e6:,.0f} us) from feedback_stats, "
+          f"{scan * 1000:,.0f} ms as a GROUP BY over feedback ({scan / fast:,.0f}x)")
+
+    mismatched = sum(1 for a, b in zip(top, scanned) if a["key"] != b[0] or abs(a["score"] - b[3]) > 1e-9)
+    sample = rng.sample(range(args.recipes), 200)
+    for r in sample:
+        agg = memory.rating("recipe", f"recipe-{r}")
+        n, total = store.query("SELECT COUNT(*), SUM(score) FROM feedback WHERE recipe_key=?", (f"recipe-{r}",))[0]
+        if (agg is None) != (n == 0) or (agg and (agg["n"] != n or sum(
+                (i + 1) * c for i, c in enumerate(agg["histogram"])) != total)):
+            mismatched += 1
+    print(f"aggregates checked against a scan: top 10 plus {len(sample)} random recipes, {mismatched} mismatches")
+    print("best:", ", ".join(f"{t['title']} {t['score']:.2f} (n={t['n']})" for t in top[:3]))
+
+    rated = ratings.Ratings()
+    took, changed = timed(rated.refresh)
+    print(f"ratings first load: {changed:,} aggregates in {took * 1000:,.0f} ms")
+    for r in feedback_rows(1000, args.recipes, rng):
+        store.enqueue(memory.SQL_STORE_FEEDBACK, r)
+    took, changed = timed(rated.refresh)
+    print(f"ratings refresh after 1,000 new rows: {changed:,} aggregates in {took * 1000:,.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
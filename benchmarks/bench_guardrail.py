@@ -0,0 +1,69 @@
+"""
+bench_guardrail.py
+
+Per-message guardrail cost over large term lists: the old lowercase-and-scan
+loop versus the compiled prefix-factored matcher in utils.
+
+    python benchmarks/bench_guardrail.py --terms 5000 --messages 2000
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import utils  # noqa: E402
+
+
+def _legacy_guardrail(text, forbidden, non_cooking):
+    low = text.lower()
+    for f in forbidden:
+        if f in low:
+            return False, f"Forbidden term detected: {f}"
+    for n in non_cooking:
+        if n in low:
+            return False, f"I can help with cooking only; your query mentions {n}."
+    return True, ""
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--terms", type=int, default=5000)
+    ap.add_argument("--messages", type=int, default=2000)
+    args = ap.parse_args()
+
+    rnd = random.Random(1)
+    words = ["".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(5, 10))) for _ in range(args.terms)]
+    forbidden, non_cooking = words[: args.terms // 2], words[args.terms // 2:]
+    vocab = ["how", "do", "i", "make", "rice", "fluffy", "paneer", "masala", "chilli", "coleslaw", "with"]
+    messages = [" ".join(rnd.choices(vocab, k=12)) + f" {i}" for i in range(args.messages)]
+
+    start = time.perf_counter()
+    for m in messages:
+        _legacy_guardrail(m, forbidden, non_cooking)
+    legacy = (time.perf_counter() - start) / len(messages) * 1e6
+
+    start = time.perf_counter()
+    utils.configure_guardrail({"forbidden": forbidden, "non_cooking": non_cooking})
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    utils.guardrail_many(messages)
+    compiled = (time.perf_counter() - start) / len(messages) * 1e6
+
+    start = time.perf_counter()
+    utils.guardrail_many(messages)
+    cached = (time.perf_counter() - start) / len(messages) * 1e6
+
+    print(f"{args.terms} terms, compiled once in {compile_ms:.1f} ms")
+    print(f"substring loop:   {legacy:9.2f} us/message")
+    print(f"compiled matcher: {compiled:9.2f} us/message")
+    print(f"cached repeat:    {cached:9.2f} us/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+bench_llm_gateway.py
+
+Success rate and latency of chat calls against the local fake OpenAI server
+with injected 500s and slow tails: a bare gateway (no retries, no hedging)
+versus retries plus a hedged second request.
+
+    python benchmarks/bench_llm_gateway.py --calls 200 --fail-rate 0.1 --slow-rate 0.05
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from llm import LLMGateway  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "A quick dal for two, mild."}]
+
+
+def run(gateway: LLMGateway, calls: int, threads: int):
+    latencies, failures = [], 0
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            gateway.chat(MESSAGES, node="bench", user_id=f"u{i % 10}", model="fake", max_tokens=50)
+            return time.perf_counter() - start
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for took in pool.map(one, range(calls)):
+            if took is None:
+                failures += 1
+            else:
+                latencies.append(took)
+    return latencies, failures
+
+
+def report(name: str, latencies, failures: int, calls: int) -> None:
+    if latencies:
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{name:<20} ok {calls - failures:>4}/{calls}  p50 {statistics.median(latencies) * 1000:7.1f} ms"
+              f"  p99 {p99 * 1000:7.1f} ms")
+    else:
+        print(f"{name:<20} ok    0/{calls}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--calls", type=int, default=200)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--fail-rate", type=float, default=0.1)
+    ap.add_argument("--slow-rate", type=float, default=0.05)
+    ap.add_argument("--slow-delay", type=float, default=2.0)
+    ap.add_argument("--hedge-after", type=float, default=0.3)
+    args = ap.parse_args()
+
+    server = FakeOpenAIServer(token_delay=0.001, fail_rate=args.fail_rate, slow_rate=args.slow_rate,
+                              slow_delay=args.slow_delay).start()
+    bare = LLMGateway(api_key="bench", base_url=server.base_url, max_retries=0, max_concurrency=args.threads)
+    latencies, failures = run(bare, args.calls, args.threads)
+    report("no retries/hedging", latencies, failures, args.calls)
+
+    sent = server.requests
+    tuned = LLMGateway(api_key="bench", base_url=server.base_url, max_retries=3, backoff_base=0.05,
+                       hedge_after=args.hedge_after, max_concurrency=args.threads)
+    latencies, failures = run(tuned, args.calls, args.threads)
+    report("retries + hedging", latencies, failures, args.calls)
+    print(f"requests sent for {args.calls} calls: {server.requests - sent}")
+    print(f"tokens for u0: {tuned.usage_for('u0')}")
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+bench_load.py
+
+Headless load test of the full workflow graph. Each simulated user replays a
+scripted conversation through Graph.run_once(): greeting, the five preference
+answers, a recipe, step-by-step, a chat question and feedback. The LLM is a
+stub with configurable latency, so what is measured is the graph, SQLite and
+the gateway, not the network.
+
+Concurrency rises through --levels, in threads (one process, N threads) and
+in processes (up to --procs processes sharing one SQLite file, threads split
+across them). For every level it reports turns/s, turn latency percentiles
+(overall and per scripted turn), SQLite contention (pool waits, write batch
+and flush times from metrics.py, "database is locked" errors) and RSS growth.
+Any other error in a turn stops the run with its traceback.
+
+    python benchmarks/bench_load.py --levels 1,8,32 --sessions 200 --llm-latency 0.2 --json load.json
+    python benchmarks/bench_load.py --levels 1,8,32 --compare load.json --tolerance 0.15
+
+--compare prints the change against an earlier --json run and exits non-zero
+when throughput drops (or p95 rises) by more than --tolerance at any level.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.fake_openai import RECIPE  # noqa: E402
+
+REGIONS = ["north", "south", "east", "west"]
+# chef_db_seconds spans plus the pool wait histogram memory.Storage records
+DB_HISTOGRAMS = [("chef_db_seconds", {"span": s}) for s in ("db.execute", "db.query", "db.flush", "db.write_batch")] \
+    + [("chef_db_pool_wait_seconds", {})]
+
+
+def script(i: int):
+    """(kind, message, ctx updates) turns of one conversation; preferences vary per user."""
+    return [
+        ("greeting", "hello", None),
+        ("preference", "start", None),
+        ("preference", str(1 + i % 6), None),
+        ("preference", str(i % 11), None),
+        ("preference", REGIONS[i % 4], None),
+        ("preference", "none", None),
+        ("preference", "nuts" if i % 3 else "", None),
+        ("recipe", "recipe please", None),
+        ("step_by_step", "yes", None),
+        ("step_by_step", "next", None),
+        ("step_by_step", "repeat", None),
+        ("step_by_step", "back", None),
+        ("step_by_step", "step 3", None),
+        # past the last step: timers cancelled, feedback expected
+        ("step_by_step", "next", None),
+        ("regular_chat", "how do i keep rice fluffy", None),
+        ("feedback", "5 lovely dish", None),
+    ]
+
+
+class StubCompletions:
+    """chat.completions stand-in: sleeps latency (+/- jitter) and answers with the canned recipe."""
+
+    def __init__(self, latency: float, jitter: float, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self._rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self._lock:
+            delay = max(0.0, self.latency + self._rnd.uniform(-self.jitter, self.jitter))
+        time.sleep(delay)
+        content = json.dumps(RECIPE)
+        if kwargs.get("stream"):
+            return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + 64]))],
+                                    usage=None)
+                    for i in range(0, len(content), 64)]
+        msg = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=msg)], usage=None)
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # peak, in KiB on Linux; the best available without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _setup(cfg):
+    """Point the app at the shared DB and the stub LLM (runs once per process)."""
+    import memory
+    memory.DB = Path(cfg["db"])
+    memory.init_db()
+
+    import catalog
+    from agents import recipe
+    from cache import RecipeCache
+    from llm import LLMGateway
+    if not cfg["cache"]:
+        # every recipe turn goes to the (stub) LLM instead of earlier users' recipes
+        catalog.CATALOG_ENABLED = False
+        recipe.recipe_cache = RecipeCache(variants=10 ** 9, persistent=False)
+    stub = SimpleNamespace(chat=SimpleNamespace(
+        completions=StubCompletions(cfg["llm_latency"], cfg["llm_jitter"], cfg["seed"] + os.getpid())))
+    recipe.gateway = LLMGateway(client=stub, async_client=stub, max_concurrency=max(16, cfg["threads"]))
+
+    import agents
+    import workflow
+    # agents load lazily; import them all now so RSS growth measures the load, not imports
+    for name in agents.__all__:
+        getattr(agents, name)
+    return workflow.build_graph()
+
+
+def _conversation(graph, uid: str, i: int, out):
+    ctx = {"user_id": uid}
+    for kind, message, updates in script(i):
+        if updates:
+            ctx.update(updates)
+        start = time.perf_counter()
+        try:
+            _, ctx = graph.run_once(ctx, message)
+        except sqlite3.OperationalError as e:
+            # lock contention is what this bench measures; anything else is a bug and fails the run
+            if "locked" not in str(e):
+                raise
+            out["errors"]["locked"] += 1
+            continue
+        finally:
+            out["latencies"].append((kind, time.perf_counter() - start))
+
+
+def run_worker(cfg, first_user: int, sessions: int, barrier, results):
+    """Run `sessions` conversations on cfg["threads"] threads and queue the raw measurements."""
+    from collections import Counter
+
+    import memory
+    import metrics
+
+    graph = _setup(cfg)
+    metrics.reset()
+    out = {"latencies": [], "errors": Counter()}
+    rss_start = rss_bytes()
+    barrier.wait()
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=cfg["threads"]) as pool:
+        list(pool.map(lambda i: _conversation(graph, f"load-{first_user + i}", first_user + i, out),
+                      range(sessions)))
+    # writes still in the write-behind queue are part of the load
+    memory.get_storage().flush()
+    end = time.time()
+    results.put({
+        "start": start,
+        "end": end,
+        "latencies": out["latencies"],
+        "errors": dict(out["errors"]),
+        "rss_start": rss_start,
+        "rss_end": rss_bytes(),
+        "sessions": sessions,
+        "db": {f"{name}{'.' + labels['span'] if labels else ''}": metrics.histogram(name, **labels).counts
+               for name, labels in DB_HISTOGRAMS},
+    })
+
+
+def _process_worker(cfg, first_user, sessions, barrier, results):
+    sys.path.insert(0, str(ROOT))
+    try:
+        run_worker(cfg, first_user, sessions, barrier, results)
+    except BaseException:
+        # release the other workers and tell the parent instead of leaving it waiting
+        barrier.abort()
+        results.put({"error": traceback.format_exc()})
+
+
+def _split(total: int, parts: int):
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def run_level(mode: str, concurrency: int, args):
+    db = Path(tempfile.mkdtemp()) / "load.db"
+    cfg = {"db": str(db), "cache": args.cache, "llm_latency": args.llm_latency, "llm_jitter": args.llm_jitter,
+           "seed": args.seed, "threads": concurrency}
+    # threads mode is one worker process; each level gets a fresh process and DB
+    procs = 1 if mode == "threads" else min(concurrency, args.procs)
+    threads = _split(concurrency, procs)
+    sessions = _split(args.sessions, procs)
+    mp = multiprocessing.get_context("spawn")
+    barrier, results = mp.Barrier(procs), mp.Queue()
+    ps, first = [], 0
+    for p in range(procs):
+        pcfg = dict(cfg, threads=threads[p])
+        ps.append(mp.Process(target=_process_worker, args=(pcfg, first, sessions[p], barrier, results)))
+        first += sessions[p]
+    for p in ps:
+        p.start()
+    workers = [results.get() for _ in ps]
+    for p in ps:
+        p.join()
+    failed = [w["error"] for w in workers if "error" in w]
+    if failed:
+        sys.exit(f"worker failed at {mode} c={concurrency}:\n{failed[0]}")
+    return summarize(mode, concurrency, workers)
+
+
+def _pct(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _hist_summary(counts):
+    import metrics
+    h = metrics.Histogram()
+    h.counts = counts
+    h.count = sum(counts)
+    return {"count": h.count, "p50_ms": h.quantile(0.5) * 1000, "p99_ms": h.quantile(0.99) * 1000}
+
+
+def summarize(mode: str, concurrency: int, workers):
+    elapsed = max(w["end"] for w in workers) - min(w["start"] for w in workers)
+    lat = sorted(d for w in workers for _, d in w["latencies"])
+    by_kind = {}
+    for w in workers:
+        for kind, d in w["latencies"]:
+            by_kind.setdefault(kind, []).append(d)
+    errors = {}
+    for w in workers:
+        for k, v in w["errors"].items():
+            errors[k] = errors.get(k, 0) + v
+    db = {}
+    for w in workers:
+        for name, counts in w["db"].items():
+            merged = db.setdefault(name, [0] * len(counts))
+            for i, c in enumerate(counts):
+                merged[i] += c
+    sessions = sum(w["sessions"] for w in workers)
+    growth = sum(w["rss_end"] - w["rss_start"] for w in workers)
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "processes": len(workers),
+        "sessions": sessions,
+        "turns": len(lat),
+        "elapsed_s": elapsed,
+        "turns_per_s": len(lat) / elapsed if elapsed else 0.0,
+        "latency_ms": {"p50": _pct(lat, 0.5) * 1000, "p95": _pct(lat, 0.95) * 1000,
+                       "p99": _pct(lat, 0.99) * 1000, "max": (lat[-1] if lat else 0) * 1000,
+                       "mean": statistics.fmean(lat) * 1000 if lat else 0.0},
+        "by_turn_p95_ms": {k: _pct(sorted(v), 0.95) * 1000 for k, v in sorted(by_kind.items())},
+        "errors": errors,
+        "db": {name: _hist_summary(counts) for name, counts in sorted(db.items())},
+        "rss_mb": {"start": sum(w["rss_start"] for w in workers) / 2 ** 20,
+                   "end": sum(w["rss_end"] for w in workers) / 2 ** 20,
+                   "growth_kb_per_session": growth / 1024 / sessions if sessions else 0.0},
+    }
+
+
+def print_result(r):
+    lat, db = r["latency_ms"], r["db"]
+    wait = db.get("chef_db_pool_wait_seconds", {})
+    batch = db.get("chef_db_seconds.db.write_batch", {})
+    errs = ", ".join(f"{k}={v}" for k, v in r["errors"].items()) or "none"
+    print(f"{r['mode']:>9} c={r['concurrency']:<4} {r['turns_per_s']:8,.0f} turns/s  "
+          f"p50 {lat['p50']:7.2f}  p95 {lat['p95']:7.1f}  p99 {lat['p99']:7.1f} ms  | "
+          f"pool wait p99 {wait.get('p99_ms', 0):6.2f} ms, write batch p99 {batch.get('p99_ms', 0):6.2f} ms "
+          f"| rss +{r['rss_mb']['growth_kb_per_session']:.1f} KiB/session | errors {errs}")
+
+
+def compare(results, baseline_path: Path, tolerance: float) -> bool:
+    """Print deltas against an earlier run; True if any level regressed past tolerance."""
+    old = {(r["mode"], r["concurrency"]): r for r in json.loads(baseline_path.read_text())["results"]}
+    regressed = False
+    print(f"\nagainst {baseline_path}:")
+    for r in results:
+        prev = old.get((r["mode"], r["concurrency"]))
+        if prev is None:
+            continue
+        tput = r["turns_per_s"] / prev["turns_per_s"] - 1 if prev["turns_per_s"] else 0.0
+        p95 = r["latency_ms"]["p95"] / prev["latency_ms"]["p95"] - 1 if prev["latency_ms"]["p95"] else 0.0
+        bad = tput < -tolerance or p95 > tolerance
+        regressed |= bad
+        print(f"{r['mode']:>9} c={r['concurrency']:<4} turns/s {tput:+7.1%}  p95 {p95:+7.1%}"
+              f"{'  REGRESSION' if bad else ''}")
+    return regressed
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--levels", default="1,4,16,64", help="comma-separated concurrency levels")
+    ap.add_argument("--modes", default="threads,processes")
+    ap.add_argument("--sessions", type=int, default=200, help="conversations per level")
+    ap.add_argument("--procs", type=int, default=os.cpu_count() or 4, help="max processes in process mode")
+    ap.add_argument("--llm-latency", type=float, default=0.2)
+    ap.add_argument("--llm-jitter", type=float, default=0.05)
+    ap.add_argument("--cache", action="store_true", help="keep the recipe cache and catalog on")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", type=Path, help="write machine-readable results here")
+    ap.add_argument("--compare", type=Path, help="earlier --json output to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    args = ap.parse_args()
+
+    results = []
+    for mode in args.modes.split(","):
+        for level in (int(x) for x in args.levels.split(",")):
+            r = run_level(mode.strip(), level, args)
+            print_result(r)
+            results.append(r)
+
+    if args.json:
+        meta = {"commit": _git_commit(), "python": platform.python_version(), "cpus": os.cpu_count(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()}}
+        args.json.write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+        print(f"\nwrote {args.json}")
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
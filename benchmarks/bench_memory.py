@@ -0,0 +1,101 @@
+"""
+bench_memory.py
+
+Multi-threaded ops/sec for memory.py: the old connect-per-call pattern versus
+the pooled Storage with its write-behind queue.
+
+    python benchmarks/bench_memory.py --threads 16 --ops 500
+"""
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import memory  # noqa: E402
+import payloads  # noqa: E402
+
+CODEC = payloads.Codec({payloads.SEED_ID: payloads.SEED_DICTIONARY})
+
+
+def _recipe(uid: str) -> tuple:
+    return (uid, "t", None) + CODEC.encode({"title": "t"})
+
+
+def _legacy_ops(path: str, uid: str, ops: int):
+    for i in range(ops):
+        conn = sqlite3.connect(path, timeout=30)
+        cur = conn.cursor()
+        if i % 3 == 0:
+            cur.execute(memory.SQL_PUSH_RECIPE, _recipe(uid))
+        elif i % 3 == 1:
+            cur.execute(memory.SQL_STORE_FEEDBACK, (uid, 5, "ok", None, None, None, None))
+        else:
+            cur.execute(memory.SQL_ADD_TIMER, (uid, "x", i))
+        conn.commit()
+        conn.close()
+
+
+def _pooled_ops(store: memory.Storage, uid: str, ops: int):
+    for i in range(ops):
+        if i % 3 == 0:
+            store.enqueue(memory.SQL_PUSH_RECIPE, _recipe(uid))
+        elif i % 3 == 1:
+            store.enqueue(memory.SQL_STORE_FEEDBACK, (uid, 5, "ok", None, None, None, None))
+        else:
+            store.enqueue(memory.SQL_ADD_TIMER, (uid, "x", i))
+
+
+def _migrate(conn: sqlite3.Connection):
+    for _, migration in memory.MIGRATIONS:
+        if callable(migration):
+            migration(conn)
+        else:
+            for stmt in migration:
+                conn.execute(stmt)
+    conn.commit()
+
+
+def _run(threads: int, target, args_for):
+    ts = [threading.Thread(target=target, args=args_for(i)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--ops", type=int, default=500)
+    args = ap.parse_args()
+    total = args.threads * args.ops
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = str(Path(tmp) / "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        _migrate(conn)
+        conn.close()
+        elapsed = _run(args.threads, _legacy_ops, lambda i: (legacy_path, f"u{i}", args.ops))
+        print(f"legacy connect-per-call: {total / elapsed:,.0f} ops/sec")
+
+        store = memory.Storage(Path(tmp) / "pooled.db")
+        with store.connection() as conn:
+            _migrate(conn)
+        start = time.perf_counter()
+        _run(args.threads, _pooled_ops, lambda i: (store, f"u{i}", args.ops))
+        store.flush()
+        elapsed = time.perf_counter() - start
+        print(f"pooled write-behind:     {total / elapsed:,.0f} ops/sec")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+bench_parse.py
+
+Parse-success rate on a corpus of recorded raw recipe replies
+(benchmarks/data/raw_replies.jsonl): the old strip-fences-and-json.loads
+parser versus recipe_parser with local repair, plus how many replies would go
+to a repair re-prompt and the tokens that saves over regenerating the recipe.
+Token counts come from tokens.count_tokens() (offline).
+
+    python benchmarks/bench_parse.py
+"""
+
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import recipe_parser  # noqa: E402
+import prompts  # noqa: E402
+from tokens import count_messages, count_tokens  # noqa: E402
+
+CORPUS = Path(__file__).parent / "data" / "raw_replies.jsonl"
+PREFS = {"number_of_people": 2, "spice_level": 5, "region_preference": "north", "preference_type": "none",
+         "allergies": [], "dislikes": []}
+
+
+def legacy_parse(content: str):
+    content = content.strip()
+    try:
+        if content.startswith("```"):
+            for part in content.split("```"):
+                part = part.strip()
+                if part.startswith("{"):
+                    content = part
+                    break
+        return json.loads(content)
+    except Exception:
+        return None
+
+
+def main():
+    rows = [json.loads(line) for line in CORPUS.read_text(encoding="utf-8").splitlines() if line.strip()]
+    prompt_tokens = count_messages(prompts.recipe_messages(PREFS))
+    outcome = Counter()
+    legacy_ok = 0
+    regen_tokens = repair_tokens = 0
+    for row in rows:
+        reply = row["reply"]
+        legacy_ok += legacy_parse(reply) is not None
+        result = recipe_parser.parse_recipe(reply)
+        if result.recipe is not None:
+            outcome["parsed locally"] += 1
+        elif result.data is not None:
+            outcome["repair re-prompt"] += 1
+            messages = recipe_parser.repair_messages(result)
+            fragment = json.dumps({f: result.data.get(f) for f in result.errors})
+            # repair: short prompt in, corrected fields out; regeneration: full prompt in, full recipe out
+            repair_tokens += count_messages(messages) + count_tokens(fragment)
+            regen_tokens += prompt_tokens + count_tokens(reply)
+            print(f"  re-prompt {row['kind']:<18} fields: {', '.join(result.errors)}")
+        else:
+            outcome["unrecoverable"] += 1
+
+    n = len(rows)
+    print(f"\n{n} recorded replies")
+    print(f"old parser (fences + json.loads): {legacy_ok}/{n} loaded ({legacy_ok / n:.0%}), none validated")
+    print(f"recipe_parser, local only:       {outcome['parsed locally']}/{n} valid ({outcome['parsed locally'] / n:.0%})")
+    print(f"sent to repair re-prompt:        {outcome['repair re-prompt']}")
+    print(f"unrecoverable (no JSON):         {outcome['unrecoverable']}")
+    if outcome["repair re-prompt"]:
+        print(f"tokens for those replies: regenerate ~{regen_tokens:,}, repair ~{repair_tokens:,} "
+              f"({1 - repair_tokens / regen_tokens:.0%} saved)")
+
+
+if __name__ == "__main__":
+    main()
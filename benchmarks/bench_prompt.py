@@ -0,0 +1,121 @@
+"""
+bench_prompt.py
+
+Recipe prompt size before and after prompts.py, counted offline with
+tokens.py: prompt tokens per request, the part of them that is a prefix
+shared by every request (what a provider-side prompt cache can serve), and
+max_tokens against the size of recorded replies. Then --calls recipe
+generations go through the gateway with a stub LLM and the per-node token
+report is printed.
+
+    python benchmarks/bench_prompt.py --requests 500 --calls 50
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import metrics  # noqa: E402
+import prompts  # noqa: E402
+import tokens  # noqa: E402
+from benchmarks.fake_openai import RECIPE  # noqa: E402
+
+CORPUS = Path(__file__).parent / "data" / "raw_replies.jsonl"
+LEGACY_SYSTEM = """
+You are Chef Raghav — a seasoned Indian chef with 30+ years across India and Italy.
+When user asks, produce JSON only with keys:
+title, cultural_note, ingredients (list), steps (list of {text, optional timer_sec, optional timer_label}), tips (list).
+- At least one step must include timer_sec (an integer, seconds).
+- Respect allergies/dislikes.
+- Adapt spice_level and number_of_people in ingredient quantities.
+- Keep steps short and actionable.
+"""
+LEGACY_MAX_TOKENS = 1000
+ALLERGENS = ["peanuts", "shrimp", "dairy", "gluten", "eggs", "soy", "sesame", "mustard"]
+
+
+def legacy_messages(p):
+    user = f"""Generate a recipe personalized to:
+number_of_people={p.get('number_of_people')}, spice_level={p.get('spice_level')}, region={p.get('region_preference')},
+preference_type={p.get('preference_type')}, allergies={p.get('allergies')}, dislikes={p.get('dislikes')}.
+Return ONLY valid JSON matching the schema. Keep text natural and chef-like.
+"""
+    return [{"role": "system", "content": LEGACY_SYSTEM}, {"role": "user", "content": user}]
+
+
+def random_prefs(rng: random.Random):
+    return {"number_of_people": rng.randint(1, 8), "spice_level": rng.randint(0, 10),
+            "region_preference": rng.choice(["north", "south", "east", "west"]),
+            "preference_type": rng.choice(["dietary", "cuisine", "cooking_time", "none"]),
+            "allergies": rng.sample(ALLERGENS, rng.randint(0, 2)), "dislikes": rng.sample(ALLERGENS, rng.randint(0, 1))}
+
+
+def shared_prefix(texts):
+    first, last = min(texts), max(texts)
+    n = 0
+    while n < min(len(first), len(last)) and first[n] == last[n]:
+        n += 1
+    return first[:n]
+
+
+def measure(name, build, prefs_list, max_tokens):
+    requests = [build(p) for p in prefs_list]
+    counts = [tokens.count_messages(m) for m in requests]
+    prefix = shared_prefix(["\x00".join(m["content"] for m in msgs) for msgs in requests])
+    systems = {msgs[0]["content"] for msgs in requests}
+    print(f"  {name:<7} prompt {statistics.mean(counts):6.1f} tokens/request (max {max(counts)}), "
+          f"shared prefix {tokens.count_tokens(prefix):4d} tokens, per-request {statistics.mean(counts) - tokens.count_tokens(prefix):5.1f}; "
+          f"{len(systems)} distinct system prompt(s); max_tokens {max_tokens}")
+    return statistics.mean(counts)
+
+
+def report_completions():
+    replies = [json.loads(line)["reply"] for line in CORPUS.read_text(encoding="utf-8").splitlines() if line.strip()]
+    sizes = sorted(tokens.count_tokens(r) for r in replies + [json.dumps(RECIPE)])
+    print(f"  recorded replies: {len(sizes)}, completion tokens p50 {sizes[len(sizes) // 2]} max {sizes[-1]}; "
+          f"max_tokens {prompts.recipe_max_tokens()} (largest allowed recipe x {prompts.MAX_TOKENS_HEADROOM})")
+
+
+def run_calls(n: int, rng: random.Random):
+    from agents import recipe
+    from llm import LLMGateway
+
+    content = json.dumps(RECIPE)
+    stub = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kw: SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content),
+                                                                     finish_reason="stop")], usage=None))))
+    recipe.gateway = LLMGateway(client=stub)
+    metrics.reset()
+    for i in range(n):
+        recipe._call_llm(random_prefs(rng), user_id=f"u{i % 5}")
+    print(f"\n{n} recipe calls through the gateway (stub LLM, usage estimated offline):")
+    print(tokens.format_report())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--calls", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=5)
+    args = ap.parse_args()
+    rng = random.Random(args.seed)
+    prefs_list = [random_prefs(rng) for _ in range(args.requests)]
+    counter = "tiktoken" if tokens._encoding(os.getenv("OPENAI_MODEL")) else "offline estimate"
+    print(f"{args.requests} recipe requests, tokens counted with the {counter}")
+    before = measure("before", legacy_messages, prefs_list, LEGACY_MAX_TOKENS)
+    after = measure("after", prompts.recipe_messages, prefs_list, prompts.recipe_max_tokens())
+    print(f"  prompt tokens {after / before - 1:+.0%}")
+    report_completions()
+    if args.calls:
+        run_calls(args.calls, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+bench_router.py
+
+Routing accuracy and per-turn latency on a labeled corpus of chat messages
+(benchmarks/data/intent_corpus.jsonl): the old substring supervisor versus the
+table-driven router, with and without the local classifier tier.
+
+    python benchmarks/bench_router.py --repeat 2000
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import workflow  # noqa: E402
+from router import Router  # noqa: E402
+from utils import guardrail  # noqa: E402
+
+CORPUS = Path(__file__).parent / "data" / "intent_corpus.jsonl"
+
+
+def legacy_route(ctx, message):
+    m = message.strip().lower()
+    ok, _ = guardrail(message)
+    if not ok:
+        return "regular_chat"
+    if any(w in m for w in ["hi", "hello", "namaste", "hey"]):
+        return "greeting"
+    if "preferences" not in ctx or ctx.get("_expecting_pref_answer", False):
+        return "preference"
+    if any(w in m for w in ["recipe", "cook", "make", "i want to cook", "i want to make"]):
+        return "recipe"
+    if m in ("yes", "y", "sure", "please") and ctx.get("last_recipe"):
+        return "step_by_step"
+    if ctx.get("_in_steps"):
+        if m in ("next", "n", "repeat", "r", "slow", "s"):
+            return "step_by_step"
+        if ctx.get("expecting_feedback"):
+            return "feedback"
+    return "regular_chat"
+
+
+def _evaluate(name, fn, corpus, repeat):
+    correct = sum(fn(dict(c["ctx"]), c["text"]) == c["node"] for c in corpus)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for c in corpus:
+            fn(c["ctx"], c["text"])
+    per_turn = (time.perf_counter() - start) / (repeat * len(corpus)) * 1e6
+    print(f"{name:<28} accuracy {correct}/{len(corpus)} ({correct / len(corpus):.0%}), {per_turn:6.2f} us/turn")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+    corpus = [json.loads(line) for line in CORPUS.read_text().splitlines() if line.strip()]
+
+    _evaluate("legacy substring supervisor", legacy_route, corpus, args.repeat)
+    _evaluate("routing table", lambda ctx, m: workflow.supervisor_action(ctx, m)[1], corpus, args.repeat)
+    with_clf = Router(workflow.ROUTES, default_node="regular_chat", classifier=True,
+                      default_examples=workflow.CHAT_EXAMPLES)
+
+    def classify(ctx, m):
+        ok, _ = guardrail(m)
+        return with_clf.route(ctx, m)[0] if ok else "regular_chat"
+
+    _evaluate("routing table + classifier", classify, corpus, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+bench_scale.py
+
+Throughput of quantities.scale_recipe() on randomly generated ingredient
+lists, and a seeded randomized check of the scaler's properties:
+
+- factor 1 leaves every line unchanged,
+- lines without a quantity ("Salt to taste") are never changed,
+- scaling up never yields less of an ingredient (same unit kind),
+- scaling by f and then 1/f lands within rounding of the original,
+- pack sizes in parentheses and numbers after the quantity stay as written,
+- lines with unreadable numbers make scale_recipe() return None.
+
+    python benchmarks/bench_scale.py --recipes 20000
+"""
+
+import argparse
+import random
+import sys
+import time
+from fractions import Fraction
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import quantities  # noqa: E402
+
+NAMES = ["Tomatoes", "Onion", "Paneer", "Basmati rice", "Toor dal", "Ghee", "Milk", "Garlic", "Ginger",
+         "Green chillies", "Cumin seeds", "Turmeric", "Coconut milk", "Cream", "Potatoes", "Spinach"]
+FORMS = [
+    lambda rng, n: f"{n} {rng.randint(1, 20) * 25}g",
+    lambda rng, n: f"{n} {rng.choice(['1/2', '1', '1 1/2', '2', '¼', '3/4'])} tsp",
+    lambda rng, n: f"{rng.choice(['1', '2', '3', '1 1/2'])} tbsp {n.lower()}",
+    lambda rng, n: f"{rng.choice(['1/2', '1', '2', '1 ½'])} cups {n.lower()}",
+    lambda rng, n: f"{n} {rng.randint(1, 4)}-{rng.randint(5, 8)}",
+    lambda rng, n: f"{n} {rng.randint(1, 6)}",
+    lambda rng, n: f"{n} {rng.randint(2, 8)} cloves, minced",
+    lambda rng, n: f"{n} {rng.choice([250, 500, 750, 1000])} ml",
+    lambda rng, n: f"{n} to taste",
+    lambda rng, n: f"{rng.choice(['1', '2'])} ({rng.randint(2, 8) * 50}g) can {n.lower()}",
+    lambda rng, n: f"{n} {rng.randint(1, 20) * 25}g, cut into {rng.randint(1, 3)} inch pieces",
+]
+
+
+def random_recipe(rng: random.Random):
+    lines = [rng.choice(FORMS)(rng, name) for name in rng.sample(NAMES, rng.randint(5, 12))]
+    return {"title": "x", "ingredients": lines, "steps": [], "servings": rng.randint(1, 8)}
+
+
+def amount(line: str):
+    """Total amount in base units for a single-quantity line, or None."""
+    ing = quantities.parse_ingredient(line)
+    if ing is None or ing.quantity is None:
+        return None
+    if ing.unit in quantities.UNITS:
+        return quantities.UNITS[ing.unit][1], ing.quantity * quantities.UNITS[ing.unit][2]
+    return "count", ing.quantity
+
+
+def check_properties(rng: random.Random, cases: int):
+    failures = []
+    for _ in range(cases):
+        recipe = random_recipe(rng)
+        lines = recipe["ingredients"]
+        if quantities.scale_ingredients(lines, 1) != lines:
+            failures.append(("identity", lines))
+        f = Fraction(rng.randint(2, 6), rng.randint(1, 2))
+        up = quantities.scale_ingredients(lines, f)
+        back = quantities.scale_ingredients(up, 1 / f)
+        for orig, big, again in zip(lines, up, back):
+            if "to taste" in orig and not (orig == big == again):
+                failures.append(("to taste changed", orig, big))
+                continue
+            if "(" in orig and orig[orig.index("("):] != big[big.index("("):] \
+                    or "cut into" in orig and orig[orig.index(","):] != big[big.index(","):]:
+                failures.append(("trailing numbers scaled", orig, big))
+            a, b, c = amount(orig), amount(big), amount(again)
+            if a and b and a[0] == b[0] and f > 1 and b[1] < a[1]:
+                failures.append(("scaled up to less", orig, big))
+            # rounding to a measurable amount may move the round trip by a step either way
+            if a and c and a[0] == c[0] and abs(c[1] - a[1]) > max(a[1] * Fraction(3, 10), 15):
+                failures.append(("round trip", orig, big, again))
+        bad = dict(recipe, ingredients=lines + ["3x secret spice mix"])
+        if quantities.scale_recipe(bad, recipe["servings"] + 1) is not None:
+            failures.append(("unreadable accepted", bad["ingredients"][-1]))
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--recipes", type=int, default=20000)
+    ap.add_argument("--cases", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=3)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    recipes = [random_recipe(rng) for _ in range(args.recipes)]
+    lines = sum(len(r["ingredients"]) for r in recipes)
+    start = time.perf_counter()
+    for r in recipes:
+        quantities.scale_recipe(r, r["servings"] % 8 + 1 if r["servings"] < 8 else 2)
+    took = time.perf_counter() - start
+    print(f"scaled {args.recipes:,} recipes ({lines:,} lines) in {took:.2f}s: "
+          f"{took / args.recipes * 1e6:,.0f} us/recipe, {lines / took:,.0f} lines/s")
+
+    uncached = quantities._scale_line.__wrapped__
+    start = time.perf_counter()
+    for r in recipes[:2000]:
+        for line in r["ingredients"]:
+            uncached(line, 1.5)
+    cold = time.perf_counter() - start
+    cold_lines = sum(len(r["ingredients"]) for r in recipes[:2000])
+    print(f"without the line memo: {cold / cold_lines * 1e6:,.1f} us/line")
+
+    failures = check_properties(random.Random(args.seed + 1), args.cases)
+    print(f"property checks: {args.cases:,} random recipes, {len(failures)} failures")
+    for f in failures[:10]:
+        print("  ", f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+bench_semantic_cache.py
+
+Lookup latency of semantic_cache.SemanticCache with up to 1M cached
+questions, and how often it answers correctly:
+
+- paraphrases of cached questions (reordered words, extra filler words,
+  plurals) should hit the answer of the question they came from,
+- questions about an ingredient or technique that was never cached should miss.
+
+    python benchmarks/bench_semantic_cache.py --entries 1000000
+
+Without NumPy the cache falls back to a pure-Python scan; the benchmark then
+caps --entries at 20,000 unless --force is given.
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import semantic_cache  # noqa: E402
+
+TEMPLATES = ["how do i make {a} {b}", "why is my {a} {b}", "substitute for {a} in {b}", "how long to cook {a} for {b}",
+             "can i freeze {a} with {b}", "best way to store {a} {b}", "how much {a} in {b}", "is {a} good with {b}"]
+FILLERS = ["please", "tell me", "chef", "actually", "just"]
+
+
+def _vocab(n: int, rng: random.Random):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(4, 9))))
+    return sorted(words)
+
+
+def paraphrase(question: str, rng: random.Random) -> str:
+    words = question.split()
+    if rng.random() < 0.5:
+        words.append(rng.choice(FILLERS))
+    nouns = [i for i, w in enumerate(words) if len(w) > 3 and not w.endswith("s")]
+    if nouns and rng.random() < 0.5:
+        words[rng.choice(nouns)] += "s"
+    if rng.random() < 0.5:
+        rng.shuffle(words)
+    return " ".join(words)
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--entries", type=int, default=1_000_000)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--threshold", type=float, default=0.8)
+    ap.add_argument("--seed", type=int, default=5)
+    ap.add_argument("--force", action="store_true")
+    args = ap.parse_args()
+
+    if semantic_cache.np is None and args.entries > 20_000 and not args.force:
+        print("NumPy is not installed: pure-Python scan, capping --entries at 20,000 (use --force)")
+        args.entries = 20_000
+
+    rng = random.Random(args.seed)
+    # enough words that (template, a, b) covers --entries distinct questions
+    vocab = _vocab(max(400, 4 * int(args.entries ** 0.5)), rng)
+    # unseen words make the questions that must miss
+    unseen = [w for w in _vocab(len(vocab) + 200, random.Random(args.seed + 1)) if w not in set(vocab)][:200]
+    questions, seen = [], set()
+    while len(questions) < args.entries:
+        q = rng.choice(TEMPLATES).format(a=rng.choice(vocab), b=rng.choice(vocab))
+        if q not in seen:
+            seen.add(q)
+            questions.append(q)
+
+    cache = semantic_cache.SemanticCache(max_size=args.entries, threshold=args.threshold, dim=args.dim,
+                                         persistent=False)
+    start = time.perf_counter()
+    for i, q in enumerate(questions):
+        cache.put(q, f"answer {i}")
+    fill = time.perf_counter() - start
+    print(f"filled {len(cache):,} entries in {fill:.1f}s ({fill / len(cache) * 1e6:.0f} us/put), "
+          f"{'numpy' if semantic_cache.np is not None else 'pure Python'}, dim {args.dim}")
+
+    expect = {q: f"answer {i}" for i, q in enumerate(questions)}
+    exact, para, miss = [], [], []
+    correct = wrong = 0
+    for _ in range(args.queries):
+        q = rng.choice(questions)
+        t = time.perf_counter()
+        cache.get(q)
+        exact.append(time.perf_counter() - t)
+
+        p = paraphrase(q, rng)
+        t = time.perf_counter()
+        got = cache.get(p)
+        para.append(time.perf_counter() - t)
+        if got == expect[q]:
+            correct += 1
+
+        u = rng.choice(TEMPLATES).format(a=rng.choice(unseen), b=rng.choice(unseen))
+        t = time.perf_counter()
+        if cache.get(u) is not None:
+            wrong += 1
+        miss.append(time.perf_counter() - t)
+
+    for name, lat in (("exact repeat", exact), ("paraphrase", para), ("unseen", miss)):
+        print(f"  {name:<13} p50 {statistics.median(lat) * 1000:8.2f} ms  p99 {_pct(lat, 0.99) * 1000:8.2f} ms")
+    print(f"paraphrases answered correctly: {correct / args.queries:.1%}; "
+          f"unseen questions answered (false hits): {wrong / args.queries:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+bench_session_memory.py
+
+Per-session memory for many simulated sessions mid step-by-step: the old ctx
+dict (with a copied `remaining` step list and an unbounded history list)
+versus SessionState with index-based step tracking and a bounded ChatHistory.
+
+    python benchmarks/bench_session_memory.py --sessions 10000 --turns 200
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import memory  # noqa: E402
+from benchmarks.fake_openai import RECIPE  # noqa: E402
+from session import ChatHistory, SessionState  # noqa: E402
+
+PREFS = {"number_of_people": 2, "spice_level": 5, "region_preference": "north",
+         "preference_type": "none", "allergies": [], "dislikes": []}
+
+
+def _old_session(i: int, turns: int):
+    recipe = json.loads(json.dumps(RECIPE))
+    steps = recipe["steps"]
+    ctx = {"user_id": f"u{i}", "preferences": dict(PREFS), "last_recipe": recipe, "_in_steps": True,
+           "step_state": {"agent": "step", "current_step": steps[0], "remaining": [dict(s) for s in steps[1:]]}}
+    history = []
+    for t in range(turns):
+        history.append(("you" if t % 2 == 0 else "chef", f"turn {t} of session {i}: next please"))
+    return ctx, history
+
+
+def _new_session(i: int, turns: int):
+    recipe = json.loads(json.dumps(RECIPE))
+    ctx = SessionState(user_id=f"u{i}", preferences=dict(PREFS), last_recipe=recipe, _in_steps=True, step_index=0)
+    history = ChatHistory(f"u{i}", max_turns=20)
+    for t in range(turns):
+        history.append("you" if t % 2 == 0 else "chef", f"turn {t} of session {i}: next please")
+    return ctx, history
+
+
+def _measure(fn, sessions: int, turns: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = [fn(i, turns) for i in range(sessions)]
+    # spilled turns should be counted once they are on disk, not while queued
+    memory.get_storage().flush()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return (after - before) / sessions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=10_000)
+    ap.add_argument("--turns", type=int, default=200)
+    args = ap.parse_args()
+
+    memory.DB = Path(tempfile.mkdtemp()) / "bench.db"
+    memory.init_db()
+    old = _measure(_old_session, args.sessions, args.turns)
+    new = _measure(_new_session, args.sessions, args.turns)
+    print(f"{args.sessions} sessions, {args.turns} turns each")
+    print(f"ctx dict + list history:         {old / 1024:8.1f} KiB/session")
+    print(f"SessionState + bounded history:  {new / 1024:8.1f} KiB/session")
+
+
+if __name__ == "__main__":
+    main()
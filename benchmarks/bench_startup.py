@@ -0,0 +1,110 @@
+"""
+bench_startup.py
+
+Cold-start cost of a worker, each measured in a fresh interpreter:
+
+- `python -X importtime -c "import workflow"`: total import time and the
+  slowest modules,
+- time to first response: import, init_db() on a new database, build_graph()
+  and one greeting turn, plus the cost of the init_db() every script rerun makes,
+- whether the greeting turn pulled in the recipe agent or the OpenAI SDK
+  (it should not; agents load on first use).
+
+Exits non-zero when a threshold is exceeded, so it can gate CI; the limits
+default to STARTUP_MAX_IMPORT_MS / STARTUP_MAX_FIRST_RESPONSE_MS, and
+tests/test_startup.py checks the same limits on every test run:
+
+    python benchmarks/bench_startup.py --max-import-ms 800 --max-first-response-ms 1500
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+MAX_IMPORT_MS = float(os.getenv("STARTUP_MAX_IMPORT_MS") or 800)
+MAX_FIRST_RESPONSE_MS = float(os.getenv("STARTUP_MAX_FIRST_RESPONSE_MS") or 1500)
+
+FIRST_RESPONSE = r"""
+import time
+t0 = time.perf_counter()
+import json, sys, tempfile
+from pathlib import Path
+import memory
+memory.DB = Path(tempfile.mkdtemp()) / "startup.db"
+from workflow import build_graph
+t_import = time.perf_counter()
+memory.init_db()
+t_db = time.perf_counter()
+memory.init_db()
+t_rerun = time.perf_counter()
+graph = build_graph()
+text, ctx = graph.run_once({"user_id": "startup"}, "hello")
+t_first = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t_import - t0) * 1000,
+    "init_db_ms": (t_db - t_import) * 1000,
+    "init_db_rerun_ms": (t_rerun - t_db) * 1000,
+    "first_response_ms": (t_first - t0) * 1000,
+    "loaded": sorted(m for m in ("agents.recipe", "openai", "pydantic", "httpx") if m in sys.modules),
+}))
+"""
+
+
+def import_profile(top: int):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import workflow"],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = (p.strip() for p in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative_us), name))
+    total = next(us for us, name in rows if name.strip() == "workflow")
+    # top-level entries only (no leading spaces), slowest first
+    slowest = sorted((r for r in rows if not r[1].startswith(" ")), reverse=True)[:top]
+    return total / 1000, slowest
+
+
+def first_response():
+    """Timings of a first greeting turn in a fresh interpreter, and the heavy modules it loaded."""
+    proc = subprocess.run([sys.executable, "-c", FIRST_RESPONSE], cwd=ROOT, capture_output=True,
+                          text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--max-import-ms", type=float, default=MAX_IMPORT_MS)
+    ap.add_argument("--max-first-response-ms", type=float, default=MAX_FIRST_RESPONSE_MS)
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args()
+
+    import_ms, slowest = import_profile(args.top)
+    print(f"import workflow (-X importtime): {import_ms:,.0f} ms")
+    for us, name in slowest:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    res = first_response()
+    print(f"time to first response:  {res['first_response_ms']:,.0f} ms "
+          f"(imports {res['import_ms']:,.0f} ms, init_db {res['init_db_ms']:,.1f} ms)")
+    print(f"init_db on a rerun:      {res['init_db_rerun_ms'] * 1000:,.0f} us")
+    print(f"loaded by a greeting:    {', '.join(res['loaded']) or 'none of the heavy modules'}")
+
+    failed = []
+    if import_ms > args.max_import_ms:
+        failed.append(f"import {import_ms:,.0f} ms > {args.max_import_ms:,.0f} ms")
+    if res["first_response_ms"] > args.max_first_response_ms:
+        failed.append(f"first response {res['first_response_ms']:,.0f} ms > {args.max_first_response_ms:,.0f} ms")
+    if "agents.recipe" in res["loaded"] or "openai" in res["loaded"]:
+        failed.append("greeting loaded the recipe agent / OpenAI SDK")
+    for f in failed:
+        print("FAIL:", f)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
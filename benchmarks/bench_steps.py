@@ -0,0 +1,128 @@
+"""
+bench_steps.py
+
+Database writes and per-command cost of step-by-step guidance, for one
+completed recipe (start, next through every step with a repeat and a back
+along the way, then feedback):
+
+- legacy: every step turn re-ran start_step_by_step, which went back to step 1
+  and inserted a timer row for every timed step of the recipe,
+- engine: agents.step_by_step navigates from the stored index, arms a step's
+  timer when that step starts, and cancels what is left in one statement.
+
+    python benchmarks/bench_steps.py --steps 12 --timed 4
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import memory  # noqa: E402
+from agents import step_by_step  # noqa: E402
+
+
+def legacy_start(user_id, recipe):
+    # the old start_step_by_step, run on every step turn
+    steps = recipe.get("steps", [])
+    now = int(time.time())
+    for s in steps:
+        if "timer_sec" in s:
+            memory.add_timer(user_id, s.get("timer_label", "timer"), now + int(s["timer_sec"]))
+    return {"agent": "step", "current_step": steps[0], "index": 0, "total": len(steps)}
+
+
+def make_recipe(steps: int, timed: int):
+    every = max(1, steps // max(1, timed))
+    out = []
+    for i in range(steps):
+        step = {"text": f"Step {i + 1}: stir, season and taste."}
+        if timed and i % every == every - 1 and sum("timer_sec" in s for s in out) < timed:
+            step.update(timer_sec=600 + i, timer_label=f"timer {i + 1}")
+        out.append(step)
+    return {"title": "bench", "steps": out}
+
+
+def commands(steps: int):
+    # next through the recipe, repeating every third step and going back once
+    out = []
+    for i in range(1, steps):
+        out.append("next")
+        if i % 3 == 0:
+            out.append("repeat")
+        if i == steps // 2:
+            out += ["back", "next"]
+    return out + ["next"]
+
+
+class CountingStore:
+    """Counts the statements that write, whichever Storage method runs them."""
+
+    def __init__(self, store):
+        self.store = store
+        self.writes = 0
+        for name in ("enqueue", "execute"):
+            setattr(self, name, self._counted(getattr(store, name)))
+
+    def _counted(self, fn):
+        def wrapper(sql, params=()):
+            if not sql.lstrip().upper().startswith("SELECT"):
+                self.writes += 1
+            return fn(sql, params)
+        return wrapper
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def run(kind: str, uid: str, recipe, script):
+    counting = memory.get_timer_scheduler().store
+    before = counting.writes
+    start = time.perf_counter()
+    if kind == "legacy":
+        for _ in ["yes"] + script:
+            legacy_start(uid, recipe)
+        # feedback cleared the session but left the timers
+    else:
+        res = step_by_step.start_step_by_step(uid, recipe)
+        for message in script:
+            command, target = step_by_step.parse_command(message)
+            res = step_by_step.navigate(uid, recipe, res["index"], command, target, armed=res["armed"])
+        step_by_step.finish_steps(uid)
+    took = time.perf_counter() - start
+    counting.store.flush()
+    pending = counting.store.query("SELECT COUNT(*) FROM timers WHERE user_id=? AND fired=0", (uid,))[0][0]
+    return counting.writes - before, pending, took / (len(script) + 1)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--steps", type=int, default=12)
+    ap.add_argument("--timed", type=int, default=4, help="steps with a timer")
+    ap.add_argument("--long", type=int, default=2000, help="steps in the recipe used for the per-command timing")
+    args = ap.parse_args()
+
+    memory.DB = Path(tempfile.mkdtemp()) / "steps.db"
+    memory.init_db()
+    scheduler = memory.get_timer_scheduler()
+    scheduler.store = CountingStore(scheduler.store)
+
+    recipe = make_recipe(args.steps, args.timed)
+    script = commands(args.steps)
+    print(f"one recipe: {args.steps} steps, {args.timed} with a timer, {len(script) + 1} step turns")
+    for kind in ("legacy", "engine"):
+        writes, pending, _ = run(kind, f"{kind}-user", recipe, script)
+        print(f"  {kind:<7} {writes:4d} DB writes per completed recipe, {pending:3d} timers left pending afterwards")
+
+    long_recipe = make_recipe(args.long, args.long // 4)
+    long_script = commands(args.long)[:200]
+    for kind in ("legacy", "engine"):
+        _, _, per_turn = run(kind, f"{kind}-long", long_recipe, long_script)
+        print(f"  {kind:<7} {per_turn * 1e6:10,.0f} us per command on a {args.long}-step recipe")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+bench_storage.py
+
+Size and latency of recipe storage with 1M stored recipes: the old format
+(each payload as json.dumps text in recipes.payload) against the current one
+(payloads deduplicated by content hash and compressed with a shared zlib
+dictionary, see payloads.py), then retention: archiving the rows older than
+RECIPE_RETENTION_DAYS and an incremental vacuum.
+
+A share of the pushes (--repeat-share) repeat an earlier recipe, as catalog and
+cache hits do.
+
+    python benchmarks/bench_storage.py --recipes 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import maintenance  # noqa: E402
+import memory  # noqa: E402
+
+LEGACY_SCHEMA = "CREATE TABLE recipes (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, title TEXT, payload JSON, prefs JSON)"
+LEGACY_PUSH = "INSERT INTO recipes(user_id,title,payload,prefs) VALUES (?,?,?,?)"
+LEGACY_ITER = "SELECT id,payload,prefs FROM recipes WHERE id>? ORDER BY id LIMIT ?"
+
+DISHES = ["paneer", "chicken", "dal", "chole", "rajma", "aloo", "gobi", "palak", "bhindi", "fish", "prawn",
+          "egg", "mutton", "baingan", "mushroom", "matar", "lauki", "methi", "kofta", "pulao"]
+STYLES = ["masala", "curry", "tikka", "korma", "makhani", "do pyaza", "kadai", "biryani", "fry", "sabzi"]
+REGIONS = ["Punjab", "Kerala", "Bengal", "Gujarat", "Rajasthan", "Hyderabad", "Goa", "Kashmir"]
+INGREDIENTS = ["onion", "tomatoes", "garlic", "ginger", "green chillies", "cumin seeds", "turmeric powder",
+               "red chilli powder", "garam masala", "coriander leaves", "oil", "ghee", "butter", "cream", "curd",
+               "salt", "lemon juice", "bay leaf", "cinnamon", "cardamom", "cloves", "kasuri methi", "coconut milk",
+               "mustard seeds", "curry leaves", "tamarind", "jaggery", "besan", "basmati rice", "water"]
+QUANTITIES = ["1 cup", "2 tbsp", "1 tsp", "1/2 tsp", "200g", "2", "1 inch", "to taste", "3 cloves", "250 ml"]
+ACTIONS = ["Heat {a} in a pan and add {b}.", "Add {a} and cook until soft.", "Stir in {a} and {b}, cook for {n} minutes.",
+           "Add {a}, cover and simmer on low heat.", "Blend {a} with {b} into a smooth paste.",
+           "Marinate the {d} with {a} and {b}.", "Garnish with {a} and serve hot.", "Saute {a} until golden brown."]
+TIPS = ["Use fresh {a} for the best flavour.", "Soak the {d} in warm water first.", "Adjust {a} to taste.",
+        "It keeps for two days in the fridge.", "Serve with naan or steamed rice."]
+
+
+def make_recipe(rng: random.Random):
+    dish = f"{rng.choice(DISHES).title()} {rng.choice(STYLES).title()}"
+    pick = lambda: rng.choice(INGREDIENTS)  # noqa: E731
+    steps = []
+    for _ in range(rng.randint(4, 8)):
+        step = {"text": rng.choice(ACTIONS).format(a=pick(), b=pick(), d=dish.split()[0].lower(), n=rng.randint(2, 20))}
+        if rng.random() < 0.4:
+            step.update(timer_sec=60 * rng.randint(1, 30), timer_label=f"{pick()} {rng.randint(1, 99)}")
+        steps.append(step)
+    return {
+        "title": dish,
+        "cultural_note": f"A {rng.choice(['classic', 'home-style', 'festive'])} dish from {rng.choice(REGIONS)}.",
+        "ingredients": [f"{rng.choice(QUANTITIES)} {i}" for i in rng.sample(INGREDIENTS, rng.randint(6, 12))],
+        "steps": steps,
+        "tips": [rng.choice(TIPS).format(a=pick(), d=dish.split()[0].lower()) for _ in range(rng.randint(1, 3))],
+        "servings": rng.randint(1, 8),
+    }
+
+
+def recipes(n: int, repeat_share: float, seed: int):
+    rng = random.Random(seed)
+    recent = []
+    for i in range(n):
+        if recent and rng.random() < repeat_share:
+            recipe = rng.choice(recent)
+        else:
+            recipe = make_recipe(rng)
+            if len(recent) < 5000:
+                recent.append(recipe)
+            else:
+                recent[rng.randrange(5000)] = recipe
+        yield f"u{i % 10000}", recipe, {"number_of_people": recipe["servings"]}
+
+
+def db_size(store) -> int:
+    store.flush()
+    with store.connection() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return sum(os.path.getsize(p) for p in (store.path, store.path + "-wal") if os.path.exists(p))
+
+
+def read_latency(n: int, point_read, scan, reads: int, seed: int):
+    rng = random.Random(seed)
+    lat = []
+    for _ in range(reads):
+        rid = rng.randint(1, n)
+        t = time.perf_counter()
+        point_read(rid)
+        lat.append(time.perf_counter() - t)
+    t = time.perf_counter()
+    scanned = scan()
+    took = time.perf_counter() - t
+    lat.sort()
+    return statistics.median(lat), lat[int(0.99 * len(lat))], scanned / took
+
+
+def report(name, size, write_us, p50, p99, scan_rate):
+    print(f"  {name:<8} {size / 2**20:9,.1f} MiB  write {write_us:6.1f} us/recipe  "
+          f"point read p50 {p50 * 1e6:5.0f} us p99 {p99 * 1e6:5.0f} us  full scan {scan_rate:9,.0f} recipes/s")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--recipes", type=int, default=1_000_000)
+    ap.add_argument("--repeat-share", type=float, default=0.3)
+    ap.add_argument("--reads", type=int, default=2000)
+    ap.add_argument("--retention-days", type=float, default=180)
+    ap.add_argument("--span-days", type=float, default=365, help="the recipes' created_at spread over this many days")
+    ap.add_argument("--seed", type=int, default=3)
+    args = ap.parse_args()
+    tmp = Path(tempfile.mkdtemp())
+    n = args.recipes
+    print(f"{n:,} recipes, {args.repeat_share:.0%} of them repeats")
+
+    legacy = memory.Storage(tmp / "legacy.db")
+    legacy.execute(LEGACY_SCHEMA)
+    start = time.perf_counter()
+    for uid, recipe, prefs in recipes(n, args.repeat_share, args.seed):
+        legacy.enqueue(LEGACY_PUSH, (uid, recipe["title"], json.dumps(recipe), json.dumps(prefs, sort_keys=True)))
+    legacy.flush()
+    write_us = (time.perf_counter() - start) / n * 1e6
+
+    def legacy_scan():
+        after, count = 0, 0
+        while True:
+            rows = legacy.query(LEGACY_ITER, (after, 5000))
+            for row in rows:
+                json.loads(row[1])
+            count += len(rows)
+            if len(rows) < 5000:
+                return count
+            after = rows[-1][0]
+
+    lat = read_latency(n, lambda rid: json.loads(legacy.query(LEGACY_ITER, (rid - 1, 1))[0][1]), legacy_scan,
+                       args.reads, args.seed)
+    report("before", db_size(legacy), write_us, *lat)
+    legacy.close()
+
+    memory.DB = tmp / "chef.db"
+    memory.init_db()
+    store = memory.get_storage()
+    start = time.perf_counter()
+    for i, (uid, recipe, prefs) in enumerate(recipes(n, args.repeat_share, args.seed)):
+        memory.push_recipe(uid, recipe["title"], recipe, prefs)
+        if i == maintenance.DICT_SAMPLES:
+            # what the maintenance job does once enough recipes are stored
+            maintenance.train_dictionary()
+    store.flush()
+    write_us = (time.perf_counter() - start) / n * 1e6
+
+    def scan():
+        count = 0
+        for _, payload, _ in memory.iter_recipes():
+            json.loads(payload)
+            count += 1
+        return count
+
+    def point_read(rid):
+        # the query iter_recipes() pages with, without its flush of the write queue
+        _, payload, dict_id, data, _ = store.query(memory.SQL_ITER_RECIPES, (rid - 1, 1))[0]
+        return json.loads(payload if data is None else memory.decode_payload(dict_id, data))
+
+    lat = read_latency(n, point_read, scan, args.reads, args.seed)
+    size = db_size(store)
+    report("after", size, write_us, *lat)
+    blobs, blob_bytes = store.query("SELECT COUNT(*), SUM(LENGTH(data)) FROM recipe_blobs")[0]
+    print(f"  {blobs:,} distinct payloads for {n:,} recipes, {blob_bytes / blobs:,.0f} bytes each compressed "
+          f"(dictionary {memory.payload_codec().current})")
+
+    # spread created_at evenly over --span-days, oldest first, then apply retention
+    now = int(time.time())
+    step = args.span_days * 86400 / n
+    store.execute("UPDATE recipes SET created_at = ? - CAST((? - id) * ? AS INTEGER)", (now, n, step))
+    start = time.perf_counter()
+    moved = maintenance.archive_rows("recipes", now - int(args.retention_days * 86400))
+    took = time.perf_counter() - start
+    freed = 0
+    while True:
+        pages = maintenance.vacuum(100_000)
+        freed += pages
+        if not pages:
+            break
+    archives = list((tmp / "archive").glob("*.db"))
+    print(f"retention {args.retention_days:g} days: archived {moved:,} recipes in {took:.1f}s "
+          f"({moved / max(took, 1e-9):,.0f} rows/s) to {len(archives)} monthly files "
+          f"({sum(p.stat().st_size for p in archives) / 2**20:,.1f} MiB); vacuum freed {freed:,} pages, "
+          f"database now {db_size(store) / 2**20:,.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
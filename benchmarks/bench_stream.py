@@ -0,0 +1,56 @@
+"""
+bench_stream.py
+
+Time-to-first-content for recipe generation against the local fake OpenAI
+server: blocking generate() versus generate_stream().
+
+    python benchmarks/bench_stream.py --token-delay 0.01 --runs 5
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agents import recipe  # noqa: E402
+from benchmarks.fake_openai import FakeOpenAIServer  # noqa: E402
+from llm import LLMGateway  # noqa: E402
+from models import Preferences  # noqa: E402
+
+PREFS = Preferences(number_of_people=2, spice_level=5, region_preference="north", preference_type="none")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--token-delay", type=float, default=0.01)
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    server = FakeOpenAIServer(token_delay=args.token_delay).start()
+    recipe.gateway = LLMGateway(api_key="bench", base_url=server.base_url)
+
+    blocking, first, total = [], [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        recipe.generate(PREFS, use_cache=False)
+        blocking.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        seen_first = None
+        for kind, key, value in recipe.generate_stream(PREFS, use_cache=False):
+            if seen_first is None and kind != "done":
+                seen_first = time.perf_counter() - start
+        first.append(seen_first)
+        total.append(time.perf_counter() - start)
+    server.stop()
+
+    print(f"blocking generate, first content: {statistics.median(blocking) * 1000:,.0f} ms")
+    print(f"streaming, first field (title):   {statistics.median(first) * 1000:,.0f} ms")
+    print(f"streaming, complete recipe:       {statistics.median(total) * 1000:,.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
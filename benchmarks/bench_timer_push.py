@@ -0,0 +1,107 @@
+"""
+bench_timer_push.py
+
+DB queries per minute and timer-fire lag for many simulated sessions:
+3-second polling of fetch_due_timers (the old app.py loop) versus the
+push-based TimerService.
+
+    python benchmarks/bench_timer_push.py --sessions 200 --duration 10
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import memory  # noqa: E402
+import metrics  # noqa: E402
+
+
+def _db_ops() -> int:
+    return sum(metrics.histogram("chef_db_seconds", span=s).count
+               for s in ("db.claim_timers", "db.query", "db.execute"))
+
+
+def _schedule(sessions: int, duration: float, prefix: str):
+    rnd = random.Random(3)
+    now = time.time()
+    wakes = {}
+    for i in range(sessions):
+        uid = f"{prefix}{i}"
+        wake = int(now + rnd.uniform(1, duration - 2))
+        wakes[uid] = wake
+        memory.add_timer(uid, "simmer", wake)
+    return wakes
+
+
+def run_polling(sessions: int, duration: float, interval: float = 3.0):
+    wakes = _schedule(sessions, duration, "poll")
+    lags, before = [], _db_ops()
+    stop = time.time() + duration
+
+    # like the old app.py loop, every poll runs the claim query against the database
+    def session(uid):
+        # sessions start their poll cycles at different offsets, like real browsers
+        time.sleep(random.uniform(0, interval))
+        while time.time() < stop:
+            memory.get_storage().flush()
+            if memory.get_timer_scheduler()._claim(memory.SQL_USER_DUE_TIMERS, (uid, int(time.time()))):
+                lags.append(time.time() - wakes[uid])
+            time.sleep(interval)
+
+    threads = [threading.Thread(target=session, args=(u,)) for u in wakes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return (_db_ops() - before) / duration * 60, lags
+
+
+def run_push(sessions: int, duration: float):
+    from timer_service import TimerService
+    service = TimerService()
+    wakes = _schedule(sessions, duration, "push")
+    for uid in wakes:
+        service.watch(uid)
+    lags, before = [], _db_ops()
+    stop = time.time() + duration
+
+    def session(uid):
+        while time.time() < stop:
+            if service.wait(uid, timeout=min(1.0, max(0.01, stop - time.time()))):
+                lags.append(time.time() - wakes[uid])
+
+    threads = [threading.Thread(target=session, args=(u,)) for u in wakes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    service.stop()
+    return (_db_ops() - before) / duration * 60, lags
+
+
+def _report(name, qpm, lags):
+    lag = f"median lag {statistics.median(lags):.2f}s, max {max(lags):.2f}s" if lags else "no timers fired"
+    print(f"{name:<18} {qpm:10,.0f} DB queries/min, {len(lags)} fired, {lag}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=200)
+    ap.add_argument("--duration", type=float, default=10.0)
+    args = ap.parse_args()
+
+    memory.DB = Path(tempfile.mkdtemp()) / "bench.db"
+    memory.init_db()
+    _report("3s polling", *run_polling(args.sessions, args.duration))
+    _report("push service", *run_push(args.sessions, args.duration))
+
+
+if __name__ == "__main__":
+    main()
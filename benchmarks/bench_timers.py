@@ -0,0 +1,81 @@
+"""
+bench_timers.py
+
+Timer polling cost on a large timers table: the old unindexed global scan
+versus per-user fetching through the indexed TimerScheduler.
+
+    python benchmarks/bench_timers.py --rows 1000000 --users 10000
+"""
+
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import memory  # noqa: E402
+
+
+def _populate(path: str, rows: int, users: int, now: int):
+    conn = sqlite3.connect(path)
+    for stmt in memory.SCHEMA:
+        if "INDEX" not in stmt:
+            conn.execute(stmt)
+    rnd = random.Random(7)
+    data = (
+        (f"u{rnd.randrange(users)}", "timer", now + rnd.randrange(-86400, 86400), int(rnd.random() < 0.9))
+        for _ in range(rows)
+    )
+    conn.executemany("INSERT INTO timers(user_id,label,wake_at,fired) VALUES (?,?,?,?)", data)
+    conn.commit()
+    conn.close()
+
+
+def _time_polls(fn, polls: int) -> float:
+    start = time.perf_counter()
+    for i in range(polls):
+        fn(i)
+    return (time.perf_counter() - start) / polls * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--users", type=int, default=10_000)
+    ap.add_argument("--polls", type=int, default=200)
+    args = ap.parse_args()
+    now = int(time.time())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "timers.db")
+        _populate(path, args.rows, args.users, now)
+
+        conn = sqlite3.connect(path)
+        scan = _time_polls(lambda i: conn.execute(memory.SQL_DUE_TIMERS, (now - 86400 - i,)).fetchall(), args.polls)
+        conn.close()
+        print(f"unindexed global scan:  {scan:,.1f} us/poll")
+
+        store = memory.Storage(path)
+        with store.connection() as c:
+            for stmt in memory.SCHEMA + [memory.SQL_INDEX_FIRED_TIMERS]:
+                c.execute(stmt)
+            c.commit()
+        sched = memory.TimerScheduler(store)
+        # one cold poll per user seeds the heap from the index
+        cold = _time_polls(lambda i: sched.fetch_due(f"u{i % args.users}", now - 86400), args.polls)
+        print(f"indexed per-user (cold): {cold:,.1f} us/poll")
+        warm = _time_polls(lambda i: sched.fetch_due(f"u{i % args.users}", now - 86400), args.polls)
+        print(f"heap skip (warm):        {warm:,.1f} us/poll")
+        # what an hourly maintenance pass deletes: the fired rows of the oldest hour
+        start = time.perf_counter()
+        deleted = sched.compact(now - 86400 + 3600)
+        print(f"compaction of one hour of fired rows: {deleted:,} rows in {time.perf_counter() - start:,.3f} s")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+fake_openai.py
+
+A local OpenAI-compatible HTTP server for benchmarks. POST /v1/chat/completions
+answers with a canned recipe, either as one JSON body or as a server-sent-event
+stream of small chunks, sleeping `token_delay` seconds per chunk to mimic
+generation speed. `fail_rate` answers that share of requests with a 500 and
+`slow_rate` delays that share by `slow_delay` seconds, to exercise retries and
+hedging.
+
+    server = FakeOpenAIServer(token_delay=0.01).start()
+    client = OpenAI(api_key="x", base_url=server.base_url)
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RECIPE = {
+    "title": "Paneer Butter Masala",
+    "cultural_note": "A Punjabi classic with a nod to Italian tomato sauces.",
+    "ingredients": ["Paneer 250g", "Tomatoes 400g", "Butter 2 tbsp", "Cream 100ml", "Garam masala 1 tsp"],
+    "steps": [
+        {"text": "Cube the paneer."},
+        {"text": "Melt butter and cook tomatoes.", "timer_sec": 300, "timer_label": "tomato base"},
+        {"text": "Blend, add cream and paneer, simmer.", "timer_sec": 240, "timer_label": "simmer"},
+    ],
+    "tips": ["Soak paneer in warm water to soften it"],
+}
+
+
+class FakeOpenAIServer:
+    def __init__(self, token_delay: float = 0.01, chunk_chars: int = 4, content: str = None, port: int = 0,
+                 fail_rate: float = 0.0, slow_rate: float = 0.0, slow_delay: float = 1.0, seed: int = 0):
+        self.token_delay = token_delay
+        self.fail_rate = fail_rate
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self._rng = random.Random(seed)
+        self.chunk_chars = chunk_chars
+        self.content = content if content is not None else json.dumps(RECIPE)
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests += 1
+                roll_fail, roll_slow = server._rng.random(), server._rng.random()
+                if roll_fail < server.fail_rate:
+                    payload = json.dumps({"error": {"message": "injected failure", "type": "server_error"}})
+                    self.send_response(500)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload.encode("utf-8"))
+                    return
+                if roll_slow < server.slow_rate:
+                    time.sleep(server.slow_delay)
+                chunks = [server.content[i:i + server.chunk_chars]
+                          for i in range(0, len(server.content), server.chunk_chars)]
+                usage = {"prompt_tokens": 200, "completion_tokens": len(chunks), "total_tokens": 200 + len(chunks)}
+                if body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for c in chunks:
+                        time.sleep(server.token_delay)
+                        self._chunk({"id": "fake", "object": "chat.completion.chunk", "created": 0,
+                                     "model": body.get("model", "fake"),
+                                     "choices": [{"index": 0, "delta": {"content": c}, "finish_reason": None}]})
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                    return
+                time.sleep(server.token_delay * len(chunks))
+                payload = json.dumps({
+                    "id": "fake", "object": "chat.completion", "created": 0, "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": server.content}}],
+                    "usage": usage,
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _chunk(self, obj):
+                self._write_chunk(b"data: " + json.dumps(obj).encode("utf-8") + b"\n\n")
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
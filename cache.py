@@ -0,0 +1,173 @@
+"""
+cache.py
+
+Content-addressed caching for LLM recipe generations.
+
+A recipe request is keyed on a canonical hash of the Preferences plus the prompt
+and model version, so identical requests from different users share one
+generation. Lookups go through an in-memory LRU tier with a TTL and then a
+persistent tier stored in the SQLite DB (see memory.py). Entries loaded from
+the DB keep their stored age, and keys the DB does not have are remembered
+for a short while so repeated misses do not query it each time. Lookups and
+evictions are counted in chef_recipe_cache_total{result=hit|miss|evict}.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import memory
+from metrics import inc
+
+# seconds a persistent-tier miss is remembered
+NEGATIVE_TTL = 60.0
+
+
+def canonical_prefs(prefs) -> Dict[str, Any]:
+    """Preferences (Pydantic model or dict) as a dict with order-insensitive lists."""
+    p = prefs.dict() if hasattr(prefs, "dict") else dict(prefs)
+    for k in ("allergies", "dislikes"):
+        p[k] = sorted({str(v).strip().lower() for v in (p.get(k) or []) if str(v).strip()})
+    if isinstance(p.get("region_preference"), str):
+        p["region_preference"] = p["region_preference"].strip().lower()
+    return p
+
+
+def cache_key(prefs, version: str) -> str:
+    blob = json.dumps({"v": version, "p": canonical_prefs(prefs)}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    LRUCache: a thread-safe ordered-dict LRU with a per-entry TTL.
+    Values are stored with their insertion time; stale entries count as misses.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0, clock: Callable[[], float] = time.time,
+                 on_evict: Optional[Callable[[], None]] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.on_evict = on_evict
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _evicted(self) -> None:
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if self.ttl and self.clock() - stored_at > self.ttl:
+                del self._data[key]
+                self._evicted()
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any, stored_at: Optional[float] = None) -> None:
+        """Store `value`; `stored_at` (default now) is when it was created, for the TTL."""
+        with self._lock:
+            self._data[key] = (self.clock() if stored_at is None else stored_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._evicted()
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RecipeCache:
+    """
+    RecipeCache: two-tier cache of recipe payloads keyed by cache_key().
+
+    Each key holds up to `variants` distinct recipes. While a key has fewer than
+    that many, lookups report a miss so the caller generates another one; after
+    that, lookups serve a random stored variant so repeat users do not always
+    see the same dish. With `rating(recipe) -> score or None` (1-5), variants
+    are drawn in proportion to their feedback, unrated ones as if rated 3.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 7 * 24 * 3600, variants: int = 1,
+                 persistent: bool = True, clock: Callable[[], float] = time.time,
+                 rating: Optional[Callable[[Dict[str, Any]], Optional[float]]] = None,
+                 negative_ttl: float = NEGATIVE_TTL):
+        self.variants = max(1, variants)
+        self.rating = rating
+        self.persistent = persistent
+        self.clock = clock
+        self.ttl = ttl
+        # key -> (created_at of the oldest variant, [variants])
+        self._lru = LRUCache(max_size=max_size, ttl=ttl, clock=clock,
+                             on_evict=lambda: inc("chef_recipe_cache_total", result="evict"))
+        # keys the persistent tier had nothing for; short-lived, since other workers may store them
+        self._absent = LRUCache(max_size=max_size, ttl=negative_ttl, clock=clock)
+        self._rnd = random.Random()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, key: str) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+        entry = self._lru.get(key)
+        if entry is not None or not self.persistent or self._absent.get(key) is not None:
+            return entry
+        min_created = int(self.clock() - self.ttl) if self.ttl else 0
+        rows = memory.load_cached_recipes(key, min_created)
+        if not rows:
+            self._absent.put(key, True)
+            return None
+        # the key expires with its oldest variant, as it would in the DB
+        entry = (min(created for created, _ in rows), [recipe for _, recipe in rows])
+        self._lru.put(key, entry, stored_at=entry[0])
+        return entry
+
+    def _load(self, key: str) -> List[Dict[str, Any]]:
+        entry = self._entry(key)
+        return entry[1] if entry is not None else []
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        found = self._load(key)
+        with self._lock:
+            if len(found) < self.variants:
+                self.misses += 1
+                inc("chef_recipe_cache_total", result="miss")
+                return None
+            self.hits += 1
+        inc("chef_recipe_cache_total", result="hit")
+        if self.rating is not None and len(found) > 1:
+            # a variant rated 1 is almost never served, one rated 5 twice as often as an unrated one
+            weights = [max(0.1, (self.rating(r) or 3.0) - 1.0) for r in found]
+            return self._rnd.choices(found, weights)[0]
+        return self._rnd.choice(found)
+
+    def put(self, key: str, recipe: Dict[str, Any]) -> None:
+        entry = self._entry(key)
+        found = list(entry[1]) if entry is not None else []
+        if len(found) >= self.variants:
+            return
+        now = self.clock()
+        found.append(recipe)
+        oldest = entry[0] if entry is not None else now
+        self._lru.put(key, (oldest, found), stored_at=oldest)
+        self._absent.discard(key)
+        if self.persistent:
+            memory.store_cached_recipe(key, len(found) - 1, recipe, int(now))
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self._lru.evictions, "size": len(self._lru)}
@@ -0,0 +1,413 @@
+"""
+catalog.py
+
+Offline recipe catalog built from the recipes the app has already generated.
+
+Every recipe gets a document id; the catalog keeps an inverted index from
+normalized ingredient tokens, region, spice level, preference type and "has
+a timer step" to the recipes carrying them. Per document it keeps only the
+recipes-table row id and the servings; a hit's payload is read back from the
+table. Posting lists are Python ints used as bitsets, so
+excluding every recipe that contains an allergen, or restricting to a region,
+is a single AND/OR over 100k bits rather than a scan.
+
+match() walks candidates tier by tier (own region first, then recipes of
+unknown region; nearest spice level and same preference type first) and
+stops at the first tier with results, so a lookup costs a handful of big-int
+operations. Recipes scoring
+below `min_score` are not served and the caller falls back to the LLM.
+
+Feedback ranks recipes within a tier: well-rated recipes (ratings.py) come
+first and recipes rated at or below DISLIKED_SCORE are not served at all.
+Both sets are bitsets too, rebuilt when the ratings change.
+
+The process-wide catalog is built, and refreshed, by a background thread;
+lookup() misses until the first build is done rather than waiting for it.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import memory
+import quantities
+import ratings
+from cache import canonical_prefs
+from metrics import inc, span
+
+_WORD_RE = re.compile(r"[a-z]+")
+
+# words in ingredient lines that are not ingredients
+_STOPWORDS = {
+    "a", "an", "and", "as", "at", "for", "from", "in", "into", "of", "on", "or", "the", "to", "with",
+    "g", "gm", "gms", "gram", "grams", "kg", "ml", "l", "litre", "liter", "tbsp", "tsp", "tablespoon",
+    "teaspoon", "cup", "cups", "pinch", "handful", "piece", "pieces", "clove", "cloves", "inch", "bunch",
+    "small", "medium", "large", "fresh", "chopped", "sliced", "diced", "minced", "grated", "ground",
+    "finely", "roughly", "taste", "optional", "few", "some", "whole", "halved", "cubed", "about",
+}
+
+# spelling variants and regional names mapped to one token
+ALIASES = {
+    "chili": "chilli", "chile": "chilli", "cilantro": "coriander", "dhania": "coriander",
+    "curd": "yogurt", "dahi": "yogurt", "yoghurt": "yogurt", "groundnut": "peanut", "prawn": "shrimp",
+    "aubergine": "brinjal", "eggplant": "brinjal", "baingan": "brinjal", "capsicum": "pepper",
+    "atta": "wheat", "maida": "flour", "jeera": "cumin", "haldi": "turmeric", "aloo": "potato",
+    "gobi": "cauliflower", "palak": "spinach", "methi": "fenugreek", "besan": "chickpea",
+}
+
+# allergy names that stand for a family of ingredients
+ALLERGEN_GROUPS = {
+    "dairy": {"milk", "butter", "ghee", "cream", "paneer", "cheese", "yogurt", "khoya", "lactose"},
+    "lactose": {"milk", "butter", "cream", "paneer", "cheese", "yogurt", "khoya"},
+    "nut": {"almond", "cashew", "peanut", "walnut", "pistachio", "hazelnut", "pecan"},
+    "gluten": {"wheat", "flour", "bread", "pasta", "semolina", "suji", "rava", "barley", "noodle"},
+    "shellfish": {"shrimp", "crab", "lobster", "mussel", "clam", "oyster", "scallop"},
+    "seafood": {"fish", "shrimp", "crab", "lobster", "mussel", "clam", "oyster", "scallop", "squid"},
+    "egg": {"egg", "mayonnaise"},
+    "soy": {"soy", "tofu", "soya"},
+    "meat": {"chicken", "mutton", "lamb", "beef", "pork", "goat", "fish", "shrimp"},
+}
+
+SPICE_LEVELS = 11
+# score lost by a recipe generated for another preference type (dietary, cuisine, ...)
+PREFERENCE_TYPE_PENALTY = 0.1
+# well-rated candidates looked at per tier before falling back to the rest
+RANK_POOL = 64
+
+
+def _singular(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def _normal_word(word: str) -> Optional[str]:
+    if word in _STOPWORDS:
+        return None
+    word = ALIASES.get(word) or ALIASES.get(_singular(word), _singular(word))
+    return None if word in _STOPWORDS else word
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Ingredient tokens of a free-text line: lowercased, singular, aliases applied, quantities dropped."""
+    return [w for w in map(_normal_word, _WORD_RE.findall(text.lower())) if w]
+
+
+def recipe_tokens(recipe: Dict[str, Any]) -> Set[str]:
+    """Tokens an allergy or dislike is checked against: ingredients plus step text."""
+    tokens: Set[str] = set()
+    for line in recipe.get("ingredients") or []:
+        tokens.update(normalize_tokens(str(line)))
+    for step in recipe.get("steps") or []:
+        tokens.update(normalize_tokens(str(step.get("text", "") if isinstance(step, dict) else step)))
+    return tokens
+
+
+def recipe_key(recipe: Dict[str, Any], tokens: Optional[Set[str]] = None) -> str:
+    """
+    Stable id of a recipe: title plus ingredient/step tokens. Quantities are
+    not tokens, so a rescaled copy keeps the key; feedback is stored under it.
+    """
+    tokens = recipe_tokens(recipe) if tokens is None else tokens
+    return hashlib.sha1(json.dumps(
+        [str(recipe.get("title", "")).strip().lower(), sorted(tokens)]).encode("utf-8")).hexdigest()
+
+
+def _preference_type(prefs: Dict[str, Any]) -> Optional[str]:
+    ptype = str(prefs.get("preference_type") or "").strip().lower()
+    return None if ptype in ("", "none") else ptype
+
+
+def _mask_of(docs: Iterable[int], size: int) -> int:
+    buf = bytearray((size + 7) // 8)
+    for d in docs:
+        buf[d >> 3] |= 1 << (d & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _bits(mask: int, limit: int) -> List[int]:
+    """Up to `limit` set bit positions of mask, highest (newest) first."""
+    out = []
+    while mask and len(out) < limit:
+        top = mask.bit_length() - 1
+        out.append(top)
+        mask ^= 1 << top
+    return out
+
+
+class RecipeCatalog:
+    def __init__(self, min_score: float = 0.8, max_spice_delta: int = 2):
+        self.min_score = min_score
+        self.max_spice_delta = max_spice_delta
+        # doc id -> recipes-table row id, and the servings its quantities are for (0: unknown)
+        self._docs = array("q")
+        self._servings = array("H")
+        # recipe_key -> doc id
+        self._doc_of: Dict[str, int] = {}
+        # feedback: rating per doc and the liked / disliked docs as bitsets
+        self._doc_score: Dict[int, float] = {}
+        self._liked = 0
+        self._disliked = 0
+        self._rated = (-1, -1)
+        # posting key -> bitset of doc ids; keys are ("tok", token), ("region", r),
+        # ("spice", level or None) and ("timer",)
+        self._masks: Dict[tuple, int] = {}
+        # doc ids added since the bitsets were last built
+        self._pending: Dict[tuple, List[int]] = {}
+        self._lock = threading.Lock()
+        self.last_id = 0
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, rid: int, recipe: Dict[str, Any], prefs: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """Index one stored recipe (row `rid`); returns its doc id, or None if it is a duplicate or unusable."""
+        if not isinstance(recipe, dict) or not recipe.get("steps"):
+            return None
+        tokens = recipe_tokens(recipe)
+        key = recipe_key(recipe, tokens)
+        region = spice = ptype = None
+        if prefs:
+            region = str(prefs.get("region_preference") or "").strip().lower() or None
+            try:
+                spice = min(SPICE_LEVELS - 1, max(0, int(prefs.get("spice_level"))))
+            except (TypeError, ValueError):
+                spice = None
+            ptype = _preference_type(prefs)
+        has_timer = any(isinstance(s, dict) and s.get("timer_sec") for s in recipe["steps"])
+        # who the quantities were for, so hits can be rescaled
+        try:
+            servings = int(recipe.get("servings") or (prefs or {}).get("number_of_people") or 0)
+        except (TypeError, ValueError):
+            servings = 0
+        with self._lock:
+            if key in self._doc_of:
+                return None
+            doc = len(self._docs)
+            self._doc_of[key] = doc
+            self._docs.append(rid)
+            self._servings.append(min(max(servings, 0), 0xFFFF))
+            keys = [("tok", t) for t in tokens] + [("region", region), ("spice", spice), ("ptype", ptype)]
+            if has_timer:
+                keys.append(("timer",))
+            for key in keys:
+                self._pending.setdefault(key, []).append(doc)
+        return doc
+
+    def _build(self) -> None:
+        # OR-ing one bit at a time into a 100k-bit int is O(n) per add, so new
+        # postings are batched and each bitset is rebuilt once from a byte array
+        with self._lock:
+            for key, docs in self._pending.items():
+                self._masks[key] = self._masks.get(key, 0) | _mask_of(docs, len(self._docs))
+            self._pending = {}
+
+    def _mask(self, *key) -> int:
+        return self._masks.get(key, 0)
+
+    def ingest(self, rows: Iterable[Tuple[int, str, Optional[str]]]) -> int:
+        """Index raw (id, payload_json, prefs_json) rows as returned by memory.iter_recipes()."""
+        added = 0
+        for rid, payload, prefs in rows:
+            try:
+                recipe = json.loads(payload)
+                prefs = json.loads(prefs) if prefs else None
+            except (TypeError, ValueError):
+                continue
+            if self.add(rid, recipe, prefs) is not None:
+                added += 1
+            self.last_id = max(self.last_id, rid)
+        return added
+
+    def rate(self, scores: Dict[str, float]) -> None:
+        """Apply feedback scores keyed by recipe_key()."""
+        doc_score = {self._doc_of[k]: s for k, s in scores.items() if k in self._doc_of}
+        liked = _mask_of((d for d, s in doc_score.items() if s >= ratings.LIKED_SCORE), len(self._docs))
+        disliked = _mask_of((d for d, s in doc_score.items() if s <= ratings.DISLIKED_SCORE), len(self._docs))
+        with self._lock:
+            self._doc_score, self._liked, self._disliked = doc_score, liked, disliked
+
+    def refresh(self) -> int:
+        """Pick up recipes stored, and feedback given, since the last refresh."""
+        with span("catalog.refresh", metric="chef_db_seconds"):
+            added = self.ingest(memory.iter_recipes(self.last_id))
+            self._build()
+            rated = ratings.get_ratings()
+            # scores only need re-applying when either side changed
+            if (len(self._docs), rated.version) != self._rated:
+                self.rate(rated.scores("recipe"))
+                self._rated = (len(self._docs), rated.version)
+        self.refreshed_at = time.time()
+        return added
+
+    def _ranked(self, mask: int, limit: int) -> List[int]:
+        """Up to `limit` docs of mask: liked ones best-rated first, then the rest newest first."""
+        liked = _bits(mask & self._liked, RANK_POOL)
+        liked.sort(key=lambda d: self._doc_score[d], reverse=True)
+        docs = liked[:limit]
+        if len(docs) < limit:
+            docs += _bits(mask & ~self._liked, limit - len(docs))
+        return docs
+
+    def _excluded(self, terms: Iterable[str]) -> int:
+        mask = 0
+        for term in terms:
+            toks = normalize_tokens(str(term))
+            if not toks:
+                continue
+            if len(toks) == 1 and toks[0] in ALLERGEN_GROUPS:
+                for member in ALLERGEN_GROUPS[toks[0]] | {toks[0]}:
+                    mask |= self._mask("tok", member)
+                continue
+            # a phrase ("peanut butter") excludes recipes containing all of its words
+            hit = self._mask("tok", toks[0])
+            for t in toks[1:]:
+                hit &= self._mask("tok", t)
+            mask |= hit
+        return mask
+
+    def match(self, prefs, k: int = 5, min_score: Optional[float] = None) -> List[Tuple[float, int]]:
+        """
+        Up to k (score, doc id) pairs for `prefs`, best first, none of them
+        below min_score. Recipes added since the last refresh() are not seen.
+        """
+        min_score = self.min_score if min_score is None else min_score
+        p = canonical_prefs(prefs)
+        allowed = self._mask("timer") & ~self._excluded(p.get("allergies", []) + p.get("dislikes", [])) \
+            & ~self._disliked
+        if not allowed:
+            return []
+        region = p.get("region_preference")
+        try:
+            spice = min(SPICE_LEVELS - 1, max(0, int(p.get("spice_level"))))
+        except (TypeError, ValueError):
+            spice = None
+        ptype = _preference_type(p)
+        # (mask, penalty): the requested preference type, then the others
+        ptypes = [(self._mask("ptype", ptype), 0.0), (~self._mask("ptype", ptype), PREFERENCE_TYPE_PENALTY)] \
+            if ptype else [(-1, 0.0)]
+        results: List[Tuple[float, int]] = []
+        # (region mask, score penalty): own region, then recipes whose region is unknown
+        for region_mask, penalty in ((self._mask("region", region), 0.0), (self._mask("region", None), 0.2)):
+            pool = allowed & region_mask
+            if not pool:
+                continue
+            spices = [(self._mask("spice", None), 0.15)]
+            if spice is not None:
+                spices = [(self._mask("spice", lvl), 0.1 * abs(lvl - spice))
+                          for d in range(self.max_spice_delta + 1)
+                          for lvl in sorted({spice - d, spice + d}) if 0 <= lvl < SPICE_LEVELS] + spices
+            tiers = sorted(((spice_mask & ptype_mask, spice_penalty + ptype_penalty)
+                            for spice_mask, spice_penalty in spices for ptype_mask, ptype_penalty in ptypes),
+                           key=lambda t: t[1])
+            for tier_mask, tier_penalty in tiers:
+                score = 1.0 - penalty - tier_penalty
+                if score < min_score:
+                    break
+                for doc in self._ranked(pool & tier_mask, k - len(results)):
+                    results.append((round(score, 3), doc))
+                if len(results) >= k:
+                    return results
+        return results
+
+    def recipe(self, doc: int) -> Optional[Dict[str, Any]]:
+        """A doc's recipe, read from the recipes table; None if the row is gone (archived)."""
+        recipe = memory.load_recipe(self._docs[doc])
+        if recipe is not None and self._servings[doc] and not recipe.get("servings"):
+            recipe["servings"] = self._servings[doc]
+        return recipe
+
+    def best(self, prefs, min_score: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """The best matching recipe still stored, or None when nothing scores min_score."""
+        for _score, doc in self.match(prefs, k=3, min_score=min_score):
+            recipe = self.recipe(doc)
+            if recipe is not None:
+                return recipe
+        return None
+
+
+CATALOG_ENABLED = os.getenv("RECIPE_CATALOG", "1") == "1"
+CATALOG_REFRESH_SEC = float(os.getenv("RECIPE_CATALOG_REFRESH_SEC") or 60)
+
+_catalog: Optional[RecipeCatalog] = None
+_builder: Optional[threading.Thread] = None
+_catalog_lock = threading.Lock()
+_ready = threading.Event()
+
+
+def _build_and_refresh() -> None:
+    global _catalog
+    cat = RecipeCatalog(min_score=float(os.getenv("RECIPE_CATALOG_MIN_SCORE") or 0.8))
+    while True:
+        try:
+            cat.refresh()
+            _catalog = cat
+            _ready.set()
+        except Exception:
+            # a DB problem only delays the catalog; the next round tries again
+            inc("chef_catalog_refresh_errors_total")
+        time.sleep(CATALOG_REFRESH_SEC)
+
+
+def start() -> None:
+    """Start building the process-wide catalog in the background (once per process)."""
+    global _builder
+    with _catalog_lock:
+        if _builder is None:
+            _builder = threading.Thread(target=_build_and_refresh, name="catalog", daemon=True)
+            _builder.start()
+
+
+def wait_ready(timeout: Optional[float] = None) -> bool:
+    """Block until the first background load is done (e.g. in benchmarks); False on timeout."""
+    start()
+    return _ready.wait(timeout)
+
+
+def get_catalog() -> Optional[RecipeCatalog]:
+    """
+    The process-wide catalog, loaded from the recipes table and refreshed
+    every CATALOG_REFRESH_SEC by a background thread; None until the first
+    load is done.
+    """
+    if _builder is None:
+        start()
+    return _catalog
+
+
+def lookup(prefs, min_score: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Catalog recipe for `prefs` if catalog serving is enabled and one matches
+    well enough (the catalog's min_score unless given), with quantities
+    rescaled to the requested number_of_people.
+    """
+    if not CATALOG_ENABLED:
+        return None
+    cat = get_catalog()
+    if cat is None:
+        inc("chef_catalog_lookups_total", result="loading")
+        return None
+    try:
+        with span("catalog"):
+            recipe = cat.best(prefs, min_score)
+    except sqlite3.Error:
+        # the catalog is an optimization; a DB problem must not block generation
+        recipe = None
+    people = canonical_prefs(prefs).get("number_of_people")
+    if recipe is not None and people and recipe.get("servings") and recipe["servings"] != people:
+        recipe = quantities.scale_recipe(recipe, people)
+    inc("chef_catalog_lookups_total", result="hit" if recipe is not None else "miss")
+    return recipe
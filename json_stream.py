@@ -0,0 +1,127 @@
+"""
+json_stream.py
+
+Incremental parser for a single JSON object that arrives in chunks (e.g. a
+streamed LLM completion). It reports each top-level field as soon as its value
+is complete, and each element of a top-level array as soon as that element is
+complete, so callers can render a recipe before the whole reply has arrived.
+Any text before the first '{' (such as a markdown code fence) is ignored.
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+# (kind, key, value) where kind is "field" for a completed top-level value and
+# "item" for a completed element of a top-level array
+Event = Tuple[str, str, Any]
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self.buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._str_start = -1
+        self._key: Optional[str] = None
+        self._awaiting_value = False
+        self._val_start: Optional[int] = None
+        self._in_top_array = False
+        self._elem_start: Optional[int] = None
+        self.done = False
+
+    @property
+    def text(self) -> str:
+        return self.buf
+
+    def feed(self, chunk: str) -> List[Event]:
+        self.buf += chunk
+        events: List[Event] = []
+        buf = self.buf
+        i = self._pos
+        n = len(buf)
+        while i < n and not self.done:
+            c = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    self._close_string(i, events)
+                i += 1
+                continue
+            if self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+                i += 1
+                continue
+            if c == '"':
+                self._in_str = True
+                self._str_start = i
+                self._mark_value_start(i)
+            elif c in "{[":
+                self._mark_value_start(i)
+                self._depth += 1
+                if self._depth == 2 and c == "[":
+                    self._in_top_array = True
+                    self._elem_start = None
+            elif c in "}]":
+                if self._depth == 2 and self._in_top_array:
+                    self._finish_elem(i, events)
+                    self._in_top_array = False
+                self._depth -= 1
+                if self._depth == 1:
+                    self._finish_value(i + 1, events)
+                elif self._depth == 0:
+                    self._finish_value(i, events)
+                    self.done = True
+            elif c == ",":
+                if self._depth == 1:
+                    self._finish_value(i, events)
+                elif self._depth == 2 and self._in_top_array:
+                    self._finish_elem(i, events)
+            elif c == ":":
+                if self._depth == 1:
+                    self._awaiting_value = True
+            elif not c.isspace():
+                self._mark_value_start(i)
+            i += 1
+        self._pos = i
+        return events
+
+    def _mark_value_start(self, i: int) -> None:
+        if self._depth == 1 and self._awaiting_value and self._val_start is None:
+            self._val_start = i
+        elif self._depth == 2 and self._in_top_array and self._elem_start is None:
+            self._elem_start = i
+
+    def _close_string(self, i: int, events: List[Event]) -> None:
+        if self._depth == 1:
+            if not self._awaiting_value:
+                self._key = json.loads(self.buf[self._str_start:i + 1])
+            elif self._val_start == self._str_start:
+                # string values are complete at their closing quote
+                self._finish_value(i + 1, events)
+        elif self._depth == 2 and self._in_top_array and self._elem_start == self._str_start:
+            self._finish_elem(i + 1, events)
+
+    def _finish_value(self, end: int, events: List[Event]) -> None:
+        if self._val_start is not None and self._key is not None:
+            try:
+                events.append(("field", self._key, json.loads(self.buf[self._val_start:end])))
+            except ValueError:
+                pass
+        self._val_start = None
+        self._awaiting_value = False
+        self._key = None
+
+    def _finish_elem(self, end: int, events: List[Event]) -> None:
+        if self._elem_start is not None and self._key is not None:
+            try:
+                events.append(("item", self._key, json.loads(self.buf[self._elem_start:end])))
+            except ValueError:
+                pass
+        self._elem_start = None
@@ -6,20 +6,61 @@ It provides Node and Graph primitives similar to many workflow SDKs.
 Replace this module with a real LangGraph SDK adapter when porting.
 """
 
-from typing import Callable, Dict, Optional, Any, Tuple
+import asyncio
+import contextvars
+import copy
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Any, Tuple
+
+from metrics import span
+
+_listener: contextvars.ContextVar = contextvars.ContextVar("listener", default=None)
+
+
+def emit(kind: str, key: str, value: Any):
+    """
+    Push a partial-output event to the listener passed to Graph.run_once(on_event=...).
+    Nodes call this while they work (e.g. streamed recipe fields); it is a no-op
+    when nobody is listening.
+    """
+    listener = _listener.get()
+    if listener is not None:
+        listener(kind, key, value)
 
 
 class Node:
     """
     Node: wrap an action function. The action function receives (ctx, input_text)
     and returns a tuple: (output_text, next_node_key (optional), updated_data (optional dict))
+    `timeout` (seconds) is only enforced by AsyncGraph.
     """
-    def __init__(self, key: str, action: Callable[[Dict[str, Any], str], Tuple[str, Optional[str], Dict[str, Any]]]):
+    def __init__(self, key: str, action: Callable[[Dict[str, Any], str], Tuple[str, Optional[str], Dict[str, Any]]],
+                 timeout: Optional[float] = None):
         self.key = key
         self._action = action
+        self.timeout = timeout
 
     def run(self, ctx: Dict[str, Any], message: str):
-        return self._action(ctx, message)
+        with span(self.key, metric="chef_node_seconds", label="node"):
+            return self._action(ctx, message)
+
+
+class AsyncNode(Node):
+    """
+    AsyncNode: like Node, but the action is a coroutine function returning the
+    same (output_text, next_node_key, updated_data) tuple.
+    """
+    def __init__(self, key: str, action: Callable[[Dict[str, Any], str], Awaitable[Tuple[str, Optional[str], Dict[str, Any]]]],
+                 timeout: Optional[float] = None):
+        super().__init__(key, action, timeout)
+
+    def run(self, ctx: Dict[str, Any], message: str):
+        return asyncio.run(self.arun(ctx, message))
+
+    async def arun(self, ctx: Dict[str, Any], message: str):
+        with span(self.key, metric="chef_node_seconds", label="node"):
+            return await self._action(ctx, message)
 
 
 class Graph:
@@ -38,25 +79,49 @@ class Graph:
     def set_supervisor(self, key: str):
         self.supervisor_key = key
 
-    def run_once(self, ctx: Dict[str, Any], message: str):
+    def run_once(self, ctx: Dict[str, Any], message: str,
+                 on_event: Optional[Callable[[str, str, Any], None]] = None, node_key: Optional[str] = None):
         """
         Execute the supervisor to decide which node to run, then run it.
         Supervisor node should return (node_to_call, None, optional)
+        on_event, if given, receives the partial-output events nodes emit().
+        node_key, if given, is run without asking the supervisor (see route()).
         """
+        token = _listener.set(on_event)
+        try:
+            with span("turn", metric="chef_turn_seconds"):
+                return self._run_once(ctx, message, node_key)
+        finally:
+            _listener.reset(token)
+
+    def route(self, ctx: Dict[str, Any], message: str) -> str:
+        """The node the supervisor picks for this message, without running it."""
+        return self._route(ctx, self._supervisor().run(ctx, message))
+
+    def _run_once(self, ctx: Dict[str, Any], message: str, node_key: Optional[str] = None):
+        if node_key is None:
+            node_key = self.route(ctx, message)
+        node = self.nodes.get(node_key)
+        if not node:
+            return f"Node '{node_key}' not found.", ctx
+        return self._apply(ctx, node.run(ctx, message))
+
+    def _supervisor(self) -> Node:
         if not self.supervisor_key:
             raise RuntimeError("Supervisor not set on graph.")
-        # Supervisor decides
-        sup = self.nodes[self.supervisor_key]
-        sup_out_text, sup_next, sup_data = sup.run(ctx, message)
+        return self.nodes[self.supervisor_key]
+
+    def _route(self, ctx: Dict[str, Any], sup_result) -> str:
         # Supervisor's sup_out_text is debug / not shown; sup_next is node key
+        sup_out_text, sup_next, sup_data = sup_result
         node_key = sup_next
         if not node_key:
             # default to fallback
             node_key = ctx.get("_fallback_node", "regular_chat")
-        node = self.nodes.get(node_key)
-        if not node:
-            return f"Node '{node_key}' not found.", ctx
-        out_text, next_node, data = node.run(ctx, message)
+        return node_key
+
+    def _apply(self, ctx: Dict[str, Any], result):
+        out_text, next_node, data = result
         # update context
         if data:
             ctx.update(data)
@@ -64,3 +129,73 @@ class Graph:
         if next_node:
             ctx['_next_node'] = next_node
         return out_text, ctx
+
+
+class AsyncGraph(Graph):
+    """
+    AsyncGraph: the same routing as Graph, driven from an event loop so one
+    process can serve many conversations concurrently.
+
+    Coroutine nodes (AsyncNode, or any Node whose action is a coroutine function)
+    are awaited directly; plain sync nodes run in a thread pool so they do not
+    block the loop. A node's `timeout` (or the graph's `default_timeout`) bounds
+    its run: coroutine nodes are cancelled, sync nodes are abandoned (the thread
+    finishes in the background, on a copy of ctx that is then dropped) and the
+    turn answers with `timeout_text`.
+    """
+
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None, default_timeout: Optional[float] = None,
+                 timeout_text: str = "Sorry, that took too long. Please try again."):
+        super().__init__()
+        self.executor = executor or ThreadPoolExecutor(max_workers=32, thread_name_prefix="graph-node")
+        self.default_timeout = default_timeout
+        self.timeout_text = timeout_text
+
+    def _start(self, node: Node, ctx: Dict[str, Any], message: str) -> Awaitable:
+        if isinstance(node, AsyncNode):
+            return node.arun(ctx, message)
+        if inspect.iscoroutinefunction(node._action):
+            return AsyncNode.arun(node, ctx, message)
+        loop = asyncio.get_running_loop()
+        # copy the context so emit() reaches the listener from the worker thread
+        call = contextvars.copy_context().run
+        return loop.run_in_executor(self.executor, call, node.run, ctx, message)
+
+    async def _arun_node(self, node: Node, ctx: Dict[str, Any], message: str):
+        timeout = node.timeout if node.timeout is not None else self.default_timeout
+        if timeout is None:
+            return await self._start(node, ctx, message)
+        # an abandoned sync node keeps running in its thread: it works on a copy,
+        # merged back only when it finishes in time
+        work = copy.deepcopy(ctx)
+        result = await asyncio.wait_for(self._start(node, work, message), timeout)
+        # key by key, so ctx may be a dict or a session.SessionState
+        for key in [k for k in ctx.keys() if k not in work]:
+            ctx.pop(key)
+        ctx.update(work)
+        return result
+
+    async def arun_once(self, ctx: Dict[str, Any], message: str,
+                        on_event: Optional[Callable[[str, str, Any], None]] = None):
+        """Async counterpart of run_once()."""
+        token = _listener.set(on_event)
+        try:
+            with span("turn", metric="chef_turn_seconds"):
+                return await self._arun_once(ctx, message)
+        finally:
+            _listener.reset(token)
+
+    async def _arun_once(self, ctx: Dict[str, Any], message: str):
+        sup = self._supervisor()
+        try:
+            node_key = self._route(ctx, await self._arun_node(sup, ctx, message))
+        except asyncio.TimeoutError:
+            return self.timeout_text, ctx
+        node = self.nodes.get(node_key)
+        if not node:
+            return f"Node '{node_key}' not found.", ctx
+        try:
+            result = await self._arun_node(node, ctx, message)
+        except asyncio.TimeoutError:
+            return self.timeout_text, ctx
+        return self._apply(ctx, result)
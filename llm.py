@@ -0,0 +1,360 @@
+"""
+llm.py
+
+Shared gateway for chat-completion calls.
+
+LLMGateway wraps the OpenAI clients with:
+- one pooled HTTP connection set per process (keep-alive reused across calls),
+- an overall deadline per call that every retry has to fit into,
+- exponential backoff with jitter on transient errors (timeouts, connection
+  errors, 429, 5xx); the SDK's own retries are turned off so there is one policy,
+- an optional hedged request: if the first attempt has not answered after
+  `hedge_after` seconds a second identical request is sent and whichever
+  finishes first wins,
+- a concurrency limit on in-flight requests: a hedged duplicate takes a
+  slot of its own (and is not sent when none is free), and a stream holds
+  its slot and stays under the deadline until it is read to the end or closed,
+- per-user token accounting (the most recently active `max_users` users) and
+  latency/token metrics (see metrics.py); a reply without a `usage` block is
+  accounted with offline estimates (tokens.py).
+"""
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from metrics import inc, observe, record_llm_usage, span
+from tokens import estimate_usage
+
+# the OpenAI SDK (and httpx under it) is imported when the first client is
+# built, not when this module is, so startup does not pay for it
+
+
+class DeadlineExceeded(Exception):
+    """The call did not succeed before its deadline."""
+
+
+def _retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return False
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                        openai.InternalServerError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(exc, openai.APIStatusError) and status is not None and status >= 500
+
+
+class LLMGateway:
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 client=None, async_client=None, deadline: float = 60.0, attempt_timeout: float = 30.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 hedge_after: Optional[float] = None, max_concurrency: int = 16, pool_size: int = 32,
+                 max_users: int = 10_000):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self._client = client
+        self._async_client = async_client
+        self._sem = threading.BoundedSemaphore(max_concurrency)
+        # one per event loop; dropped with the loop
+        self._async_sems: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.max_users = max_users
+        # user_id -> token totals, least recently active first
+        self.usage_by_user: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+    # clients are built on first use so importing the app does not construct them
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from openai import OpenAI
+                    limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0,
+                                          http_client=httpx.Client(limits=limits, timeout=self.attempt_timeout))
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    from openai import AsyncOpenAI
+                    limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+                    self._async_client = AsyncOpenAI(
+                        api_key=self.api_key, base_url=self.base_url, max_retries=0,
+                        http_client=httpx.AsyncClient(limits=limits, timeout=self.attempt_timeout))
+        return self._async_client
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter keeps many retrying callers from synchronizing
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _account(self, node: str, user_id: Optional[str], usage, messages=None, completion=None,
+                 model: Optional[str] = None, finish_reason: Optional[str] = None) -> None:
+        if finish_reason == "length":
+            # the reply hit max_tokens
+            inc("chef_llm_truncated_total", node=node)
+        if usage is None and messages is not None and completion is not None:
+            usage = estimate_usage(messages, completion, model)
+            inc("chef_llm_usage_estimated_total", node=node)
+        record_llm_usage(node, usage)
+        if usage is None or user_id is None:
+            return
+        with self._lock:
+            acc = self.usage_by_user.get(user_id)
+            if acc is None:
+                acc = self.usage_by_user[user_id] = {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}
+                if len(self.usage_by_user) > self.max_users:
+                    self.usage_by_user.popitem(last=False)
+            else:
+                self.usage_by_user.move_to_end(user_id)
+            acc["calls"] += 1
+            for k in ("prompt_tokens", "completion_tokens"):
+                acc[k] += (usage.get(k) if isinstance(usage, dict) else getattr(usage, k, None)) or 0
+
+    def usage_for(self, user_id: str) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.usage_by_user.get(user_id, {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}))
+
+    # sync
+
+    def _create(self, kwargs: Dict[str, Any], timeout: float):
+        start = time.perf_counter()
+        try:
+            return self.client.chat.completions.create(timeout=timeout, **kwargs)
+        finally:
+            observe("chef_llm_attempt_seconds", time.perf_counter() - start, model=kwargs.get("model", ""))
+
+    def _attempt(self, kwargs: Dict[str, Any], timeout: float):
+        if not self.hedge_after or timeout <= self.hedge_after or kwargs.get("stream"):
+            return self._create(kwargs, timeout)
+        if self._hedge_pool is None:
+            with self._lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(max_workers=self.max_concurrency * 2,
+                                                          thread_name_prefix="llm-hedge")
+        first = self._hedge_pool.submit(self._create, kwargs, timeout)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+        if not self._sem.acquire(blocking=False):
+            # no slot free for a duplicate: keep waiting on the first request
+            return first.result()
+        inc("chef_llm_hedges_total")
+        second = self._hedge_pool.submit(self._create, kwargs, timeout - self.hedge_after)
+        # the duplicate's slot is given back once both requests are done
+        left = [2]
+
+        def finished(_):
+            with self._lock:
+                left[0] -= 1
+                last = not left[0]
+            if last:
+                self._sem.release()
+
+        first.add_done_callback(finished)
+        second.add_done_callback(finished)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    # the slower request is left to finish in the background
+                    return f.result()
+                error = f.exception()
+        raise error
+
+    def _call(self, kwargs: Dict[str, Any], node: str, deadline: float):
+        # retries until `deadline`; the caller holds a concurrency slot
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"LLM call for {node} exceeded {self.deadline}s")
+            try:
+                return self._attempt(kwargs, min(self.attempt_timeout, remaining))
+            except Exception as exc:
+                if not _retryable(exc) or attempt >= self.max_retries:
+                    inc("chef_llm_errors_total", node=node)
+                    raise
+                inc("chef_llm_retries_total", node=node)
+                pause = self._backoff(attempt)
+                if time.monotonic() + pause >= deadline:
+                    raise DeadlineExceeded(f"LLM call for {node} exceeded {self.deadline}s") from exc
+                time.sleep(pause)
+                attempt += 1
+
+    def chat(self, messages: List[Dict[str, str]], node: str = "llm", user_id: Optional[str] = None, **kwargs):
+        """chat.completions.create with deadline, retries, hedging and accounting."""
+        kwargs["messages"] = messages
+        deadline = time.monotonic() + self.deadline
+        with span(node, metric="chef_llm_seconds", label="node"), self._sem:
+            resp = self._call(kwargs, node, deadline)
+        self._account_reply(node, user_id, resp, kwargs)
+        return resp
+
+    def _account_reply(self, node: str, user_id: Optional[str], resp, kwargs: Dict[str, Any]) -> None:
+        choice = resp.choices[0] if getattr(resp, "choices", None) else None
+        self._account(node, user_id, getattr(resp, "usage", None), kwargs["messages"],
+                      choice.message.content or "" if choice is not None else None,
+                      kwargs.get("model"), getattr(choice, "finish_reason", None))
+
+    def stream(self, messages: List[Dict[str, str]], node: str = "llm", user_id: Optional[str] = None, **kwargs):
+        """
+        Streaming chat: retries apply to opening the stream only. Yields the
+        SDK's chunks and records usage if the server sends it. The call's
+        concurrency slot is held, and the deadline enforced between chunks,
+        until the stream is read to the end or the generator is closed; a
+        stream past its deadline is closed and raises DeadlineExceeded.
+        """
+        kwargs["messages"] = messages
+        kwargs["stream"] = True
+        deadline = time.monotonic() + self.deadline
+        parts: List[str] = []
+        usage = finish_reason = None
+        with span(node, metric="chef_llm_seconds", label="node"), self._sem:
+            stream = self._call(kwargs, node, deadline)
+            try:
+                for chunk in stream:
+                    if time.monotonic() > deadline:
+                        inc("chef_llm_errors_total", node=node)
+                        raise DeadlineExceeded(f"LLM stream for {node} exceeded {self.deadline}s")
+                    usage = getattr(chunk, "usage", None) or usage
+                    if getattr(chunk, "choices", None):
+                        choice = chunk.choices[0]
+                        finish_reason = getattr(choice, "finish_reason", None) or finish_reason
+                        if choice.delta.content:
+                            parts.append(choice.delta.content)
+                    yield chunk
+            finally:
+                # gives the connection back when the reader stops early
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+        # accounted once the stream is read to the end
+        self._account(node, user_id, usage, messages, "".join(parts), kwargs.get("model"), finish_reason)
+
+    # async
+
+    def _async_sem(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._async_sems.get(loop)
+        if sem is None:
+            with self._lock:
+                sem = self._async_sems.setdefault(loop, asyncio.Semaphore(self.max_concurrency))
+        return sem
+
+    async def _acreate(self, kwargs: Dict[str, Any], timeout: float):
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(self.async_client.chat.completions.create(timeout=timeout, **kwargs),
+                                          timeout)
+        finally:
+            observe("chef_llm_attempt_seconds", time.perf_counter() - start, model=kwargs.get("model", ""))
+
+    async def _aattempt(self, kwargs: Dict[str, Any], timeout: float):
+        if not self.hedge_after or timeout <= self.hedge_after:
+            return await self._acreate(kwargs, timeout)
+        first = asyncio.ensure_future(self._acreate(kwargs, timeout))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+        sem = self._async_sem()
+        if sem.locked():
+            # no slot free for a duplicate: keep waiting on the first request
+            return await first
+        await sem.acquire()
+        inc("chef_llm_hedges_total")
+        second = asyncio.ensure_future(self._acreate(kwargs, timeout - self.hedge_after))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        return t.result()
+                    error = t.exception()
+            raise error
+        finally:
+            for t in pending:
+                t.cancel()
+            sem.release()
+
+    async def achat(self, messages: List[Dict[str, str]], node: str = "llm", user_id: Optional[str] = None, **kwargs):
+        """Async counterpart of chat()."""
+        kwargs["messages"] = messages
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        with span(node, metric="chef_llm_seconds", label="node"):
+            async with self._async_sem():
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DeadlineExceeded(f"LLM call for {node} exceeded {self.deadline}s")
+                    try:
+                        resp = await self._aattempt(kwargs, min(self.attempt_timeout, remaining))
+                        break
+                    except Exception as exc:
+                        if not _retryable(exc) or attempt >= self.max_retries:
+                            inc("chef_llm_errors_total", node=node)
+                            raise
+                        inc("chef_llm_retries_total", node=node)
+                        pause = self._backoff(attempt)
+                        if time.monotonic() + pause >= deadline:
+                            raise DeadlineExceeded(f"LLM call for {node} exceeded {self.deadline}s") from exc
+                        await asyncio.sleep(pause)
+                        attempt += 1
+        self._account_reply(node, user_id, resp, kwargs)
+        return resp
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def get_gateway() -> LLMGateway:
+    """The process-wide gateway, configured from the environment on first use."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("OPENAI_BASE_URL") or None,
+                    deadline=_env_float("LLM_DEADLINE_SEC", 60.0),
+                    attempt_timeout=_env_float("LLM_ATTEMPT_TIMEOUT_SEC", 30.0),
+                    max_retries=int(os.getenv("LLM_MAX_RETRIES") or 3),
+                    hedge_after=_env_float("LLM_HEDGE_AFTER_SEC", None),
+                    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY") or 16),
+                )
+    return _gateway
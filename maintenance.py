@@ -0,0 +1,310 @@
+"""
+maintenance.py
+
+Retention, archival and space reclamation for the SQLite database.
+
+run_maintenance() makes one pass:
+
+- recipe payloads still stored as plain JSON (rows from before migration 5)
+  are packed into the shared compressed blobs (see payloads.py),
+- once enough recipes are stored, a payload dictionary is trained on them,
+- recipes and feedback older than their retention period move in bulk to
+  dated archive databases next to the main one (ARCHIVE_DIR/<db>-YYYY-MM.db,
+  by the month the rows were created), and blobs no recipe uses any more are
+  deleted,
+- fired timers older than memory.TIMER_RETENTION_SEC are deleted, and so
+  are recipe_cache and chat_cache rows past CACHE_RETENTION_DAYS and
+  sessions (with their spilled history) idle for SESSION_RETENTION_DAYS;
+  these hold nothing that is not regenerated on demand, so they are not
+  archived,
+- an incremental VACUUM returns up to VACUUM_PAGES free pages to the
+  filesystem.
+
+MaintenanceJob runs a pass every MAINTENANCE_INTERVAL_SEC in a background
+thread; `python maintenance.py` runs one from the command line (e.g. cron).
+
+feedback_stats is maintained on insert only, so ratings keep counting
+feedback whose rows have been archived.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import memory
+import payloads
+from metrics import inc, span
+
+# 0 keeps rows forever
+RECIPE_RETENTION_DAYS = float(os.getenv("RECIPE_RETENTION_DAYS") or 180)
+FEEDBACK_RETENTION_DAYS = float(os.getenv("FEEDBACK_RETENTION_DAYS") or 365)
+CACHE_RETENTION_DAYS = float(os.getenv("CACHE_RETENTION_DAYS") or 30)
+SESSION_RETENTION_DAYS = float(os.getenv("SESSION_RETENTION_DAYS") or 90)
+# default: an "archive" directory next to the database
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or ""
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH") or 5000)
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES") or 4096)
+MAINTENANCE_INTERVAL_SEC = float(os.getenv("MAINTENANCE_INTERVAL_SEC") or 3600)
+# a dictionary is trained from the most recent DICT_SAMPLES recipes once DICT_MIN_RECIPES exist
+DICT_MIN_RECIPES = 1000
+DICT_SAMPLES = 2000
+
+ARCHIVE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS archive.recipes (
+        id INTEGER PRIMARY KEY,
+        user_id TEXT,
+        title TEXT,
+        prefs JSON,
+        created_at INTEGER,
+        payload JSON,
+        hash BLOB
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS archive.recipe_blobs (
+        hash BLOB PRIMARY KEY,
+        dict_id INTEGER,
+        data BLOB
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS archive.payload_dicts (
+        id INTEGER PRIMARY KEY,
+        dict BLOB,
+        created_at INTEGER
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS archive.feedback (
+        id INTEGER PRIMARY KEY,
+        user_id TEXT,
+        score INTEGER,
+        comment TEXT,
+        recipe_key TEXT,
+        title TEXT,
+        region TEXT,
+        spice_level INTEGER,
+        created_at INTEGER
+    )""",
+    "CREATE TEMP TABLE IF NOT EXISTS freed_blobs (id INTEGER PRIMARY KEY)",
+]
+
+# statements that move the rows with id BETWEEN ? AND ?, run in one transaction;
+# INSERT OR REPLACE so a pass interrupted between the two files can simply run again
+ARCHIVE_MOVES = {
+    "recipes": [
+        "INSERT OR REPLACE INTO archive.payload_dicts SELECT id,dict,created_at FROM main.payload_dicts",
+        """
+        INSERT OR IGNORE INTO archive.recipe_blobs
+        SELECT b.hash, b.dict_id, b.data FROM main.recipe_blobs b
+        WHERE b.id IN (SELECT blob_id FROM main.recipes WHERE id BETWEEN ? AND ?)""",
+        """
+        INSERT OR REPLACE INTO archive.recipes
+        SELECT r.id, r.user_id, r.title, r.prefs, r.created_at, r.payload, b.hash
+        FROM main.recipes r LEFT JOIN main.recipe_blobs b ON b.id=r.blob_id WHERE r.id BETWEEN ? AND ?""",
+        "INSERT OR IGNORE INTO temp.freed_blobs SELECT blob_id FROM main.recipes WHERE id BETWEEN ? AND ? AND blob_id IS NOT NULL",
+        "DELETE FROM main.recipes WHERE id BETWEEN ? AND ?",
+    ],
+    "feedback": [
+        """
+        INSERT OR REPLACE INTO archive.feedback
+        SELECT id, user_id, score, comment, recipe_key, title, region, spice_level, created_at
+        FROM main.feedback WHERE id BETWEEN ? AND ?""",
+        "DELETE FROM main.feedback WHERE id BETWEEN ? AND ?",
+    ],
+}
+SQL_FREE_BLOBS = """
+    DELETE FROM main.recipe_blobs WHERE id IN (SELECT id FROM temp.freed_blobs)
+    AND NOT EXISTS (SELECT 1 FROM main.recipes WHERE blob_id=recipe_blobs.id)"""
+# statements that delete the rows last used before ?; the last one's rowcount is reported
+SQL_EXPIRE = {
+    "recipe_cache": ["DELETE FROM recipe_cache WHERE created_at<?"],
+    "chat_cache": ["DELETE FROM chat_cache WHERE last_used<?"],
+    "sessions": [
+        "DELETE FROM history WHERE user_id IN (SELECT user_id FROM sessions WHERE updated_at<?)",
+        "DELETE FROM sessions WHERE updated_at<?",
+    ],
+}
+SQL_LEGACY_PAYLOADS = """
+    SELECT id, payload FROM recipes WHERE id>? AND blob_id IS NULL AND payload IS NOT NULL ORDER BY id LIMIT ?"""
+SQL_PACK_BLOB = "INSERT OR IGNORE INTO recipe_blobs(hash,dict_id,data) VALUES (?,?,?)"
+SQL_PACK_RECIPE = "UPDATE recipes SET payload=NULL, blob_id=(SELECT id FROM recipe_blobs WHERE hash=?) WHERE id=?"
+
+# legacy payloads below this id have been packed by this process
+_packed_upto = 0
+
+
+def archive_path(month: str) -> Path:
+    db = Path(memory.get_storage().path)
+    return Path(ARCHIVE_DIR or db.parent / "archive") / f"{db.stem}-{month}.db"
+
+
+def _month(ts: int) -> str:
+    return time.strftime("%Y-%m", time.gmtime(ts))
+
+
+def _move(table: str, first: int, last: int, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    store = memory.get_storage()
+    with span("db.archive", metric="chef_db_seconds"), store.connection() as conn:
+        conn.execute("ATTACH DATABASE ? AS archive", (str(path),))
+        try:
+            for stmt in ARCHIVE_SCHEMA:
+                conn.execute(stmt)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for stmt in ARCHIVE_MOVES[table]:
+                    conn.execute(stmt, (first, last) if "?" in stmt else ())
+                if table == "recipes":
+                    conn.execute(SQL_FREE_BLOBS)
+                    conn.execute("DELETE FROM temp.freed_blobs")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute("DETACH DATABASE archive")
+
+
+def archive_rows(table: str, before_ts: int, batch: int = ARCHIVE_BATCH) -> int:
+    """
+    Move the rows of `table` ('recipes' or 'feedback') created before
+    `before_ts` to the archive database of their month, `batch` rows per
+    transaction. Rows are appended in time order, so the oldest come first by
+    id and the scan stops at the first row that is young enough to keep.
+    Returns the number of rows moved.
+    """
+    store = memory.get_storage()
+    store.flush()
+    moved = 0
+    while True:
+        rows = store.query(f"SELECT id, created_at FROM {table} ORDER BY id LIMIT ?", (batch,))
+        old = []
+        for rid, created in rows:
+            if created is None or created >= before_ts or (old and _month(created) != _month(old[0][1])):
+                break
+            old.append((rid, created))
+        if not old:
+            return moved
+        _move(table, old[0][0], old[-1][0], archive_path(_month(old[0][1])))
+        moved += len(old)
+
+
+def expire_rows(table: str, before_ts: int) -> int:
+    """Delete the rows of a cache or session table last used before `before_ts`; returns how many."""
+    store = memory.get_storage()
+    store.flush()
+    deleted = 0
+    with store.connection() as conn:
+        with conn:
+            for stmt in SQL_EXPIRE[table]:
+                deleted = conn.execute(stmt, (before_ts,)).rowcount
+    return deleted
+
+
+def pack_payloads(batch: int = ARCHIVE_BATCH) -> int:
+    """Move recipe payloads stored as plain JSON into compressed, shared blobs; returns how many."""
+    global _packed_upto
+    store = memory.get_storage()
+    codec = memory.payload_codec()
+    packed = 0
+    while True:
+        rows = store.query(SQL_LEGACY_PAYLOADS, (_packed_upto, batch))
+        if not rows:
+            return packed
+        encoded = [(rid, codec.encode(json.loads(payload))) for rid, payload in rows]
+        with store.connection() as conn:
+            with conn:
+                conn.executemany(SQL_PACK_BLOB, [e for _, e in encoded])
+                conn.executemany(SQL_PACK_RECIPE, [(e[0], rid) for rid, e in encoded])
+        packed += len(rows)
+        _packed_upto = rows[-1][0]
+
+
+def train_dictionary(min_recipes: int = DICT_MIN_RECIPES, samples: int = DICT_SAMPLES) -> Optional[int]:
+    """Train a payload dictionary on recent recipes, once; returns its id, or None if nothing was done."""
+    if memory.payload_codec(reload=True).current != payloads.SEED_ID:
+        return None
+    store = memory.get_storage()
+    store.flush()
+    last = store.query("SELECT MAX(id) FROM recipes")[0][0] or 0
+    texts = [payload for _, payload, _ in memory.iter_recipes(max(0, last - samples))]
+    if len(texts) < min(min_recipes, samples):
+        return None
+    return memory.add_payload_dictionary(payloads.train_dictionary(texts))
+
+
+def vacuum(pages: int = VACUUM_PAGES) -> int:
+    """
+    Return up to `pages` free pages to the filesystem and checkpoint the WAL;
+    returns how many were freed. Needs auto_vacuum=INCREMENTAL, which new
+    databases get (memory.Storage); an older file is converted once with
+    convert_to_incremental().
+    """
+    with span("db.vacuum", metric="chef_db_seconds"), memory.get_storage().connection() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # executescript steps the pragma to completion; execute() would free a single page
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        freed = before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return freed
+
+
+def convert_to_incremental() -> None:
+    """Switch an existing database to incremental auto_vacuum: a full VACUUM, which locks it while it runs."""
+    store = memory.get_storage()
+    store.flush()
+    with store.connection() as conn:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def run_maintenance(now: Optional[int] = None) -> Dict[str, Any]:
+    """One maintenance pass; returns what it did."""
+    now = int(now or time.time())
+    report: Dict[str, Any] = {"packed": pack_payloads(), "dictionary": train_dictionary()}
+    for table, days in (("recipes", RECIPE_RETENTION_DAYS), ("feedback", FEEDBACK_RETENTION_DAYS)):
+        report[f"archived_{table}"] = archive_rows(table, now - int(days * 86400)) if days > 0 else 0
+    report["timers"] = memory.get_timer_scheduler().compact(now - memory.TIMER_RETENTION_SEC)
+    for table, days in (("recipe_cache", CACHE_RETENTION_DAYS), ("chat_cache", CACHE_RETENTION_DAYS),
+                        ("sessions", SESSION_RETENTION_DAYS)):
+        report[f"expired_{table}"] = expire_rows(table, now - int(days * 86400)) if days > 0 else 0
+    report["vacuumed_pages"] = vacuum()
+    return report
+
+
+class MaintenanceJob:
+    """run_maintenance() every `interval` seconds in a daemon thread."""
+
+    def __init__(self, interval: float = MAINTENANCE_INTERVAL_SEC):
+        self.interval = interval
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="db-maintenance", daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_report = run_maintenance()
+            except Exception:
+                # the next interval tries again
+                inc("chef_maintenance_errors_total")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="one maintenance pass over the chef database")
+    ap.add_argument("--convert", action="store_true", help="switch an existing database to incremental vacuum first")
+    args = ap.parse_args()
+    memory.init_db()
+    if args.convert:
+        convert_to_incremental()
+    print(run_maintenance())
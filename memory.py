@@ -1,94 +1,773 @@
 """
 Simple SQLite storage for profiles, recipes, feedback, timers.
+
+All access goes through a long-lived Storage object which keeps a small pool of
+WAL-mode connections and a write-behind queue that groups recipe/feedback/timer
+inserts into a single transaction. The module-level functions are thin wrappers
+around a shared Storage so callers do not need to know about it.
 """
 
+import atexit
+import heapq
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 import json
 import time
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Optional
+
+from metrics import inc, observe, span
+import payloads
 
 DB = Path(__file__).parent / "chef_langgraph.db"
 
-def init_db():
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    cur.execute("""
+SCHEMA = [
+    """
     CREATE TABLE IF NOT EXISTS users (
         user_id TEXT PRIMARY KEY,
         profile JSON
-    )""")
-    cur.execute("""
+    )""",
+    """
     CREATE TABLE IF NOT EXISTS recipes (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id TEXT,
         title TEXT,
-        payload JSON
-    )""")
-    cur.execute("""
+        payload JSON,
+        prefs JSON
+    )""",
+    """
     CREATE TABLE IF NOT EXISTS feedback (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id TEXT,
         score INTEGER,
         comment TEXT
-    )""")
-    cur.execute("""
+    )""",
+    """
     CREATE TABLE IF NOT EXISTS timers (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         user_id TEXT,
         label TEXT,
         wake_at INTEGER,
         fired INTEGER DEFAULT 0
-    )""")
-    conn.commit()
-    conn.close()
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_timers_user_due ON timers(user_id, fired, wake_at)",
+    """
+    CREATE TABLE IF NOT EXISTS recipe_cache (
+        cache_key TEXT,
+        variant INTEGER,
+        payload JSON,
+        created_at INTEGER,
+        PRIMARY KEY (cache_key, variant)
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS history (
+        user_id TEXT,
+        seq INTEGER,
+        who TEXT,
+        text TEXT,
+        PRIMARY KEY (user_id, seq)
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        user_id TEXT PRIMARY KEY,
+        version INTEGER,
+        state JSON,
+        updated_at INTEGER
+    )""",
+]
+
+# statements are kept as constants so sqlite3's per-connection statement cache
+# reuses the prepared form instead of re-parsing on every call
+SQL_SAVE_PROFILE = "REPLACE INTO users(user_id, profile) VALUES (?,?)"
+SQL_LOAD_PROFILE = "SELECT profile FROM users WHERE user_id=?"
+# recipes are written through the recipe_rows view, whose trigger stores the payload blob once per hash
+SQL_PUSH_RECIPE = "INSERT INTO recipe_rows(user_id,title,prefs,hash,dict_id,data) VALUES (?,?,?,?,?,?)"
+SQL_POPULAR_PREFS = """
+    SELECT prefs, COUNT(*) AS n FROM recipes
+    WHERE prefs IS NOT NULL GROUP BY prefs ORDER BY n DESC LIMIT ?"""
+SQL_ITER_RECIPES = """
+    SELECT r.id, r.payload, b.dict_id, b.data, r.prefs FROM recipes r LEFT JOIN recipe_blobs b ON b.id=r.blob_id
+    WHERE r.id>? ORDER BY r.id LIMIT ?"""
+SQL_LOAD_RECIPE = """
+    SELECT r.payload, b.dict_id, b.data FROM recipes r LEFT JOIN recipe_blobs b ON b.id=r.blob_id WHERE r.id=?"""
+SQL_LOAD_PAYLOAD_DICTS = "SELECT id,dict FROM payload_dicts"
+SQL_ADD_PAYLOAD_DICT = "INSERT INTO payload_dicts(dict,created_at) VALUES (?,?)"
+SQL_STORE_FEEDBACK = """
+    INSERT INTO feedback(user_id,score,comment,recipe_key,title,region,spice_level,created_at)
+    VALUES (?,?,?,?,?,?,?,CAST(strftime('%s','now') AS INTEGER))"""
+SQL_ADD_TIMER = "INSERT INTO timers(user_id,label,wake_at,fired) VALUES (?,?,?,0)"
+SQL_DUE_TIMERS = "SELECT id,label FROM timers WHERE fired=0 AND wake_at<=?"
+SQL_USER_DUE_TIMERS = "SELECT id,label FROM timers WHERE user_id=? AND fired=0 AND wake_at<=?"
+SQL_USER_PENDING_TIMERS = "SELECT wake_at FROM timers WHERE user_id=? AND fired=0"
+SQL_COMPACT_TIMERS = "DELETE FROM timers WHERE fired=1 AND wake_at<?"
+SQL_CANCEL_TIMERS = "DELETE FROM timers WHERE user_id=? AND fired=0"
+SQL_INDEX_FIRED_TIMERS = "CREATE INDEX IF NOT EXISTS idx_timers_fired ON timers(wake_at) WHERE fired=1"
+SQL_CACHE_PUT = "REPLACE INTO recipe_cache(cache_key,variant,payload,created_at) VALUES (?,?,?,?)"
+SQL_CACHE_GET = "SELECT created_at,payload FROM recipe_cache WHERE cache_key=? AND created_at>=? ORDER BY variant"
+SQL_SPILL_HISTORY = "REPLACE INTO history(user_id,seq,who,text) VALUES (?,?,?,?)"
+SQL_LOAD_HISTORY = "SELECT who,text FROM history WHERE user_id=? AND seq<? ORDER BY seq DESC LIMIT ?"
+SQL_LOAD_SESSION = "SELECT version,state FROM sessions WHERE user_id=?"
+SQL_INSERT_SESSION = "INSERT OR IGNORE INTO sessions(user_id,version,state,updated_at) VALUES (?,1,?,?)"
+SQL_UPDATE_SESSION = "UPDATE sessions SET version=version+1, state=?, updated_at=? WHERE user_id=? AND version=?"
+SQL_SESSION_VERSION = "SELECT version FROM sessions WHERE user_id=?"
+# taken only when free or expired; the holder is the `owner` token that took it
+SQL_ACQUIRE_LEASE = """
+    INSERT INTO session_leases(user_id,owner,expires_at) VALUES (?,?,?)
+    ON CONFLICT(user_id) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at
+    WHERE session_leases.expires_at<?"""
+SQL_RELEASE_LEASE = "DELETE FROM session_leases WHERE user_id=? AND owner=?"
+SQL_CHAT_CACHE_PUT = "REPLACE INTO chat_cache(key,question,answer,last_used) VALUES (?,?,?,?)"
+SQL_CHAT_CACHE_TOUCH = "UPDATE chat_cache SET last_used=? WHERE key=?"
+SQL_CHAT_CACHE_DELETE = "DELETE FROM chat_cache WHERE key=?"
+SQL_CHAT_CACHE_LOAD = "SELECT key,question,answer FROM chat_cache ORDER BY last_used DESC LIMIT ?"
+_STATS_COLS = "key,title,n,mean,score,s1,s2,s3,s4,s5"
+SQL_TOP_RATED = f"SELECT {_STATS_COLS} FROM feedback_stats WHERE scope=? ORDER BY score DESC LIMIT ?"
+SQL_BOTTOM_RATED = f"SELECT {_STATS_COLS} FROM feedback_stats WHERE scope=? ORDER BY score ASC LIMIT ?"
+SQL_RATING = f"SELECT {_STATS_COLS} FROM feedback_stats WHERE scope=? AND key=?"
+SQL_CHANGED_RATINGS = "SELECT scope,key,score,n,last_id FROM feedback_stats WHERE last_id>? ORDER BY last_id LIMIT ?"
+
+# fired timer rows older than this are deleted by compaction (maintenance.py)
+TIMER_RETENTION_SEC = 24 * 3600
+
+# ratings are ranked by a Bayesian average: each scope starts as if it had
+# FEEDBACK_PRIOR_WEIGHT ratings of FEEDBACK_PRIOR_MEAN, so one 5 does not top
+# the chart. Both are compiled into the feedback triggers (migration 4);
+# changing them needs a migration that recreates those triggers.
+FEEDBACK_PRIOR_MEAN = 3.0
+FEEDBACK_PRIOR_WEIGHT = 5
+
+
+class _Flush:
+    """Queued by Storage.flush(): the writer commits what it has and sets `done`."""
+    __slots__ = ("done",)
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class Storage:
+    """
+    Storage: a pooled SQLite engine.
+
+    - `connection()` borrows a connection from a bounded pool (WAL mode, so
+      readers do not block the writer).
+    - `enqueue(sql, params)` schedules an insert on the write-behind queue; a
+      background thread drains the queue and commits each batch in one transaction.
+    - `flush()` blocks until everything queued so far has been committed; reads
+      that must see queued rows call it first.
+    """
+
+    def __init__(self, path=None, pool_size: int = 8, batch_size: int = 256, flush_interval: float = 0.05):
+        self.path = str(path or DB)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._pool_sem = threading.BoundedSemaphore(pool_size)
+        self._all_conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._writes: "queue.Queue[Optional[Tuple[str, tuple]]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, cached_statements=128)
+        # only takes effect on a new database; free pages are then returned by maintenance.vacuum()
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        with self._conns_lock:
+            self._all_conns.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        start = time.perf_counter()
+        self._pool_sem.acquire()
+        # time spent waiting for a free connection: pool contention under load
+        observe("chef_db_pool_wait_seconds", time.perf_counter() - start)
+        try:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                self._pool.put(conn)
+        finally:
+            self._pool_sem.release()
+
+    def execute(self, sql: str, params: tuple = ()) -> int:
+        """Run one write statement synchronously, commit it and return the rowcount."""
+        with span("db.execute", metric="chef_db_seconds"):
+            with self.connection() as conn:
+                with conn:
+                    return conn.execute(sql, params).rowcount
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with span("db.query", metric="chef_db_seconds"):
+            with self.connection() as conn:
+                return conn.execute(sql, params).fetchall()
+
+    def enqueue(self, sql: str, params: tuple) -> None:
+        """Schedule a write on the write-behind queue."""
+        self._ensure_writer()
+        self._writes.put((sql, params))
+
+    def flush(self) -> None:
+        if self._writer is not None and not self._closed:
+            with span("db.flush", metric="chef_db_seconds"):
+                # the marker ends the writer's current batch instead of waiting out flush_interval;
+                # only the writes queued before it are waited for, not those other threads add later
+                marker = _Flush()
+                self._writes.put(marker)
+                marker.done.wait()
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                t = threading.Thread(target=self._write_loop, name="memory-writer", daemon=True)
+                t.start()
+                self._writer = t
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        stop = False
+        while not stop:
+            item = self._writes.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not isinstance(batch[-1], _Flush):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._writes.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            rows = [b for b in batch if b is not None and not isinstance(b, _Flush)]
+            stop = any(b is None for b in batch)
+            start_t = time.perf_counter()
+            try:
+                if rows:
+                    self._write_batch(conn, rows)
+            except Exception:
+                # the writer must outlive any bad write: flush() waits on it
+                inc("chef_db_write_errors_total")
+            finally:
+                observe("chef_db_seconds", time.perf_counter() - start_t, span="db.write_batch")
+                for b in batch:
+                    if isinstance(b, _Flush):
+                        b.done.set()
+
+    def _write_batch(self, conn: sqlite3.Connection, rows: List[Tuple[str, tuple]]) -> None:
+        try:
+            # group consecutive statements of the same shape into executemany
+            with conn:
+                start = 0
+                for i in range(1, len(rows) + 1):
+                    if i == len(rows) or rows[i][0] != rows[start][0]:
+                        conn.executemany(rows[start][0], [r[1] for r in rows[start:i]])
+                        start = i
+            return
+        except Exception:
+            # sqlite3 errors, but also e.g. a TypeError from a malformed parameter tuple
+            pass
+        # the batch was rolled back: write it again one statement per transaction,
+        # so a bad write only loses itself and not the other users' writes with it
+        for sql, params in rows:
+            try:
+                with conn:
+                    conn.execute(sql, params)
+            except Exception:
+                inc("chef_db_write_errors_total")
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join()
+        with self._conns_lock:
+            for conn in self._all_conns:
+                conn.close()
+            self._all_conns.clear()
+
+
+class TimerScheduler:
+    """
+    TimerScheduler: an in-process min-heap of pending wake times per user.
+
+    `fetch_due(user_id, now)` only touches the database when the earliest known
+    wake time for that user has passed, so the frequent polls that cannot fire
+    anything cost a dict lookup. A user's heap is seeded from the timers table
+    on first use, which covers timers created before this process started.
+    """
+
+    def __init__(self, store: Storage):
+        self.store = store
+        # only users with pending timers keep a heap; an emptied heap is dropped
+        self._heaps: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        # callables (user_id, wake_at) told about every new timer, e.g. TimerService
+        self.listeners: List = []
+
+    def _heap(self, user_id: str) -> List[int]:
+        heap = self._heaps.get(user_id)
+        if heap is None:
+            self.store.flush()
+            heap = [r[0] for r in self.store.query(SQL_USER_PENDING_TIMERS, (user_id,))]
+            heapq.heapify(heap)
+            if heap:
+                self._heaps[user_id] = heap
+        return heap
+
+    def add(self, user_id: str, label: str, wake_at: int) -> None:
+        with self._lock:
+            heap = self._heap(user_id)
+            self.store.enqueue(SQL_ADD_TIMER, (user_id, label, wake_at))
+            heapq.heappush(heap, int(wake_at))
+            self._heaps[user_id] = heap
+        for listener in self.listeners:
+            listener(user_id, int(wake_at))
+
+    def cancel(self, user_id: str) -> None:
+        """Drop all of a user's pending timers in one statement."""
+        with self._lock:
+            self._heaps.pop(user_id, None)
+            self.store.enqueue(SQL_CANCEL_TIMERS, (user_id,))
+
+    def reload(self, user_id: str) -> Optional[int]:
+        """
+        Re-read a user's pending timers from the table, for timers another
+        process added or cancelled; returns the next wake time.
+        """
+        with self._lock:
+            self._heaps.pop(user_id, None)
+            heap = self._heap(user_id)
+            return heap[0] if heap else None
+
+    def next_wake(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            heap = self._heap(user_id)
+            return heap[0] if heap else None
+
+    def fetch_due(self, user_id: str, now_ts: int) -> List[Tuple[int, str]]:
+        with self._lock:
+            heap = self._heap(user_id)
+            if not heap or heap[0] > now_ts:
+                return []
+            while heap and heap[0] <= now_ts:
+                heapq.heappop(heap)
+            if not heap:
+                del self._heaps[user_id]
+        self.store.flush()
+        return self._claim(SQL_USER_DUE_TIMERS, (user_id, now_ts))
+
+    def _claim(self, sql: str, params: tuple) -> List[Tuple[int, str]]:
+        # BEGIN IMMEDIATE takes the write lock up front so two sessions polling at
+        # the same moment cannot both claim the same rows
+        with span("db.claim_timers", metric="chef_db_seconds"), self.store.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(sql, params).fetchall()
+                ids = [r[0] for r in rows]
+                if ids:
+                    q = "UPDATE timers SET fired=1 WHERE id IN ({})".format(",".join("?"*len(ids)))
+                    conn.execute(q, ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return [(r[0], r[1]) for r in rows]
+
+    def compact(self, before_ts: int) -> int:
+        """
+        Delete fired timer rows that woke before `before_ts`; returns how many.
+        Run by maintenance.py, never in a user's poll.
+        """
+        return self.store.execute(SQL_COMPACT_TIMERS, (before_ts,))
+
+
+_storage: Optional[Storage] = None
+_timers: Optional[TimerScheduler] = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = Storage(DB)
+                atexit.register(_storage.close)
+    return _storage
+
+
+def get_timer_scheduler() -> TimerScheduler:
+    global _timers
+    if _timers is None:
+        with _storage_lock:
+            if _timers is None:
+                _timers = TimerScheduler(get_storage())
+    return _timers
+
+
+def _add_recipe_prefs(conn: sqlite3.Connection) -> None:
+    # databases created before recipes recorded their preferences
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(recipes)")}
+    if "prefs" not in cols:
+        conn.execute("ALTER TABLE recipes ADD COLUMN prefs JSON")
+
+
+def _feedback_trigger(scope: str, key_expr: str, title_expr: str = "NULL") -> str:
+    prior = FEEDBACK_PRIOR_MEAN * FEEDBACK_PRIOR_WEIGHT
+    hist = ", ".join(f"NEW.score={i}" for i in range(1, 6))
+    hist_update = ", ".join(f"s{i}=s{i}+excluded.s{i}" for i in range(1, 6))
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS feedback_stats_{scope} AFTER INSERT ON feedback
+        WHEN NEW.score BETWEEN 1 AND 5 AND {key_expr} IS NOT NULL
+        BEGIN
+            INSERT INTO feedback_stats(scope,key,title,n,total,s1,s2,s3,s4,s5,mean,score,last_id)
+            SELECT '{scope}', {key_expr}, {title_expr}, 1, NEW.score, {hist}, NEW.score,
+                   (NEW.score + {prior}) / (1.0 + {FEEDBACK_PRIOR_WEIGHT}), NEW.id
+            WHERE true
+            ON CONFLICT(scope,key) DO UPDATE SET
+                n=n+1, total=total+excluded.total, {hist_update},
+                mean=(total+excluded.total)*1.0/(n+1),
+                score=(total+excluded.total+{prior})/(n+1.0+{FEEDBACK_PRIOR_WEIGHT}),
+                title=COALESCE(excluded.title,title), last_id=excluded.last_id;
+        END"""
+
+
+def _add_feedback_stats(conn: sqlite3.Connection) -> None:
+    # feedback rows name the recipe they rate and the preferences it was made for
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(feedback)")}
+    for col, kind in (("recipe_key", "TEXT"), ("title", "TEXT"), ("region", "TEXT"), ("spice_level", "INTEGER")):
+        if col not in cols:
+            conn.execute(f"ALTER TABLE feedback ADD COLUMN {col} {kind}")
+    # running aggregates per (scope, key), maintained by triggers in the insert's transaction;
+    # scope is 'recipe' (key = catalog.recipe_key), 'region' or 'spice'
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS feedback_stats (
+            scope TEXT,
+            key TEXT,
+            title TEXT,
+            n INTEGER,
+            total INTEGER,
+            s1 INTEGER, s2 INTEGER, s3 INTEGER, s4 INTEGER, s5 INTEGER,
+            mean REAL,
+            score REAL,
+            last_id INTEGER,
+            PRIMARY KEY (scope, key)
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_stats_rank ON feedback_stats(scope, score)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_feedback_stats_changed ON feedback_stats(last_id)")
+    conn.execute(_feedback_trigger("recipe", "NEW.recipe_key", "NEW.title"))
+    conn.execute(_feedback_trigger("region", "NEW.region"))
+    conn.execute(_feedback_trigger("spice", "CAST(NEW.spice_level AS TEXT)"))
+
+
+def _add_payload_blobs(conn: sqlite3.Connection) -> None:
+    # payloads move to recipe_blobs (see payloads.py); rows written before keep their JSON in recipes.payload
+    now = int(time.time())
+    for table, cols in (("recipes", (("blob_id", "INTEGER"), ("created_at", "INTEGER"))),
+                        ("feedback", (("created_at", "INTEGER"),))):
+        have = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        for col, kind in cols:
+            if col not in have:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {kind}")
+        # existing rows start their retention period now (see maintenance.py)
+        conn.execute(f"UPDATE {table} SET created_at=? WHERE created_at IS NULL", (now,))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS payload_dicts (
+            id INTEGER PRIMARY KEY,
+            dict BLOB,
+            created_at INTEGER
+        )""")
+    conn.execute("INSERT OR IGNORE INTO payload_dicts(id,dict,created_at) VALUES (?,?,?)",
+                 (payloads.SEED_ID, payloads.SEED_DICTIONARY, now))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recipe_blobs (
+            id INTEGER PRIMARY KEY,
+            hash BLOB NOT NULL UNIQUE,
+            dict_id INTEGER,
+            data BLOB
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recipes_blob ON recipes(blob_id)")
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS recipe_rows AS
+        SELECT r.user_id, r.title, r.prefs, b.hash, b.dict_id, b.data
+        FROM recipes r JOIN recipe_blobs b ON b.id=r.blob_id""")
+    # one statement per recipe, so the write-behind queue still batches them with executemany
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS recipe_rows_insert INSTEAD OF INSERT ON recipe_rows
+        BEGIN
+            INSERT OR IGNORE INTO recipe_blobs(hash,dict_id,data) VALUES (NEW.hash, NEW.dict_id, NEW.data);
+            INSERT INTO recipes(user_id,title,prefs,created_at,blob_id)
+            SELECT NEW.user_id, NEW.title, NEW.prefs, CAST(strftime('%s','now') AS INTEGER), id
+            FROM recipe_blobs WHERE hash=NEW.hash;
+        END""")
+
+
+# (version, migration) in order. A migration is a list of statements or a
+# function of the connection; each runs once per database and the version
+# reached is recorded in schema_version. Append new entries, never edit old ones.
+MIGRATIONS = [
+    (1, SCHEMA),
+    (2, _add_recipe_prefs),
+    (3, [
+        """
+        CREATE TABLE IF NOT EXISTS chat_cache (
+            key TEXT PRIMARY KEY,
+            question TEXT,
+            answer TEXT,
+            last_used INTEGER
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_chat_cache_used ON chat_cache(last_used)",
+    ]),
+    (4, _add_feedback_stats),
+    (5, _add_payload_blobs),
+    # compaction finds fired rows by wake_at without scanning the pending ones
+    (6, [SQL_INDEX_FIRED_TIMERS]),
+    # one turn at a time per session, across workers (session.SessionStore.run_turn)
+    (7, [
+        """
+        CREATE TABLE IF NOT EXISTS session_leases (
+            user_id TEXT PRIMARY KEY,
+            owner TEXT,
+            expires_at REAL
+        )""",
+    ]),
+    # cached chat answers used to quote the question they were cached for
+    (8, ["DELETE FROM chat_cache"]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# databases already migrated by this process
+_migrated = set()
+
+
+def _schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def init_db():
+    """
+    Bring the database up to SCHEMA_VERSION. Cheap to call repeatedly: after
+    the first call in a process it returns at once, and on an up-to-date
+    database it is a single SELECT.
+    """
+    store = get_storage()
+    if store.path in _migrated:
+        return
+    with span("db.init", metric="chef_db_seconds"), store.connection() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        conn.commit()
+        if _schema_version(conn) < SCHEMA_VERSION:
+            # the write lock up front: workers starting together migrate once
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = _schema_version(conn)
+                for version, migration in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    if callable(migration):
+                        migration(conn)
+                    else:
+                        for stmt in migration:
+                            conn.execute(stmt)
+                    conn.execute("INSERT INTO schema_version(version) VALUES (?)", (version,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    _migrated.add(store.path)
 
 def save_user_profile(user_id: str, profile: Dict[str, Any]):
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    cur.execute("REPLACE INTO users(user_id, profile) VALUES (?,?)", (user_id, json.dumps(profile)))
-    conn.commit()
-    conn.close()
+    get_storage().execute(SQL_SAVE_PROFILE, (user_id, json.dumps(profile)))
 
 def load_user_profile(user_id: str):
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    cur.execute("SELECT profile FROM users WHERE user_id=?", (user_id,))
-    r = cur.fetchone()
-    conn.close()
-    return json.loads(r[0]) if r else None
-
-def push_recipe(user_id: str, title: str, payload: Dict[str, Any]):
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    cur.execute("INSERT INTO recipes(user_id,title,payload) VALUES (?,?,?)", (user_id, title, json.dumps(payload)))
-    conn.commit()
-    conn.close()
-
-def store_feedback(user_id: str, score: int, comment: str):
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    cur.execute("INSERT INTO feedback(user_id,score,comment) VALUES (?,?,?)", (user_id, score, comment))
-    conn.commit()
-    conn.close()
+    rows = get_storage().query(SQL_LOAD_PROFILE, (user_id,))
+    return json.loads(rows[0][0]) if rows else None
+
+_codec: Optional[payloads.Codec] = None
+
+def payload_codec(reload: bool = False) -> payloads.Codec:
+    """Codec over the dictionaries in payload_dicts, loaded once per process."""
+    global _codec
+    if _codec is None or reload:
+        _codec = payloads.Codec(dict(get_storage().query(SQL_LOAD_PAYLOAD_DICTS)))
+    return _codec
+
+def add_payload_dictionary(zdict: bytes) -> int:
+    """Store a new dictionary; payloads pushed from now on use it. Returns its id."""
+    with get_storage().connection() as conn:
+        with conn:
+            dict_id = conn.execute(SQL_ADD_PAYLOAD_DICT, (zdict, int(time.time()))).lastrowid
+    payload_codec(reload=True)
+    return dict_id
+
+def decode_payload(dict_id: Optional[int], data: bytes) -> str:
+    try:
+        return payload_codec().decode(dict_id, data)
+    except KeyError:
+        # a dictionary added by another process since ours were loaded
+        return payload_codec(reload=True).decode(dict_id, data)
+
+def recipe_row(user_id: str, title: str, payload: Dict[str, Any], prefs: Optional[Dict[str, Any]] = None) -> tuple:
+    """SQL_PUSH_RECIPE parameters for a recipe."""
+    # prefs are stored canonically (sorted keys) so identical requests group together
+    prefs_json = json.dumps(prefs, sort_keys=True) if prefs is not None else None
+    digest, dict_id, data = payload_codec().encode(payload)
+    return (user_id, title, prefs_json, digest, dict_id, data)
+
+def push_recipe(user_id: str, title: str, payload: Dict[str, Any], prefs: Optional[Dict[str, Any]] = None):
+    get_storage().enqueue(SQL_PUSH_RECIPE, recipe_row(user_id, title, payload, prefs))
+
+def popular_preferences(limit: int = 50) -> List[Tuple[Dict[str, Any], int]]:
+    """Most frequently requested preference combinations as (prefs, count)."""
+    store = get_storage()
+    store.flush()
+    return [(json.loads(r[0]), r[1]) for r in store.query(SQL_POPULAR_PREFS, (limit,))]
+
+def iter_recipes(after_id: int = 0, batch: int = 5000):
+    """Yield (id, payload_json, prefs_json) rows with id > after_id, in id order, a page at a time."""
+    store = get_storage()
+    store.flush()
+    while True:
+        rows = store.query(SQL_ITER_RECIPES, (after_id, batch))
+        for rid, payload, dict_id, data, prefs in rows:
+            yield rid, payload if data is None else decode_payload(dict_id, data), prefs
+        if len(rows) < batch:
+            return
+        after_id = rows[-1][0]
+
+def load_recipe(recipe_id: int) -> Optional[Dict[str, Any]]:
+    """One stored recipe by row id; None if it is gone (e.g. archived)."""
+    rows = get_storage().query(SQL_LOAD_RECIPE, (recipe_id,))
+    if not rows:
+        return None
+    payload, dict_id, data = rows[0]
+    return json.loads(payload if data is None else decode_payload(dict_id, data))
+
+def store_feedback(user_id: str, score: int, comment: str, recipe_key: Optional[str] = None,
+                   title: Optional[str] = None, region: Optional[str] = None, spice_level: Optional[int] = None):
+    # the feedback_stats triggers update the aggregates in the writer's transaction
+    get_storage().enqueue(SQL_STORE_FEEDBACK, (user_id, score, comment, recipe_key, title, region, spice_level))
+
+def _rating(row: tuple) -> Dict[str, Any]:
+    key, title, n, mean, score = row[:5]
+    return {"key": key, "title": title, "n": n, "mean": mean, "score": score, "histogram": list(row[5:])}
+
+def top_rated(scope: str = "recipe", k: int = 10, worst: bool = False) -> List[Dict[str, Any]]:
+    """
+    The k best (or, with worst=True, worst) rated keys of a scope ('recipe',
+    'region' or 'spice') by Bayesian average, read off an index.
+    """
+    store = get_storage()
+    store.flush()
+    return [_rating(r) for r in store.query(SQL_BOTTOM_RATED if worst else SQL_TOP_RATED, (scope, k))]
+
+def rating(scope: str, key: str) -> Optional[Dict[str, Any]]:
+    rows = get_storage().query(SQL_RATING, (scope, str(key)))
+    return _rating(rows[0]) if rows else None
+
+def iter_changed_ratings(after_id: int = 0, batch: int = 5000):
+    """Yield (scope, key, score, n, last_id) for aggregates changed by feedback rows with id > after_id."""
+    store = get_storage()
+    store.flush()
+    while True:
+        rows = store.query(SQL_CHANGED_RATINGS, (after_id, batch))
+        yield from rows
+        if len(rows) < batch:
+            return
+        after_id = rows[-1][4]
+
+def store_cached_recipe(cache_key: str, variant: int, payload: Dict[str, Any], created_at: int):
+    get_storage().enqueue(SQL_CACHE_PUT, (cache_key, variant, json.dumps(payload), created_at))
+
+def load_cached_recipes(cache_key: str, min_created: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+    """(created_at, payload) of the key's variants created at or after `min_created`."""
+    rows = get_storage().query(SQL_CACHE_GET, (cache_key, min_created))
+    return [(r[0], json.loads(r[1])) for r in rows]
+
+def store_chat_answer(key: str, question: str, answer: str, last_used: int):
+    get_storage().enqueue(SQL_CHAT_CACHE_PUT, (key, question, answer, last_used))
+
+def touch_chat_answer(key: str, last_used: int):
+    get_storage().enqueue(SQL_CHAT_CACHE_TOUCH, (last_used, key))
+
+def delete_chat_answer(key: str):
+    get_storage().enqueue(SQL_CHAT_CACHE_DELETE, (key,))
+
+def load_chat_answers(limit: int) -> List[Tuple[str, str, str]]:
+    """Up to `limit` cached (key, question, answer) rows, most recently used first."""
+    store = get_storage()
+    store.flush()
+    return [(r[0], r[1], r[2]) for r in store.query(SQL_CHAT_CACHE_LOAD, (limit,))]
+
+def spill_history(user_id: str, seq: int, who: str, text: str):
+    get_storage().enqueue(SQL_SPILL_HISTORY, (user_id, seq, who, text))
+
+def load_history(user_id: str, before_seq: int, limit: int = 50) -> List[Tuple[str, str]]:
+    """Up to `limit` spilled turns with seq < before_seq, oldest first."""
+    store = get_storage()
+    store.flush()
+    rows = store.query(SQL_LOAD_HISTORY, (user_id, before_seq, limit))
+    return [(r[0], r[1]) for r in reversed(rows)]
+
+def load_session(user_id: str) -> Optional[Tuple[int, str]]:
+    """(version, serialized state) for a stored session, or None."""
+    rows = get_storage().query(SQL_LOAD_SESSION, (user_id,))
+    return (rows[0][0], rows[0][1]) if rows else None
+
+def save_session(user_id: str, state: str, expected_version: int) -> bool:
+    """
+    Compare-and-set write: succeeds only if the stored version still equals
+    `expected_version` (0 = not stored yet). The stored version becomes
+    expected_version + 1.
+    """
+    now = int(time.time())
+    if expected_version == 0:
+        return get_storage().execute(SQL_INSERT_SESSION, (user_id, state, now)) == 1
+    return get_storage().execute(SQL_UPDATE_SESSION, (state, now, user_id, expected_version)) == 1
+
+def session_version(user_id: str) -> int:
+    """Stored version of a session, 0 if it is not stored yet."""
+    rows = get_storage().query(SQL_SESSION_VERSION, (user_id,))
+    return rows[0][0] if rows else 0
+
+def acquire_session_lease(user_id: str, owner: str, ttl: float) -> bool:
+    """Take the session's lease for `ttl` seconds unless someone else holds an unexpired one."""
+    now = time.time()
+    return get_storage().execute(SQL_ACQUIRE_LEASE, (user_id, owner, now + ttl, now)) == 1
+
+def release_session_lease(user_id: str, owner: str) -> None:
+    get_storage().execute(SQL_RELEASE_LEASE, (user_id, owner))
 
 def add_timer(user_id: str, label: str, wake_at: int):
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    cur.execute("INSERT INTO timers(user_id,label,wake_at,fired) VALUES (?,?,?,0)", (user_id, label, wake_at))
-    conn.commit()
-    conn.close()
-
-def fetch_due_timers(now_ts: int) -> List[Tuple[int, str]]:
-    conn = sqlite3.connect(DB)
-    cur = conn.cursor()
-    cur.execute("SELECT id,label FROM timers WHERE fired=0 AND wake_at<=?", (now_ts,))
-    rows = cur.fetchall()
-    ids = [r[0] for r in rows]
-    if ids:
-        q = "UPDATE timers SET fired=1 WHERE id IN ({})".format(",".join("?"*len(ids)))
-        cur.execute(q, ids)
-    conn.commit()
-    conn.close()
-    # return list of (id,label)
-    return [(r[0], r[1]) for r in rows]
+    get_timer_scheduler().add(user_id, label, wake_at)
+
+def cancel_timers(user_id: str):
+    get_timer_scheduler().cancel(user_id)
+
+def fetch_due_timers(now_ts: int, user_id: Optional[str] = None) -> List[Tuple[int, str]]:
+    """
+    Mark due timers as fired and return them as (id, label).
+    With `user_id` only that user's timers are considered, and the call skips the
+    database entirely when nothing can be due yet.
+    """
+    scheduler = get_timer_scheduler()
+    if user_id is not None:
+        return scheduler.fetch_due(user_id, now_ts)
+    scheduler.store.flush()
+    return scheduler._claim(SQL_DUE_TIMERS, (now_ts,))
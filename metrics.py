@@ -0,0 +1,277 @@
+"""
+metrics.py
+
+Low-overhead in-process instrumentation for the chef runtime.
+
+- `span(name, **labels)` times a block into a latency histogram and, when a
+  turn is being captured, into that turn's trace.
+- `inc(name, value, **labels)` bumps a counter (LLM tokens, calls, ...).
+- `capture()` records every span of one turn for a flame-style breakdown.
+- `to_json()` / `to_prometheus()` export the registry; `serve_prometheus(port)`
+  exposes it as a text endpoint.
+
+Histograms use fixed log-spaced buckets, so recording is a bisect and two adds
+under a lock; quantiles (p50/p95/p99) are estimated from the buckets.
+Set CHEF_METRICS=0 to turn recording off.
+"""
+
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+ENABLED = os.getenv("CHEF_METRICS", "1") != "0"
+
+# 50us .. ~105s, doubling
+BUCKETS = [0.00005 * (2 ** i) for i in range(22)]
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(BUCKETS, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+        return BUCKETS[-1]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Trace:
+    """Spans of one captured turn as (name, depth, start_offset, duration)."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, int, float, float]] = []
+        self.depth = 0
+
+    def flame(self) -> str:
+        """Indented breakdown of the turn, in start order, with a proportional bar."""
+        if not self.spans:
+            return "(no spans recorded)"
+        total = max(off + dur for _, _, off, dur in self.spans) or 1e-9
+        lines = []
+        for name, depth, off, dur in sorted(self.spans, key=lambda s: (s[2], s[1])):
+            bar = "#" * max(1, int(40 * dur / total))
+            lines.append(f"{'  ' * depth}{name:<{36 - 2 * depth}} {dur * 1000:9.2f} ms {bar}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> List[Dict[str, Any]]:
+        return [{"name": n, "depth": d, "start_ms": o * 1000, "duration_ms": t * 1000} for n, d, o, t in self.spans]
+
+
+_histograms: Dict[LabelKey, Histogram] = {}
+_counters: Dict[LabelKey, float] = {}
+_registry_lock = threading.Lock()
+_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+
+def _key(name: str, labels: Dict[str, Any]) -> LabelKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def histogram(name: str, **labels) -> Histogram:
+    key = _key(name, labels)
+    h = _histograms.get(key)
+    if h is None:
+        with _registry_lock:
+            h = _histograms.setdefault(key, Histogram())
+    return h
+
+
+def observe(name: str, value: float, **labels) -> None:
+    if ENABLED:
+        histogram(name, **labels).observe(value)
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _registry_lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextmanager
+def span(name: str, metric: str = "chef_span_seconds", label: str = "span", **labels):
+    """Time the block into `metric{<label>=name, **labels}` and the active trace, if any."""
+    if not ENABLED:
+        yield
+        return
+    trace: Optional[Trace] = _trace.get()
+    depth = 0
+    if trace is not None:
+        depth = trace.depth
+        trace.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        dur = time.perf_counter() - start
+        labels[label] = name
+        histogram(metric, **labels).observe(dur)
+        if trace is not None:
+            trace.depth -= 1
+            trace.spans.append((name, depth, start - trace.start, dur))
+
+
+@contextmanager
+def capture():
+    """Record all spans in this context into a Trace (yielded) for one turn."""
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def _usage_field(obj, name: str):
+    n = getattr(obj, name, None)
+    if n is None and isinstance(obj, dict):
+        n = obj.get(name)
+    return n
+
+
+def record_llm_usage(node: str, usage) -> None:
+    """
+    Count prompt/completion tokens from an OpenAI response `usage` object, and
+    the prompt tokens the provider served from its prompt cache (kind=cached).
+    """
+    if usage is None:
+        return
+    inc("chef_llm_calls_total", 1, node=node)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        n = _usage_field(usage, kind)
+        if n:
+            inc("chef_llm_tokens_total", n, node=node, kind=kind.split("_")[0])
+    cached = _usage_field(_usage_field(usage, "prompt_tokens_details"), "cached_tokens")
+    if cached:
+        inc("chef_llm_tokens_total", cached, node=node, kind="cached")
+
+
+def counters(name: str) -> Dict[Tuple[Tuple[str, str], ...], float]:
+    """Current values of counter `name`, by label set."""
+    with _registry_lock:
+        return {labels: v for (n, labels), v in _counters.items() if n == name}
+
+
+def histograms(name: str) -> Dict[Tuple[Tuple[str, str], ...], Histogram]:
+    """Histograms of metric `name`, by label set."""
+    with _registry_lock:
+        return {labels: h for (n, labels), h in _histograms.items() if n == name}
+
+
+def reset() -> None:
+    with _registry_lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _label_str(labels) -> str:
+    return ",".join(f"{k}={v}" for k, v in labels)
+
+
+def to_json() -> str:
+    out: Dict[str, Any] = {"histograms": {}, "counters": {}}
+    with _registry_lock:
+        hists = list(_histograms.items())
+        counters = list(_counters.items())
+    for (name, labels), h in hists:
+        out["histograms"].setdefault(name, {})[_label_str(labels)] = h.summary()
+    for (name, labels), v in counters:
+        out["counters"].setdefault(name, {})[_label_str(labels)] = v
+    return json.dumps(out, indent=2, sort_keys=True)
+
+
+def _prom_labels(labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def to_prometheus() -> str:
+    lines: List[str] = []
+    with _registry_lock:
+        hists = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    typed = set()
+    for (name, labels), h in hists:
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        cumulative = 0
+        for bound, c in zip(BUCKETS, h.counts):
+            cumulative += c
+            lines.append(f"{name}_bucket{_prom_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+        lines.append(f"{name}_bucket{_prom_labels(labels, (('le', '+Inf'),))} {h.count}")
+        lines.append(f"{name}_sum{_prom_labels(labels)} {h.sum}")
+        lines.append(f"{name}_count{_prom_labels(labels)} {h.count}")
+    for (name, labels), v in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_prom_labels(labels)} {v:g}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, ctype = to_json().encode("utf-8"), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, ctype = to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
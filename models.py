@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field, validator
+import re
+from pydantic import BaseModel, Field, root_validator, validator
 from typing import List, Optional, Literal
 
 Region = Literal["north", "south", "east", "west"]
@@ -19,3 +20,85 @@ class Preferences(BaseModel):
         if isinstance(v, str):
             return [s.strip().lower() for s in v.split(",") if s.strip()]
         return v
+
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(h|hr|hrs|hour|hours|m|min|mins|minute|minutes|s|sec|secs|second|seconds)?\b")
+_UNIT_SECONDS = {"h": 3600, "hr": 3600, "hrs": 3600, "hour": 3600, "hours": 3600,
+                 "m": 60, "min": 60, "mins": 60, "minute": 60, "minutes": 60}
+
+class Step(BaseModel):
+    text: str
+    timer_sec: Optional[int] = None
+    timer_label: Optional[str] = None
+
+    @validator("text", pre=True)
+    def non_empty_text(cls, v):
+        v = str(v or "").strip()
+        if not v:
+            raise ValueError("step text is empty")
+        return v
+
+    @validator("timer_sec", pre=True)
+    def seconds(cls, v):
+        # models write "300", 300.0 or "5 minutes"; all mean a number of seconds
+        if v is None or v == "":
+            return None
+        if isinstance(v, bool):
+            raise ValueError("timer_sec must be a number of seconds")
+        if isinstance(v, (int, float)):
+            v = int(round(v))
+        else:
+            total = 0.0
+            parts = _DURATION_RE.findall(str(v).lower())
+            for i, (num, unit) in enumerate(parts):
+                if not unit and i + 1 < len(parts):
+                    # "5-7 minutes": a bare number before another one is a range bound
+                    continue
+                total += float(num) * _UNIT_SECONDS.get(unit, 1)
+            if not total:
+                raise ValueError("timer_sec must be a number of seconds")
+            v = int(round(total))
+        return v if v > 0 else None
+
+class Recipe(BaseModel):
+    title: str
+    cultural_note: str = ""
+    ingredients: List[str]
+    steps: List[Step]
+    tips: List[str] = []
+    # number_of_people the quantities are for (see quantities.scale_recipe)
+    servings: Optional[int] = None
+
+    @validator("ingredients", pre=True)
+    def ingredient_lines(cls, v):
+        if not isinstance(v, list):
+            raise ValueError("ingredients must be a list")
+        lines = []
+        for item in v:
+            if isinstance(item, dict):
+                # {"name": "Paneer", "quantity": "250g"} -> "Paneer 250g"
+                item = " ".join(str(item[k]) for k in ("name", "item", "quantity", "amount", "unit") if item.get(k))
+            item = str(item or "").strip()
+            if item:
+                lines.append(item)
+        if not lines:
+            raise ValueError("ingredients list is empty")
+        return lines
+
+    @validator("steps", pre=True)
+    def step_objects(cls, v):
+        if not isinstance(v, list) or not v:
+            raise ValueError("steps must be a non-empty list")
+        return [{"text": s} if isinstance(s, str) else s for s in v]
+
+    @validator("tips", pre=True)
+    def tip_list(cls, v):
+        if v is None:
+            return []
+        return [v] if isinstance(v, str) else v
+
+    @root_validator(skip_on_failure=True)
+    def has_timer(cls, values):
+        if not any(s.timer_sec for s in values.get("steps", [])):
+            raise ValueError("at least one step needs timer_sec")
+        return values
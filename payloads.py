@@ -0,0 +1,132 @@
+"""
+payloads.py
+
+Storage format for recipe payloads: deduplicated and compressed.
+
+A recipe's canonical JSON (sorted keys, no whitespace) is hashed, and every
+row with the same hash shares one stored blob (memory.py, recipe_blobs), so
+the catalog and cache recipes that are served over and over are stored once.
+Blobs are raw deflate streams compressed against a preset dictionary (zlib's
+zdict) of strings that recur across recipes: the JSON keys, quantities,
+ingredients, techniques. A single 1 KB recipe has too little repetition of
+its own for plain zlib to do much; with the dictionary it compresses to a
+fraction of that.
+
+Dictionaries are numbered and stored in the database next to the blobs that
+use them. The first, SEED_DICTIONARY, is built from the vocabulary below;
+train_dictionary() builds one from stored recipes (maintenance.py does this
+once enough are stored). New payloads use the newest dictionary and older
+blobs keep decoding with theirs.
+"""
+
+import hashlib
+import json
+import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+# deflate only looks back 32 KB, so a longer dictionary is never used
+DICT_SIZE = 32 * 1024
+LEVEL = 6
+SEED_ID = 1
+
+# JSON strings with the punctuation around them ('"text":"', '"200g paneer",') and words
+_FRAGMENT_RE = re.compile(r'[\[{,]?"[^"]{1,120}"[:,\]}]*|[A-Za-z]{3,}\s?')
+
+_SKELETON = {
+    "title": "", "cultural_note": "", "servings": 4,
+    "ingredients": ["1 cup", "2 tbsp", "1 tsp", "1/2 tsp", "200g", "to taste"],
+    "steps": [{"text": "", "timer_sec": 300, "timer_label": ""}, {"text": "", "timer_label": None, "timer_sec": None}],
+    "tips": [""],
+}
+_VOCABULARY = """
+onion onions tomato tomatoes garlic ginger green chilli chillies coriander leaves cumin seeds mustard seeds
+turmeric powder red chilli powder garam masala salt oil ghee butter cream curd yogurt water rice basmati
+paneer chicken mutton lamb fish prawns egg eggs potato potatoes peas spinach cauliflower okra brinjal lentils
+dal chickpeas kidney beans flour atta besan semolina sugar jaggery tamarind lemon juice coconut milk curry
+leaves bay leaf cinnamon cardamom cloves fenugreek kasuri methi asafoetida hing black pepper fennel saffron
+heat the oil in a pan kadai pot add the and cook until soft golden brown fragrant stir fry saute simmer boil
+for minutes on low medium high heat cover the lid let it rest serve hot garnish with chopped fresh finely
+sliced diced grated crushed paste mix well bring to a boil reduce season to taste marinate knead dough roll
+grind blend the mixture pressure cook whistles temper tadka splutter add water as needed until thick
+Soak the rice soak overnight Serve with roti naan paratha steamed rice pickle raita salad
+A classic dish from North India South India Punjab Bengal Kerala Gujarat Rajasthan Hyderabad Maharashtra
+traditionally cooked during festivals family meals everyday comfort food street food
+"""
+
+
+def _seed() -> bytes:
+    skeleton = json.dumps(_SKELETON, sort_keys=True, separators=(",", ":"))
+    return (" ".join(_VOCABULARY.split()) + " " + skeleton).encode("utf-8")
+
+
+SEED_DICTIONARY = _seed()
+
+
+def canonical(payload: Dict) -> str:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8")).digest()[:16]
+
+
+def train_dictionary(samples: Iterable[str], size: int = DICT_SIZE) -> bytes:
+    """
+    A preset dictionary for payloads like `samples` (JSON texts): the
+    fragments that appear in the most samples, weighted by length, with the
+    most valuable last, where deflate reaches them with the shortest distances.
+    """
+    seen: Counter = Counter()
+    n = 0
+    for text in samples:
+        seen.update(set(_FRAGMENT_RE.findall(text)))
+        n += 1
+    # a fragment only a sample or two contain is not worth the space
+    floor = max(2, n // 100)
+    ranked = sorted((f for f, c in seen.items() if c >= floor), key=lambda f: seen[f] * (len(f) - 2), reverse=True)
+    picked, used = [], 0
+    for f in ranked:
+        size_f = len(f.encode("utf-8"))
+        if used + size_f > size:
+            continue
+        picked.append(f)
+        used += size_f
+    return "".join(reversed(picked)).encode("utf-8")
+
+
+@lru_cache(maxsize=8)
+def _primed(zdict: bytes):
+    # loading a dictionary costs more than compressing a recipe; copies of a primed compressor skip it
+    if zdict:
+        return zlib.compressobj(LEVEL, zlib.DEFLATED, -15, 8, zlib.Z_DEFAULT_STRATEGY, zdict)
+    return zlib.compressobj(LEVEL, zlib.DEFLATED, -15, 8)
+
+
+@lru_cache(maxsize=1024)
+def _compress(text: str, zdict: bytes) -> bytes:
+    # repeat recipes (catalog and cache hits) are pushed again and again
+    c = _primed(zdict).copy()
+    return c.compress(text.encode("utf-8")) + c.flush()
+
+
+class Codec:
+    """Encodes payloads with the newest of `dictionaries` ({id: bytes}) and decodes with any of them."""
+
+    def __init__(self, dictionaries: Dict[int, bytes]):
+        self.dictionaries = dict(dictionaries)
+        self.current: Optional[int] = max(self.dictionaries) if self.dictionaries else None
+
+    def encode(self, payload: Dict) -> Tuple[bytes, Optional[int], bytes]:
+        """(content hash, dictionary id, compressed canonical JSON)."""
+        text = canonical(payload)
+        zdict = self.dictionaries[self.current] if self.current is not None else b""
+        return content_hash(text), self.current, _compress(text, zdict)
+
+    def decode(self, dict_id: Optional[int], data: bytes) -> str:
+        """The JSON text of a blob; KeyError for a dictionary this codec has not loaded."""
+        zdict = self.dictionaries[dict_id] if dict_id is not None else b""
+        d = zlib.decompressobj(-15, zdict=zdict) if zdict else zlib.decompressobj(-15)
+        return (d.decompress(data) + d.flush()).decode("utf-8")
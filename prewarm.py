@@ -0,0 +1,70 @@
+"""
+prewarm.py
+
+Fill the recipe cache ahead of traffic with the most requested preference
+combinations from the recipes table, plus an optional grid of combinations.
+
+    python prewarm.py --top 50 --workers 8 --rps 5
+    python prewarm.py --grid --base-url http://127.0.0.1:8000/v1   # against a local stub
+"""
+
+import argparse
+import itertools
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import memory
+from agents import recipe
+from models import Preferences
+
+
+def grid_preferences():
+    """The combinations most traffic clusters around: 2-4 people, north/south, spice 3-6."""
+    for people, region, spice in itertools.product((2, 3, 4), ("north", "south"), (3, 4, 5, 6)):
+        yield Preferences(number_of_people=people, spice_level=spice,
+                          region_preference=region, preference_type="none")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--top", type=int, default=50, help="most requested combinations to prewarm")
+    ap.add_argument("--grid", action="store_true", help="also prewarm the popular grid")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--rps", type=float, default=5.0, help="LLM requests per second")
+    ap.add_argument("--force", action="store_true", help="regenerate keys that are already cached")
+    ap.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. a local stub")
+    args = ap.parse_args()
+
+    if args.base_url:
+        from llm import LLMGateway
+        recipe.gateway = LLMGateway(api_key=os.getenv("OPENAI_API_KEY") or "prewarm", base_url=args.base_url)
+
+    memory.init_db()
+    prefs_list = []
+    for raw, _count in memory.popular_preferences(args.top):
+        try:
+            prefs_list.append(Preferences(**raw))
+        except Exception:
+            continue
+    if args.grid:
+        prefs_list.extend(grid_preferences())
+    if not prefs_list:
+        print("nothing to prewarm")
+        return
+
+    start = time.perf_counter()
+    results = recipe.generate_batch(prefs_list, max_workers=args.workers,
+                                    requests_per_sec=args.rps, force=args.force)
+    elapsed = time.perf_counter() - start
+    memory.get_storage().flush()
+    ok = sum(r is not None for r in results)
+    print(f"{len(prefs_list)} requested, {ok} cached, {elapsed:.2f}s "
+          f"({len(prefs_list) / elapsed:.1f} requests/s), cache {recipe.recipe_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+prompts.py
+
+Prompt assembly for recipe generation.
+
+Every recipe request starts with the same system message: the persona from
+prompt/chef_persona.md (read once per process, whitespace normalized) plus
+the generation rules the persona does not already state. It is built once
+and is byte-identical across requests, users and processes, so providers
+that cache prompt prefixes can serve it from their cache; nothing
+per-request may go into it. The user message carries only the request, with
+the preferences packed into one short line (compact_prefs).
+
+The reply is bounded by the rules (at most MAX_INGREDIENTS ingredients,
+MAX_STEPS steps, MAX_TIPS tips), so recipe_max_tokens() sizes max_tokens from
+a per-field token budget instead of a flat 1000.
+"""
+
+import math
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List
+
+from cache import canonical_prefs
+
+PERSONA_FILE = Path(__file__).resolve().parent / "prompt" / "chef_persona.md"
+
+MAX_INGREDIENTS = 12
+MAX_STEPS = 8
+MAX_TIPS = 3
+
+RULES = (f"JSON only, no code fences; timer_sec in whole seconds. Scale quantities to the people and heat to "
+         f"the spice level (0-10). At most {MAX_INGREDIENTS} ingredients, {MAX_STEPS} short steps, {MAX_TIPS} tips.")
+
+# completion tokens each part of a reply may take, JSON included; see recipe_max_tokens()
+TOKEN_BUDGET = {"frame": 30, "title": 15, "cultural_note": 60, "ingredient": 10, "step": 45, "tip": 30}
+# headroom over the budget before a reply is cut off at max_tokens
+MAX_TOKENS_HEADROOM = 1.25
+# 0: from TOKEN_BUDGET
+RECIPE_MAX_TOKENS = int(os.getenv("RECIPE_MAX_TOKENS") or 0)
+USER_PREFIX = "Recipe for: "
+
+
+@lru_cache(maxsize=1)
+def persona() -> str:
+    """The system prompt section of the persona pack, read once."""
+    text = PERSONA_FILE.read_text(encoding="utf-8")
+    _, sep, rest = text.partition("System prompt:")
+    text = rest if sep else text
+    lines: List[str] = []
+    for line in text.strip().splitlines():
+        line = " ".join(line.split())
+        if line.startswith("- ") and lines:
+            # a bulleted list goes on one line after its heading
+            sep = " " if lines[-1].endswith((":", ".")) else "; "
+            lines[-1] += sep + line[2:]
+        elif line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=1)
+def system_prompt() -> str:
+    """Persona plus generation rules; the byte-stable shared prefix of every recipe request."""
+    return f"{persona()}\n{RULES}"
+
+
+def compact_prefs(prefs) -> str:
+    """
+    Preferences as one line, e.g.
+    "people=4; spice=6/10; region=north; focus=dietary; allergies=peanuts,shrimp".
+    Empty lists and a "none" preference type are left out.
+    """
+    p = canonical_prefs(prefs)
+    parts = [f"people={p.get('number_of_people')}", f"spice={p.get('spice_level')}/10",
+             f"region={p.get('region_preference')}"]
+    if p.get("preference_type") and p["preference_type"] != "none":
+        parts.append(f"focus={p['preference_type']}")
+    for k in ("allergies", "dislikes"):
+        if p.get(k):
+            parts.append(f"{k}={','.join(p[k])}")
+    return "; ".join(parts)
+
+
+def recipe_messages(prefs) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": system_prompt()},
+        {"role": "user", "content": USER_PREFIX + compact_prefs(prefs)},
+    ]
+
+
+def recipe_max_tokens() -> int:
+    """max_tokens for a recipe reply: the largest recipe RULES allow, plus headroom."""
+    if RECIPE_MAX_TOKENS:
+        return RECIPE_MAX_TOKENS
+    b = TOKEN_BUDGET
+    largest = (b["frame"] + b["title"] + b["cultural_note"] + MAX_INGREDIENTS * b["ingredient"]
+               + MAX_STEPS * b["step"] + MAX_TIPS * b["tip"])
+    return int(math.ceil(largest * MAX_TOKENS_HEADROOM / 10) * 10)
@@ -0,0 +1,264 @@
+"""
+quantities.py
+
+Deterministic ingredient quantity parsing and scaling.
+
+parse_ingredient() reads lines the model writes in either order ("Tomatoes
+500g", "2 tbsp oil", "Green chillies 2-3", "1 1/2 cups rice", "Salt to taste")
+into name / quantity / unit. scale_line() multiplies the line's quantity (the
+first one outside parentheses; pack sizes like "(400g)" and later numbers
+such as "cut into 2 inch pieces" stay as written), converts between units of
+the same kind (g/kg, ml/l, tsp/tbsp/cup) so results read naturally, and
+rounds to amounts a cook would measure. scale_recipe()
+does that for a whole recipe so a change of number_of_people does not need a
+new generation; it returns None when a line cannot be read, so the caller can
+fall back to the LLM.
+"""
+
+import re
+from fractions import Fraction
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+_UNICODE_FRACTIONS = {"½": Fraction(1, 2), "¼": Fraction(1, 4), "¾": Fraction(3, 4), "⅓": Fraction(1, 3),
+                      "⅔": Fraction(2, 3), "⅛": Fraction(1, 8)}
+
+# unit spelling -> (canonical unit, kind, size in the kind's base unit)
+UNITS: Dict[str, Tuple[str, str, Fraction]] = {}
+for _names, _canon, _kind, _size in (
+    (("g", "gm", "gms", "gram", "grams", "gr"), "g", "mass", 1),
+    (("kg", "kgs", "kilo", "kilos", "kilogram", "kilograms"), "kg", "mass", 1000),
+    (("ml", "millilitre", "millilitres", "milliliter", "milliliters"), "ml", "volume", 1),
+    (("l", "litre", "litres", "liter", "liters", "ltr"), "l", "volume", 1000),
+    (("tsp", "tsps", "teaspoon", "teaspoons"), "tsp", "spoon", 5),
+    (("tbsp", "tbsps", "tablespoon", "tablespoons", "tbs"), "tbsp", "spoon", 15),
+    (("cup", "cups"), "cup", "spoon", 240),
+):
+    for _n in _names:
+        UNITS[_n] = (_canon, _kind, Fraction(_size))
+
+# units that only count things; scaled but never converted
+COUNT_UNITS = {"clove", "cloves", "pinch", "pinches", "piece", "pieces", "sprig", "sprigs", "inch", "inches",
+               "can", "cans", "bunch", "bunches", "handful", "handfuls", "slice", "slices", "stick", "sticks",
+               "leaf", "leaves", "pod", "pods", "stalk", "stalks", "packet", "packets", "dash", "dashes"}
+
+_NUM = r"\d+\s+\d+/\d+|\d+/\d+|\d+\s*[½¼¾⅓⅔⅛]|\d+(?:\.\d+)?|[½¼¾⅓⅔⅛]"
+_UNIT_ALT = "|".join(sorted(set(UNITS) | COUNT_UNITS, key=len, reverse=True))
+QTY_RE = re.compile(
+    rf"(?<![\w/.])(?P<low>{_NUM})(?:\s*(?:-|–|to)\s*(?P<high>{_NUM}))?"
+    rf"(?P<space>\s*)(?P<unit>(?:{_UNIT_ALT})\b)?(?![A-Za-z0-9])",
+    re.IGNORECASE,
+)
+_DIGIT_RE = re.compile(r"\d|[½¼¾⅓⅔⅛]")
+
+
+class Ingredient(NamedTuple):
+    name: str
+    quantity: Optional[Fraction]
+    quantity_max: Optional[Fraction]
+    unit: Optional[str]
+    raw: str
+
+
+def parse_number(text: str) -> Fraction:
+    text = text.strip()
+    if text[-1] in _UNICODE_FRACTIONS:
+        whole = text[:-1].strip()
+        return (Fraction(whole) if whole else 0) + _UNICODE_FRACTIONS[text[-1]]
+    if " " in text:
+        whole, frac = text.split(None, 1)
+        return Fraction(whole) + Fraction(frac)
+    return Fraction(text)
+
+
+def format_number(value: Fraction, decimal: bool = False) -> str:
+    """1.5 -> "1 1/2" (or "1.5" with decimal=True), 2 -> "2"."""
+    if decimal:
+        return f"{float(value):.2f}".rstrip("0").rstrip(".")
+    whole, rest = divmod(value.numerator, value.denominator)
+    if not rest:
+        return str(whole)
+    frac = f"{rest}/{value.denominator}"
+    return f"{whole} {frac}" if whole else frac
+
+
+def parse_ingredient(line: str) -> Optional[Ingredient]:
+    """
+    Name, quantity (range upper bound in quantity_max) and canonical unit of a
+    line. Lines without any quantity ("Salt to taste") parse with quantity None;
+    lines with numbers that cannot be read return None.
+    """
+    m = _leading(line)
+    if m is None:
+        return None if _DIGIT_RE.search(line) else Ingredient(_clean_name(line), None, None, None, line)
+    try:
+        low = parse_number(m.group("low"))
+        high = parse_number(m.group("high")) if m.group("high") else None
+    except (ValueError, ZeroDivisionError):
+        return None
+    unit = m.group("unit")
+    if unit:
+        unit = UNITS.get(unit.lower(), (unit.lower(), "count", 1))[0]
+    name = _clean_name(line[:m.start()] + " " + line[m.end():])
+    return Ingredient(name, low, high, unit, line)
+
+
+def _leading(line: str) -> Optional["re.Match"]:
+    """The first quantity outside parentheses: the amount of the ingredient."""
+    for m in QTY_RE.finditer(line):
+        if line.count("(", 0, m.start()) <= line.count(")", 0, m.start()):
+            return m
+    return None
+
+
+def _clean_name(text: str) -> str:
+    return re.sub(r"\s+([,;])", r"\1", re.sub(r"\s+", " ", text)).strip(" ,;:-()")
+
+
+def _to_float(text: str) -> float:
+    text = text.strip()
+    if text[-1] in _UNICODE_FRACTIONS:
+        whole = text[:-1].strip()
+        return (float(whole) if whole else 0.0) + float(_UNICODE_FRACTIONS[text[-1]])
+    total = 0.0
+    for part in text.split():
+        if "/" in part:
+            num, den = part.split("/")
+            total += int(num) / int(den)
+        else:
+            total += float(part)
+    return total
+
+
+def _round(value: float, unit: Optional[str]) -> Fraction:
+    """Round to what a cook would measure in this unit."""
+    if value <= 0:
+        return Fraction(0)
+    # (numerator, denominator) of the measuring step
+    if unit in ("g", "ml"):
+        step = (1, 1) if value < 10 else (5, 1) if value < 200 else (10, 1)
+    elif unit in ("kg", "l"):
+        step = (1, 10)
+    elif unit in ("tsp", "tbsp", "cup"):
+        step = (1, 4)
+    else:
+        step = (1, 2) if value < 5 else (1, 1)
+    steps = max(1, int(value * step[1] / step[0] + 0.5))
+    return Fraction(steps * step[0], step[1])
+
+
+def _convert(value: float, unit: str) -> Tuple[float, str]:
+    """Re-express value in the most readable unit of the same kind."""
+    canon, kind, size = UNITS[unit]
+    base = value * float(size)
+    if kind == "mass":
+        return (base / 1000, "kg") if base >= 1000 else (base, "g")
+    if kind == "volume":
+        return (base / 1000, "l") if base >= 1000 else (base, "ml")
+    if base < 15:
+        return base / 5, "tsp"
+    if base < 120:
+        return base / 15, "tbsp"
+    return base / 240, "cup"
+
+
+# unit words that take a plural form; abbreviations (g, tbsp) and "inch" do not
+_PLURAL_UNITS = (COUNT_UNITS | {"cup", "cups", "teaspoon", "teaspoons", "tablespoon", "tablespoons"}) \
+    - {"inch", "inches"}
+
+
+def _plural(unit_text: str, value) -> str:
+    lower = unit_text.lower()
+    if lower not in _PLURAL_UNITS:
+        return unit_text
+    if value > 1 and not lower.endswith("s"):
+        if lower.endswith("f"):
+            return unit_text[:-1] + "ves"
+        return unit_text + ("es" if lower.endswith(("ch", "sh")) else "s")
+    if value <= 1 and lower.endswith("ves") and lower[:-3] + "f" in _PLURAL_UNITS:
+        return unit_text[:-3] + "f"
+    if value <= 1 and lower.endswith("es") and lower[:-2] in _PLURAL_UNITS:
+        return unit_text[:-2]
+    if value <= 1 and lower.endswith("s") and lower[:-1] in _PLURAL_UNITS:
+        return unit_text[:-1]
+    return unit_text
+
+
+def _scale_match(m: "re.Match", factor: float) -> str:
+    low = _to_float(m.group("low")) * factor
+    high = _to_float(m.group("high")) * factor if m.group("high") else None
+    unit_text = m.group("unit") or ""
+    unit = UNITS.get(unit_text.lower())
+    if unit:
+        canon = unit[0]
+        low, new_unit = _convert(low, unit_text.lower())
+        if high is not None:
+            # both ends of a range stay in the unit chosen for the lower end
+            high = high * float(UNITS[unit_text.lower()][2] / UNITS[new_unit][2])
+        if new_unit != canon:
+            unit_text = new_unit
+        unit_key = new_unit
+        unit_text = _plural(unit_text, _round(high if high is not None else low, unit_key))
+    else:
+        unit_key = None
+        unit_text = _plural(unit_text, _round(high if high is not None else low, None)) if unit_text else ""
+    decimal = unit_key in ("kg", "l")
+    out = format_number(_round(low, unit_key), decimal)
+    if high is not None:
+        out += "-" + format_number(_round(high, unit_key), decimal)
+    if unit_text:
+        out += (m.group("space") or (" " if len(unit_text) > 2 else "")) + unit_text
+    else:
+        out += m.group("space")
+    return out
+
+
+@lru_cache(maxsize=8192)
+def _scale_line(line: str, factor: float) -> Optional[str]:
+    if _DIGIT_RE.search(QTY_RE.sub("", line)):
+        return None
+    m = _leading(line)
+    if m is None:
+        return line
+    try:
+        return line[:m.start()] + _scale_match(m, factor) + line[m.end():]
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def scale_line(line: str, factor) -> Optional[str]:
+    """The line with its quantity multiplied by factor, or None if a number in it cannot be read."""
+    factor = float(factor)
+    if factor == 1.0:
+        return None if _DIGIT_RE.search(QTY_RE.sub("", line)) else line
+    # recipes repeat the same lines ("Salt to taste", "Oil 2 tbsp"), so results are memoized
+    return _scale_line(line, factor)
+
+
+def scale_ingredients(lines: List[str], factor) -> Optional[List[str]]:
+    out = []
+    for line in lines:
+        scaled = scale_line(str(line), factor)
+        if scaled is None:
+            return None
+        out.append(scaled)
+    return out
+
+
+def scale_recipe(recipe: Dict[str, Any], people: int) -> Optional[Dict[str, Any]]:
+    """
+    A copy of recipe with ingredients rescaled from recipe["servings"] to
+    `people`, or None when the servings are unknown or a line cannot be read.
+    """
+    servings = recipe.get("servings")
+    if not servings or not people:
+        return None
+    if int(servings) == int(people):
+        return dict(recipe)
+    lines = scale_ingredients(recipe.get("ingredients") or [], Fraction(int(people), int(servings)))
+    if lines is None:
+        return None
+    scaled = dict(recipe)
+    scaled["ingredients"] = lines
+    scaled["servings"] = int(people)
+    return scaled
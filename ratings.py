@@ -0,0 +1,73 @@
+"""
+ratings.py
+
+Feedback scores, mirrored in-process for ranking.
+
+memory.py keeps running aggregates per recipe, region and spice level in
+feedback_stats, updated by triggers in the same transaction as each feedback
+insert. Ratings copies their scores (Bayesian averages, see
+memory.FEEDBACK_PRIOR_MEAN) into a dict, pulling only the aggregates changed
+since its last refresh, so the catalog and the recipe cache can rank by
+rating without a query per lookup.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import memory
+from metrics import span
+
+# recipes at or above LIKED_SCORE are served first, at or below DISLIKED_SCORE not at all
+LIKED_SCORE = float(os.getenv("RATING_LIKED_SCORE") or 3.5)
+DISLIKED_SCORE = float(os.getenv("RATING_DISLIKED_SCORE") or 2.5)
+RATINGS_REFRESH_SEC = float(os.getenv("RATINGS_REFRESH_SEC") or 60)
+
+
+class Ratings:
+    def __init__(self):
+        # (scope, key) -> (score, number of ratings)
+        self._scores: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+        self.last_id = 0
+        self.refreshed_at = 0.0
+        # bumped whenever a refresh changes anything, so dependants can skip rebuilding
+        self.version = 0
+
+    def refresh(self) -> int:
+        """Pick up aggregates changed since the last refresh; returns how many changed."""
+        changed = 0
+        with span("ratings.refresh", metric="chef_db_seconds"):
+            for scope, key, score, n, last_id in memory.iter_changed_ratings(self.last_id):
+                with self._lock:
+                    self._scores[(scope, key)] = (score, n)
+                self.last_id = max(self.last_id, last_id)
+                changed += 1
+        if changed:
+            self.version += 1
+        self.refreshed_at = time.time()
+        return changed
+
+    def score(self, scope: str, key: str) -> Optional[float]:
+        found = self._scores.get((scope, str(key)))
+        return found[0] if found else None
+
+    def scores(self, scope: str) -> Dict[str, float]:
+        with self._lock:
+            return {k: v[0] for (s, k), v in self._scores.items() if s == scope}
+
+
+_ratings: Optional[Ratings] = None
+_ratings_lock = threading.Lock()
+
+
+def get_ratings() -> Ratings:
+    """The process-wide Ratings, refreshed every RATINGS_REFRESH_SEC."""
+    global _ratings
+    with _ratings_lock:
+        if _ratings is None:
+            _ratings = Ratings()
+        if time.time() - _ratings.refreshed_at >= RATINGS_REFRESH_SEC:
+            _ratings.refresh()
+    return _ratings
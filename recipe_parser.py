@@ -0,0 +1,214 @@
+"""
+recipe_parser.py
+
+Tolerant parsing of LLM recipe replies.
+
+extract_json() finds the first JSON object in a reply (code fences and prose
+around it are ignored), repairs the mistakes models commonly make (trailing
+commas, Python literals, smart quotes, a reply cut off mid-object) and loads
+it. parse_recipe() then validates it against models.Recipe, which coerces what
+it safely can ("5 minutes" -> 300, bare step strings, ingredient objects).
+
+What validation still rejects is reported per top-level field, so the caller
+can send only those fields back to the model (repair_messages / apply_repair)
+instead of generating the whole recipe again. A reply the model stopped at
+max_tokens (truncated=True) is never served as it loads: the field it was
+cut off in, and the fields it never reached, go to repair too.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from pydantic import ValidationError
+
+from models import Recipe
+
+_FIELDS = ("title", "cultural_note", "ingredients", "steps", "tips", "servings")
+# the fields the prompt asks for
+_ASKED = ("title", "cultural_note", "ingredients", "steps", "tips")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_BARE_WORD_RE = re.compile(r"[A-Za-z_]+")
+
+
+class ParseResult(NamedTuple):
+    # validated recipe dict, or None
+    recipe: Optional[Dict[str, Any]]
+    # the JSON object as loaded, before validation (None if there was none)
+    data: Optional[Dict[str, Any]]
+    # top-level field -> validation messages
+    errors: Dict[str, List[str]]
+    # True when the JSON text needed local repair to load
+    repaired: bool = False
+
+
+def find_object(text: str) -> Optional[str]:
+    """
+    The first balanced {...} in text. A reply that ends inside the object is
+    closed off (open string, arrays and objects) so what did arrive can load.
+    """
+    return _scan(text)[0]
+
+
+def _scan(text: str):
+    # (first object, False if it had to be closed off)
+    start = text.find("{")
+    if start < 0:
+        return None, False
+    stack: List[str] = []
+    in_str = esc = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                return text[start:i + 1], True
+    tail = text[start:]
+    if esc:
+        tail = tail[:-1]
+    if in_str:
+        tail += '"'
+    tail = tail.rstrip().rstrip(",:")
+    return tail + "".join(reversed(stack)), False
+
+
+def repair_json(text: str) -> str:
+    """Drop trailing commas and map Python literals / smart quotes to JSON, outside strings."""
+    text = text.translate(_SMART_QUOTES)
+    out: List[str] = []
+    in_str = esc = False
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if in_str:
+            out.append(ch)
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            elif ch == "\n":
+                # raw newline inside a string is invalid JSON
+                out[-1] = "\\n"
+            i += 1
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch == ",":
+            j = i + 1
+            while j < n and text[j].isspace():
+                j += 1
+            if j < n and text[j] in "}]":
+                i += 1
+                continue
+        elif ch.isalpha():
+            m = _BARE_WORD_RE.match(text, i)
+            word = m.group(0)
+            out.append(_PY_LITERALS.get(word, word))
+            i = m.end()
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def extract_json(text: str):
+    """(object, repaired) for the first JSON object in text; (None, False) if there is none."""
+    text = (text or "").strip()
+    try:
+        data = json.loads(text)
+        return (data, False) if isinstance(data, dict) else (None, False)
+    except ValueError:
+        pass
+    candidate = find_object(text)
+    if candidate is None:
+        return None, False
+    for attempt in (candidate, repair_json(candidate)):
+        try:
+            data = json.loads(attempt)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data, True
+    return None, False
+
+
+def _errors_by_field(exc: ValidationError) -> Dict[str, List[str]]:
+    errors: Dict[str, List[str]] = {}
+    for err in exc.errors():
+        field = str(err["loc"][0]) if err["loc"] else "__root__"
+        # the only model-level rule is about step timers
+        if field == "__root__":
+            field = "steps"
+        where = ".".join(str(p) for p in err["loc"][1:])
+        errors.setdefault(field, []).append(f"{where}: {err['msg']}" if where else err["msg"])
+    return errors
+
+
+def validate(data: Dict[str, Any], repaired: bool = False) -> ParseResult:
+    try:
+        recipe = Recipe(**{k: v for k, v in data.items() if k in _FIELDS})
+    except ValidationError as e:
+        return ParseResult(None, data, _errors_by_field(e), repaired)
+    return ParseResult(recipe.dict(exclude_none=True), data, {}, repaired)
+
+
+def parse_recipe(text: str, truncated: bool = False) -> ParseResult:
+    """
+    Parse and validate a reply. `truncated`: the model stopped at max_tokens
+    (finish_reason "length"); if that cut the object short, nothing is served
+    without a repair.
+    """
+    data, repaired = extract_json(text)
+    if data is None:
+        return ParseResult(None, None, {"__json__": ["no JSON object found"]}, False)
+    if truncated and not _scan((text or "").strip())[1]:
+        return _cut_off(data)
+    return validate(data, repaired)
+
+
+def _cut_off(data: Dict[str, Any]) -> ParseResult:
+    errors = {f: ["missing: the reply was cut off before it"] for f in _ASKED if f not in data}
+    present = [k for k in data if k in _FIELDS]
+    if present:
+        errors[present[-1]] = ["cut off part way: give the complete value"]
+    return ParseResult(None, data, errors, True)
+
+
+def repair_messages(result: ParseResult) -> List[Dict[str, str]]:
+    """A short prompt carrying only the fields that failed validation."""
+    fragment = {f: result.data.get(f) for f in result.errors}
+    problems = "\n".join(f"- {f}: {m}" for f, msgs in result.errors.items() for m in msgs)
+    return [
+        {"role": "system", "content": "You fix fields of a JSON recipe. Reply with JSON only."},
+        {"role": "user", "content": (
+            f"These recipe fields failed validation:\n{problems}\n\n"
+            f"Fields:\n{json.dumps(fragment, ensure_ascii=False)}\n\n"
+            "Steps are {text, optional timer_sec (integer seconds), optional timer_label}; "
+            "at least one step needs timer_sec. Return a JSON object with only these keys, corrected."
+        )},
+    ]
+
+
+def apply_repair(result: ParseResult, reply: str) -> Optional[Dict[str, Any]]:
+    """Merge the model's corrected fields into the original object and validate again."""
+    fixed, _ = extract_json(reply)
+    if not fixed:
+        return None
+    merged = dict(result.data)
+    merged.update({k: v for k, v in fixed.items() if k in result.errors})
+    return validate(merged).recipe
@@ -0,0 +1,132 @@
+"""
+router.py
+
+Table-driven intent routing for the supervisor.
+
+A routing table is a list of Route entries. Router compiles their keywords
+once into a token index (single words and multi-word phrases keyed on their
+first token), so matching a message is one tokenization plus dict lookups and
+whole words only: "make" no longer fires inside "makhani", nor "hi" inside
+"chicken". Routes are tried in priority order; a route fires when its keywords
+(if any) matched and its context predicate (if any) holds.
+
+When no route fires, an optional local classifier (multinomial naive Bayes
+over tokens, trained on the routes' example messages plus examples of the
+default node, no network) gets a chance before the default node.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+
+def tokenize(message: str) -> Tuple[str, ...]:
+    return tuple(_TOKEN_RE.findall(message.lower()))
+
+
+class Route(NamedTuple):
+    node: str
+    reason: str
+    priority: int = 0
+    # words or phrases that may appear anywhere in the message
+    keywords: Tuple[str, ...] = ()
+    # whole-message matches (after normalization)
+    exact: Tuple[str, ...] = ()
+    when: Optional[Predicate] = None
+    # sample messages for the local classifier tier
+    examples: Tuple[str, ...] = ()
+
+
+class LocalIntentClassifier:
+    """Multinomial naive Bayes over message tokens with add-one smoothing."""
+
+    def __init__(self, examples: Iterable[Tuple[str, str]]):
+        self.word_counts: Dict[str, Counter] = defaultdict(Counter)
+        label_counts: Counter = Counter()
+        for text, label in examples:
+            label_counts[label] += 1
+            self.word_counts[label].update(tokenize(text))
+        total = sum(label_counts.values()) or 1
+        self.vocab = {w for c in self.word_counts.values() for w in c}
+        self.log_prior = {lbl: math.log(n / total) for lbl, n in label_counts.items()}
+        self.totals = {lbl: sum(c.values()) for lbl, c in self.word_counts.items()}
+
+    def predict(self, tokens: Sequence[str]) -> Tuple[Optional[str], float]:
+        """Most likely label for the tokens and its posterior probability."""
+        known = [t for t in tokens if t in self.vocab]
+        if not known or not self.log_prior:
+            return None, 0.0
+        v = len(self.vocab)
+        scores = {}
+        for lbl, prior in self.log_prior.items():
+            counts, denom = self.word_counts[lbl], self.totals[lbl] + v
+            scores[lbl] = prior + sum(math.log((counts[t] + 1) / denom) for t in known)
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / norm
+
+
+class Router:
+    def __init__(self, routes: Sequence[Route], default_node: str, default_reason: str = "fallback",
+                 classifier: bool = False, classifier_threshold: float = 0.8, cache_size: int = 8192,
+                 default_examples: Sequence[str] = ()):
+        self.routes = sorted(routes, key=lambda r: -r.priority)
+        self.default_node = default_node
+        self.default_reason = default_reason
+        self.classifier_threshold = classifier_threshold
+        self._words: Dict[str, List[int]] = defaultdict(list)
+        self._phrases: Dict[str, List[Tuple[Tuple[str, ...], int]]] = defaultdict(list)
+        self._exact: Dict[Tuple[str, ...], List[int]] = defaultdict(list)
+        for idx, r in enumerate(self.routes):
+            for kw in r.keywords:
+                toks = tokenize(kw)
+                if len(toks) == 1:
+                    self._words[toks[0]].append(idx)
+                elif toks:
+                    self._phrases[toks[0]].append((toks, idx))
+            for ex in r.exact:
+                self._exact[tokenize(ex)].append(idx)
+        self.classifier = None
+        if classifier:
+            samples = [(ex, r.node) for r in self.routes for ex in r.examples]
+            samples += [(ex, default_node) for ex in default_examples]
+            if samples:
+                self.classifier = LocalIntentClassifier(samples)
+        self._match = lru_cache(maxsize=cache_size)(self._match_tokens)
+
+    def _match_tokens(self, tokens: Tuple[str, ...]) -> FrozenSet[int]:
+        hit = set(self._exact.get(tokens, ()))
+        for i, tok in enumerate(tokens):
+            hit.update(self._words.get(tok, ()))
+            for phrase, idx in self._phrases.get(tok, ()):
+                if tokens[i:i + len(phrase)] == phrase:
+                    hit.add(idx)
+        return frozenset(hit)
+
+    def route(self, ctx: Dict[str, Any], message: str) -> Tuple[str, str]:
+        """Return (node_key, reason) for this message in this context."""
+        tokens = tokenize(message)
+        matched = self._match(tokens)
+        for idx, r in enumerate(self.routes):
+            needs_match = bool(r.keywords or r.exact)
+            if needs_match and idx not in matched:
+                continue
+            if r.when is not None and not r.when(ctx):
+                continue
+            return r.node, r.reason
+        if self.classifier is not None:
+            label, prob = self.classifier.predict(tokens)
+            if label and label != self.default_node and prob >= self.classifier_threshold:
+                for r in self.routes:
+                    if r.node == label and (r.when is None or r.when(ctx)):
+                        return r.node, f"{r.reason} (classifier {prob:.2f})"
+        return self.default_node, self.default_reason
+
+    def cache_info(self):
+        return self._match.cache_info()
@@ -0,0 +1,262 @@
+"""
+semantic_cache.py
+
+An offline semantic cache of chat answers, so a question that has been
+answered before ("how do I make rice fluffy" / "how to keep rice fluffy?")
+is served without another LLM round trip.
+
+Questions are embedded with feature hashing: content words plus the
+character trigrams inside them, each hashed (with a sign) into `dim`
+buckets and L2-normalized. No model or network is needed, and word order,
+plurals and small typos barely move the vector. Lookups are a cosine top-k
+over all cached vectors: with NumPy the vectors are the columns of a float32
+matrix and a query reads only the rows of its own non-zero buckets; without
+NumPy a pure-Python scan over sparse vectors is used, which is only meant for
+small caches. A hit needs a similarity of at least `threshold`.
+
+Entries are evicted least-recently-used and persisted in the SQLite DB (see
+memory.py), loaded back on first use. Text is passed through scrub_pii()
+before it is cached or stored.
+"""
+
+import hashlib
+import math
+import re
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional: the pure-Python scan is used instead
+    np = None
+
+import memory
+from utils import scrub_pii
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are be can could do does did for how i in is it me my of on or should the to what when "
+    "which why will with would you your please tell chef just really actually thanks hi hey".split())
+# a whole-word match counts this many trigrams' worth
+WORD_WEIGHT = 3.0
+# nearest neighbours by plain cosine that are re-scored with word rarity
+CANDIDATES = 8
+
+SparseVector = Dict[int, float]
+
+
+class Match(NamedTuple):
+    score: float
+    question: str
+    answer: str
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+@lru_cache(maxsize=65536)
+def _hash(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8"))
+
+
+def _stem(word: str) -> str:
+    # plural "s" only: "lentils" -> "lentil", but not "glass" or "gas"
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def content_words(text: str) -> List[str]:
+    words = [_stem(w) for w in _WORD_RE.findall(text.lower())]
+    return [w for w in words if w not in _STOPWORDS] or words
+
+
+def embed(text: str, dim: int = 256, weights: Optional[Callable[[str], float]] = None) -> SparseVector:
+    """
+    Hashed, signed, L2-normalized word + trigram features of text as
+    {bucket: weight}. `weights(word)` scales everything a word contributes.
+    """
+    vec: SparseVector = {}
+    for w in content_words(text):
+        scale = weights(w) if weights is not None else 1.0
+        feats = [("w:" + w, WORD_WEIGHT)]
+        padded = f" {w} "
+        feats.extend((padded[i:i + 3], 1.0) for i in range(len(padded) - 2))
+        for f, weight in feats:
+            h = _hash(f)
+            i = h % dim
+            # the sign bit keeps colliding features from only ever adding up
+            weight *= scale
+            vec[i] = vec.get(i, 0.0) + (weight if h & 0x80000000 else -weight)
+    norm = sum(v * v for v in vec.values()) ** 0.5
+    return {i: v / norm for i, v in vec.items() if v} if norm else {}
+
+
+def cosine(a: SparseVector, b: SparseVector) -> float:
+    if len(b) < len(a):
+        a, b = b, a
+    return sum(w * b.get(i, 0.0) for i, w in a.items())
+
+
+def _key(question: str) -> str:
+    # questions that differ only in filler words share a key
+    return hashlib.sha1(" ".join(content_words(question)).encode("utf-8")).hexdigest()
+
+
+class SemanticCache:
+    """
+    SemanticCache: question -> answer, matched by cosine similarity.
+
+    `get(question)` returns the answer cached for the most similar question at
+    or above `threshold` (an exact repeat skips the vector search), and
+    `search(question, k)` returns the k best matches with their scores.
+
+    The vector search finds the nearest CANDIDATES by plain cosine; those are
+    re-scored with every word weighted by its rarity among the cached
+    questions (idf), so "how long to cook rice" does not answer "how long to
+    cook chicken" just because the framing words match.
+    """
+
+    def __init__(self, max_size: int = 10000, threshold: float = 0.8, dim: int = 256,
+                 persistent: bool = True, clock: Callable[[], float] = time.time):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.dim = dim
+        self.persistent = persistent
+        self.clock = clock
+        # key -> slot, least recently used first
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._entries: List[Tuple[str, str, str]] = []
+        # sparse vectors by slot, only kept for the pure-Python scan
+        self._vectors: List[SparseVector] = []
+        # cached questions containing each content word
+        self._df: Counter = Counter()
+        # one column per slot
+        self._matrix = np.zeros((dim, min(max_size, 1024)), dtype=np.float32) if np is not None else None
+        self._lock = threading.Lock()
+        self._loaded = not persistent
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        rows = memory.load_chat_answers(self.max_size)
+        with self._lock:
+            if self._loaded:
+                return
+            # most recently used come first; insert oldest first to rebuild the LRU order
+            for key, question, answer in reversed(rows):
+                self._store(key, question, answer, embed(question, self.dim))
+            self._loaded = True
+
+    def _store(self, key: str, question: str, answer: str, vec: SparseVector) -> Optional[str]:
+        """Write an entry into its slot (reusing the LRU slot when full); returns the evicted key."""
+        evicted = None
+        slot = self._slots.get(key)
+        if slot is None:
+            if len(self._slots) >= self.max_size:
+                evicted, slot = self._slots.popitem(last=False)
+                self.evictions += 1
+            else:
+                slot = len(self._entries)
+                self._entries.append(None)
+            self._slots[key] = slot
+        self._slots.move_to_end(key)
+        if self._entries[slot] is not None:
+            self._df.subtract(set(content_words(self._entries[slot][1])))
+        self._df.update(set(content_words(question)))
+        self._entries[slot] = (key, question, answer)
+        if self._matrix is None:
+            if slot == len(self._vectors):
+                self._vectors.append(vec)
+            else:
+                self._vectors[slot] = vec
+        else:
+            cols = self._matrix.shape[1]
+            if slot >= cols:
+                grown = np.zeros((self.dim, min(self.max_size, 2 * cols)), dtype=np.float32)
+                grown[:, :cols] = self._matrix
+                self._matrix = grown
+            col = self._matrix[:, slot]
+            col[:] = 0
+            if vec:
+                col[list(vec)] = list(vec.values())
+        return evicted
+
+    def _idf(self, word: str) -> float:
+        return math.log((1 + len(self._slots)) / (1 + self._df.get(word, 0))) + 1
+
+    def _nearest(self, vec: SparseVector, k: int) -> List[Tuple[float, int]]:
+        n = len(self._entries)
+        if not n or not vec:
+            return []
+        if self._matrix is not None:
+            scores = np.zeros(n, dtype=np.float32)
+            tmp = np.empty(n, dtype=np.float32)
+            for i, w in vec.items():
+                np.multiply(self._matrix[i, :n], w, out=tmp)
+                scores += tmp
+            if k < n:
+                top = np.argpartition(scores, -k)[-k:]
+            else:
+                top = np.arange(n)
+            return sorted(((float(scores[i]), int(i)) for i in top), reverse=True)
+        scored = [(cosine(vec, other), slot) for slot, other in enumerate(self._vectors)]
+        return sorted(scored, reverse=True)[:k]
+
+    def _scores(self, question: str, k: int) -> List[Tuple[float, int]]:
+        """The k best (idf-weighted similarity, slot), best first."""
+        candidates = self._nearest(embed(question, self.dim), max(k, CANDIDATES))
+        query = embed(question, self.dim, self._idf)
+        scored = [(cosine(query, embed(self._entries[slot][1], self.dim, self._idf)), slot)
+                  for _, slot in candidates]
+        return sorted(scored, reverse=True)[:k]
+
+    def search(self, question: str, k: int = 1) -> List[Match]:
+        """The k cached questions most similar to `question`, best first."""
+        self._ensure_loaded()
+        with self._lock:
+            return [Match(score, *self._entries[slot][1:]) for score, slot in self._scores(scrub_pii(question), k)]
+
+    def get(self, question: str) -> Optional[str]:
+        self._ensure_loaded()
+        question = scrub_pii(question)
+        key = _key(question)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                best = self._scores(question, 1)
+                if best and best[0][0] >= self.threshold:
+                    slot = best[0][1]
+            if slot is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            hit_key, _, answer = self._entries[slot]
+            self._slots.move_to_end(hit_key)
+        if self.persistent:
+            memory.touch_chat_answer(hit_key, int(self.clock()))
+        return answer
+
+    def put(self, question: str, answer: str) -> None:
+        self._ensure_loaded()
+        question, answer = scrub_pii(question), scrub_pii(answer)
+        key = _key(question)
+        vec = embed(question, self.dim)
+        with self._lock:
+            evicted = self._store(key, question, answer, vec)
+        if self.persistent:
+            if evicted is not None:
+                memory.delete_chat_answer(evicted)
+            memory.store_chat_answer(key, question, answer, int(self.clock()))
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._slots)}
+
+    def __len__(self):
+        return len(self._slots)
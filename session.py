@@ -0,0 +1,389 @@
+"""
+session.py
+
+Compact per-conversation state.
+
+SessionState replaces the free-form ctx dict: every field the workflow uses is a
+__slots__ attribute, so a session costs a few hundred bytes plus its recipe and
+preferences instead of a dict per session. It still answers the dict-style calls
+the graph nodes make (get, [], pop, update, clear, in), keyed by the historical
+ctx names ("_in_steps", "_pref_stage", ...), so nodes do not change. Keys
+outside the known set go to a small overflow dict.
+
+ChatHistory keeps only the most recent turns in memory and spills older ones
+to SQLite (memory.spill_history), from where they can be paged back in.
+
+SessionStore persists both, serialized, behind a pluggable backend (SQLite via
+memory.py, or in-memory for tests) so conversations survive restarts and can
+move between workers. A turn holds the session's lease, so turns for one
+user run one at a time on any worker; writes are still compare-and-set on a
+version number.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import memory
+
+# a turn's hold on a session; a worker that dies mid-turn blocks the session this long
+LEASE_SEC = float(os.getenv("SESSION_LEASE_SEC") or 120)
+# how long a turn waits for another turn on the same session to finish
+LEASE_WAIT_SEC = float(os.getenv("SESSION_LEASE_WAIT_SEC") or 30)
+
+# ctx key -> slot name
+FIELDS = {
+    "user_id": "user_id",
+    "user_name": "user_name",
+    "preferences": "preferences",
+    "last_recipe": "last_recipe",
+    "step_index": "step_index",
+    "_armed_steps": "armed_steps",
+    "_in_steps": "in_steps",
+    "expecting_feedback": "expecting_feedback",
+    "_pref_stage": "pref_stage",
+    "_pref_answers": "pref_answers",
+    "_expecting_pref_answer": "expecting_pref_answer",
+    "_next_node": "next_node",
+    "_fallback_node": "fallback_node",
+}
+
+_MISSING = object()
+
+
+class SessionState:
+    __slots__ = tuple(FIELDS.values()) + ("extra",)
+
+    def __init__(self, **values):
+        for slot in FIELDS.values():
+            object.__setattr__(self, slot, _MISSING)
+        self.extra: Optional[Dict[str, Any]] = None
+        for k, v in values.items():
+            self[k] = v
+
+    # dict-style access used by the graph nodes
+    def __getitem__(self, key: str):
+        slot = FIELDS.get(key)
+        value = getattr(self, slot) if slot else (self.extra or {}).get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        slot = FIELDS.get(key)
+        if slot:
+            setattr(self, slot, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key: str, default: Any = _MISSING) -> Any:
+        try:
+            value = self[key]
+        except KeyError:
+            if default is _MISSING:
+                raise
+            return default
+        slot = FIELDS.get(key)
+        if slot:
+            setattr(self, slot, _MISSING)
+        else:
+            del self.extra[key]
+        return value
+
+    def update(self, data: Dict[str, Any]) -> None:
+        for k, v in data.items():
+            self[k] = v
+
+    def clear(self) -> None:
+        for slot in FIELDS.values():
+            setattr(self, slot, _MISSING)
+        self.extra = None
+
+    def keys(self) -> Iterator[str]:
+        for key, slot in FIELDS.items():
+            if getattr(self, slot) is not _MISSING:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for key in self.keys():
+            yield key, self[key]
+
+    # step tracking by index into last_recipe["steps"]
+    def current_step(self) -> Dict[str, Any]:
+        recipe = self.get("last_recipe") or {}
+        steps = recipe.get("steps", [])
+        idx = self.get("step_index", 0)
+        return steps[idx] if 0 <= idx < len(steps) else {}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Plain dict of the set fields (shallow; JSON-serializable if the values are)."""
+        return dict(self.items())
+
+    @classmethod
+    def restore(cls, snapshot: Dict[str, Any]) -> "SessionState":
+        return cls(**snapshot)
+
+    # copy, deepcopy and pickle go through snapshot(), so unset fields stay unset
+    # (a copied _MISSING would be a different object and read as a value)
+    def __reduce__(self):
+        return self.__class__.restore, (self.snapshot(),)
+
+    def __repr__(self):
+        return f"SessionState({self.snapshot()!r})"
+
+
+class ChatHistory:
+    """
+    ChatHistory: the last `max_turns` (who, text) pairs in memory; older pairs
+    are written to the history table as they fall off.
+    """
+
+    __slots__ = ("user_id", "max_turns", "_recent", "_seq")
+
+    def __init__(self, user_id: str, max_turns: int = 50):
+        self.user_id = user_id
+        self.max_turns = max_turns
+        self._recent: Deque[Tuple[int, str, str]] = deque()
+        self._seq = 0
+
+    def append(self, who: str, text: str) -> None:
+        self._recent.append((self._seq, who, text))
+        self._seq += 1
+        if len(self._recent) > self.max_turns:
+            seq, w, t = self._recent.popleft()
+            memory.spill_history(self.user_id, seq, w, t)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for _, who, text in self._recent:
+            yield who, text
+
+    def __len__(self) -> int:
+        return self._seq
+
+    @property
+    def spilled(self) -> int:
+        """Number of older turns that live only in SQLite."""
+        return self._seq - len(self._recent)
+
+    def older(self, limit: int = 50) -> List[Tuple[str, str]]:
+        """The `limit` turns just before the in-memory window, oldest first."""
+        first = self._recent[0][0] if self._recent else self._seq
+        return memory.load_history(self.user_id, first, limit)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"seq": self._seq, "max_turns": self.max_turns, "recent": [list(r) for r in self._recent]}
+
+    @classmethod
+    def restore(cls, user_id: str, snapshot: Dict[str, Any]) -> "ChatHistory":
+        h = cls(user_id, snapshot.get("max_turns", 50))
+        h._seq = snapshot.get("seq", 0)
+        h._recent.extend(tuple(r) for r in snapshot.get("recent", []))
+        return h
+
+
+class SessionConflict(Exception):
+    """Another worker saved this session since it was loaded."""
+
+
+class SessionBusy(Exception):
+    """Another turn held the session's lease for longer than the store waits."""
+
+
+class Session:
+    __slots__ = ("user_id", "state", "history", "version")
+
+    def __init__(self, user_id: str, state: SessionState, history: ChatHistory, version: int = 0):
+        self.user_id = user_id
+        self.state = state
+        self.history = history
+        self.version = version
+
+    def dumps(self) -> str:
+        return json.dumps({"state": self.state.snapshot(), "history": self.history.snapshot()})
+
+    @classmethod
+    def loads(cls, user_id: str, blob: str, version: int) -> "Session":
+        data = json.loads(blob)
+        return cls(user_id, SessionState.restore(data.get("state", {})),
+                   ChatHistory.restore(user_id, data.get("history", {})), version)
+
+
+class SessionBackend:
+    """
+    Storage for serialized sessions. save() is compare-and-set on the version;
+    acquire()/release() are a per-session lease with an expiry.
+    """
+
+    def load(self, user_id: str) -> Optional[Tuple[int, str]]:
+        raise NotImplementedError
+
+    def version(self, user_id: str) -> int:
+        raise NotImplementedError
+
+    def save(self, user_id: str, blob: str, expected_version: int) -> bool:
+        raise NotImplementedError
+
+    def acquire(self, user_id: str, owner: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def release(self, user_id: str, owner: str) -> None:
+        raise NotImplementedError
+
+
+class InMemorySessionBackend(SessionBackend):
+    def __init__(self):
+        self._data: Dict[str, Tuple[int, str]] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id: str) -> Optional[Tuple[int, str]]:
+        return self._data.get(user_id)
+
+    def version(self, user_id: str) -> int:
+        return self._data.get(user_id, (0, None))[0]
+
+    def save(self, user_id: str, blob: str, expected_version: int) -> bool:
+        with self._lock:
+            current = self._data.get(user_id, (0, None))[0]
+            if current != expected_version:
+                return False
+            self._data[user_id] = (current + 1, blob)
+            return True
+
+    def acquire(self, user_id: str, owner: str, ttl: float) -> bool:
+        with self._lock:
+            held = self._leases.get(user_id)
+            if held is not None and held[1] >= time.time():
+                return False
+            self._leases[user_id] = (owner, time.time() + ttl)
+            return True
+
+    def release(self, user_id: str, owner: str) -> None:
+        with self._lock:
+            if self._leases.get(user_id, (None,))[0] == owner:
+                del self._leases[user_id]
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions table in the shared SQLite DB (see memory.load_session/save_session)."""
+
+    def load(self, user_id: str) -> Optional[Tuple[int, str]]:
+        return memory.load_session(user_id)
+
+    def version(self, user_id: str) -> int:
+        return memory.session_version(user_id)
+
+    def save(self, user_id: str, blob: str, expected_version: int) -> bool:
+        return memory.save_session(user_id, blob, expected_version)
+
+    def acquire(self, user_id: str, owner: str, ttl: float) -> bool:
+        return memory.acquire_session_lease(user_id, owner, ttl)
+
+    def release(self, user_id: str, owner: str) -> None:
+        memory.release_session_lease(user_id, owner)
+
+
+class SessionStore:
+    """
+    SessionStore: loads sessions lazily and keeps the hot ones in an LRU
+    write-through cache. A cached session is checked against the stored
+    version (one small indexed read) before it is used, so a session another
+    worker saved is reloaded rather than served stale.
+    """
+
+    def __init__(self, backend: SessionBackend, cache_size: int = 1024,
+                 lease_sec: float = LEASE_SEC, lease_wait: float = LEASE_WAIT_SEC):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.lease_sec = lease_sec
+        self.lease_wait = lease_wait
+        self._cache: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Session:
+        """The latest saved session (a new one if none is stored)."""
+        version = self.backend.version(user_id)
+        with self._lock:
+            sess = self._cache.get(user_id)
+            if sess is not None and sess.version == version:
+                self._cache.move_to_end(user_id)
+                return sess
+        stored = self.backend.load(user_id)
+        if stored:
+            sess = Session.loads(user_id, stored[1], stored[0])
+        else:
+            sess = Session(user_id, SessionState(user_id=user_id), ChatHistory(user_id))
+        self._remember(sess)
+        return sess
+
+    def save(self, sess: Session) -> None:
+        if not self.backend.save(sess.user_id, sess.dumps(), sess.version):
+            self.evict(sess.user_id)
+            raise SessionConflict(sess.user_id)
+        sess.version += 1
+        self._remember(sess)
+
+    def evict(self, user_id: str) -> None:
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def _remember(self, sess: Session) -> None:
+        with self._lock:
+            self._cache[sess.user_id] = sess
+            self._cache.move_to_end(sess.user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _acquire(self, user_id: str, owner: str) -> None:
+        deadline = time.monotonic() + self.lease_wait
+        delay = 0.005
+        while not self.backend.acquire(user_id, owner, self.lease_sec):
+            if time.monotonic() >= deadline:
+                raise SessionBusy(user_id)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def run_turn(self, user_id: str, fn: Callable[[Session], Any]) -> Any:
+        """
+        Apply `fn` to the latest saved session under the session's lease and
+        save it. Turns for one user run one at a time across workers, so `fn`
+        runs exactly once and may have side effects (LLM calls, timers, UI
+        events). Raises SessionBusy when the lease is not free within
+        lease_wait seconds, and SessionConflict only if the turn outlived
+        its lease and another worker saved first.
+        """
+        owner = uuid.uuid4().hex
+        self._acquire(user_id, owner)
+        try:
+            sess = self.get(user_id)
+            try:
+                result = fn(sess)
+                self.save(sess)
+            except BaseException:
+                # fn works on the cached session: drop a half-applied turn
+                self.evict(user_id)
+                raise
+            return result
+        finally:
+            self.backend.release(user_id, owner)
@@ -0,0 +1,30 @@
+import pytest
+
+import catalog
+import memory
+from agents import recipe
+from cache import RecipeCache
+from llm import LLMGateway
+from tests.stubs import StubClient
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated database as the process-wide storage; closed afterwards."""
+    monkeypatch.setattr(memory, "DB", tmp_path / "chef.db")
+    monkeypatch.setattr(memory, "_storage", None)
+    monkeypatch.setattr(memory, "_timers", None)
+    monkeypatch.setattr(memory, "_codec", None)
+    memory.init_db()
+    yield memory.get_storage()
+    memory.get_storage().close()
+
+
+@pytest.fixture
+def stub(db, monkeypatch):
+    """A StubClient behind the recipe agent's gateway, with an empty cache and no catalog."""
+    client = StubClient()
+    monkeypatch.setattr(recipe, "gateway", LLMGateway(client=client, max_retries=0))
+    monkeypatch.setattr(recipe, "recipe_cache", RecipeCache())
+    monkeypatch.setattr(catalog, "CATALOG_ENABLED", False)
+    return client
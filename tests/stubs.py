@@ -0,0 +1,69 @@
+"""Stand-ins for the OpenAI client shared by the tests."""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+RECIPE = {
+    "title": "Paneer Butter Masala",
+    "cultural_note": "A Punjabi classic.",
+    "ingredients": ["Paneer 250g", "Tomatoes 400g", "Butter 2 tbsp"],
+    "steps": [
+        {"text": "Cube the paneer."},
+        {"text": "Simmer the tomatoes.", "timer_sec": 300, "timer_label": "tomatoes"},
+    ],
+    "tips": ["Soak paneer in warm water"],
+}
+
+
+def reply(content, finish_reason="stop", usage=None):
+    choice = SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason)
+    return SimpleNamespace(choices=[choice], usage=usage)
+
+
+def chunks(content, finish_reason="stop", pause=0.0):
+    """A streamed reply: one chunk per word, `pause` seconds apart."""
+    words = content.split(" ")
+    for i, word in enumerate(words):
+        time.sleep(pause)
+        last = i == len(words) - 1
+        delta = SimpleNamespace(content=word if last else word + " ")
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason if last else None)],
+                              usage=None)
+
+
+class StubClient:
+    """
+    chat.completions.create answers with `replies` in turn (the last one
+    repeats), counting calls. A callable reply is called with the request.
+    """
+
+    def __init__(self, *replies):
+        self.replies = list(replies) or [json.dumps(RECIPE)]
+        self.calls = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls.append(kwargs)
+            r = self.replies[min(len(self.calls), len(self.replies)) - 1]
+        if isinstance(r, BaseException):
+            raise r
+        if callable(r):
+            return r(**kwargs)
+        return r if not isinstance(r, str) else reply(r)
+
+
+class AsyncStubClient(StubClient):
+    """StubClient for the async gateway path."""
+
+    def __init__(self, *replies):
+        super().__init__(*replies)
+        sync_create = self.create
+
+        async def create(**kwargs):
+            return sync_create(**kwargs)
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+import workflow
+from admission import ADMITTED, QUEUED, REJECTED, SHED, AdmissionController
+from tests.stubs import RECIPE, chunks
+
+PREFS = {"number_of_people": 2, "spice_level": 5, "region_preference": "north", "preference_type": "none",
+         "allergies": [], "dislikes": []}
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _controller(clock, **kw):
+    opts = dict(user_per_min=60, user_burst=10, global_per_sec=100, global_burst=100, max_inflight=1,
+                max_queue=4, max_wait=5, clock=clock)
+    opts.update(kw)
+    return AdmissionController(None, **opts)
+
+
+def test_user_over_their_rate_is_rejected():
+    clock = Clock()
+    ctl = _controller(clock, user_per_min=6, user_burst=2, max_inflight=10)
+    assert [ctl.submit("a")[0] for _ in range(3)] == [ADMITTED, ADMITTED, REJECTED]
+    # another user is not held back
+    assert ctl.submit("b")[0] == ADMITTED
+    clock.now += 10  # one token back at 6 per minute
+    assert ctl.submit("a")[0] == ADMITTED
+
+
+def test_waiting_users_are_served_round_robin():
+    ctl = _controller(Clock())
+    outcome, running = ctl.submit("a")
+    assert outcome == ADMITTED
+    queued = [ctl.submit(u)[1] for u in ("a", "a", "a", "b")]
+    order = []
+    ticket = running
+    while ticket is not None:
+        granted = ctl.release(ticket)
+        ticket = granted[0] if granted else None
+        if ticket is not None:
+            order.append(ticket.user_id)
+    assert order == ["a", "b", "a", "a"]
+    assert all(t.granted for t in queued)
+    assert ctl.stats()["inflight"] == 0 and ctl.stats()["waiting"] == 0
+
+
+def test_full_queue_and_expired_waits_are_shed():
+    ctl = _controller(Clock(), max_queue=1)
+    ctl.submit("a")
+    outcome, waiting = ctl.submit("b")
+    assert outcome == QUEUED
+    assert ctl.submit("c") == (SHED, None)
+    assert ctl.cancel(waiting)
+    assert not ctl.cancel(waiting)
+    assert ctl.stats()[SHED] == 2 and ctl.stats()["waiting"] == 0
+
+
+def test_global_tokens_come_back_with_time():
+    clock = Clock()
+    ctl = _controller(clock, global_per_sec=1, global_burst=1, max_inflight=10)
+    assert ctl.submit("a")[0] == ADMITTED
+    outcome, ticket = ctl.submit("b")
+    assert outcome == QUEUED and ctl.dispatch() == []
+    clock.now += 1
+    assert ctl.dispatch() == [ticket]
+
+
+@pytest.fixture
+def graph(stub):
+    # the recipe node streams its reply
+    stub.replies[:] = [lambda **kw: chunks(json.dumps(RECIPE))]
+    return workflow.build_graph()
+
+
+def _ctx(user="u1"):
+    return {"user_id": user, "preferences": dict(PREFS)}
+
+
+def test_run_once_admits_rejects_and_skips_cheap_turns(graph, stub):
+    ctl = AdmissionController(graph, user_per_min=1, user_burst=1, max_wait=0, clock=Clock())
+    text, ctx = ctl.run_once(_ctx(), "recipe please")
+    assert RECIPE["title"] in text and len(stub.calls) == 1
+    text, _ = ctl.run_once(_ctx(), "another recipe please")
+    assert text.startswith("You're asking faster") and len(stub.calls) == 1
+    # greetings do not spend a recipe token
+    text, _ = ctl.run_once(_ctx(), "hello")
+    assert not text.startswith("You're asking faster")
+    assert ctl.stats()[ADMITTED] == 1 and ctl.stats()[REJECTED] == 1
+
+
+def test_shed_turn_does_not_call_the_llm(graph, stub):
+    ctl = AdmissionController(graph, max_inflight=0, max_wait=0)
+    text, _ = ctl.run_once(_ctx(), "recipe please")
+    assert text == workflow.BUSY_TEXT and stub.calls == []
+    assert ctl.stats()[SHED] == 1
+
+
+def test_rescale_that_needs_the_llm_is_admitted(graph, stub):
+    ctl = AdmissionController(graph, user_per_min=1, user_burst=1, max_wait=0, clock=Clock())
+    unreadable = dict(RECIPE, servings=2, ingredients=RECIPE["ingredients"] + ["3x secret spice mix"])
+    ctx = dict(_ctx(), last_recipe=unreadable)
+    assert graph.route(dict(ctx), "make it for 4 people") == "recipe"
+    text, ctx = ctl.run_once(ctx, "make it for 4 people")
+    assert RECIPE["title"] in text and len(stub.calls) == 1
+    assert ctx["preferences"]["number_of_people"] == 4
+    ctx["last_recipe"] = unreadable
+    text, _ = ctl.run_once(ctx, "make it for 6 people")
+    assert text.startswith("You're asking faster") and len(stub.calls) == 1
+
+
+def test_local_rescale_skips_admission(graph, stub):
+    ctl = AdmissionController(graph, user_per_min=1, user_burst=1, max_wait=0, clock=Clock())
+    ctx = dict(_ctx(), last_recipe=dict(RECIPE, servings=2))
+    for people in (4, 6, 8):
+        text, ctx = ctl.run_once(ctx, f"make it for {people} people")
+        assert ctx["last_recipe"]["servings"] == people
+    assert stub.calls == [] and ctl.stats().get(ADMITTED, 0) == 0
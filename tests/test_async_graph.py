@@ -0,0 +1,63 @@
+import asyncio
+import json
+import threading
+
+import workflow
+from agents import recipe
+from langgraph_runtime import AsyncGraph, Node
+from llm import LLMGateway
+from session import SessionState
+from tests.stubs import RECIPE, AsyncStubClient
+
+
+def _graph(action, timeout):
+    g = AsyncGraph(default_timeout=timeout)
+    g.add_node(Node("supervisor", lambda ctx, msg: ("", "work", {}), timeout=5))
+    g.set_supervisor("supervisor")
+    g.add_node(Node("work", action))
+    return g
+
+
+def test_abandoned_node_does_not_touch_ctx():
+    release, finished = threading.Event(), threading.Event()
+
+    def slow(ctx, msg):
+        release.wait(5)
+        ctx["late"] = True
+        ctx.pop("keep")
+        finished.set()
+        return "done", None, {}
+
+    ctx = {"keep": 1}
+    text, out = asyncio.run(_graph(slow, 0.05).arun_once(ctx, "go"))
+    release.set()
+    assert finished.wait(5)
+    assert text.startswith("Sorry") and out is ctx
+    assert ctx == {"keep": 1}
+
+
+def test_finished_node_changes_are_merged():
+    def fast(ctx, msg):
+        ctx["step_index"] = 2
+        ctx.pop("expecting_feedback")
+        ctx["answers"].append("x")
+        return "ok", None, {"extra": 1}
+
+    ctx = {"expecting_feedback": True, "answers": []}
+    text, out = asyncio.run(_graph(fast, 5).arun_once(ctx, "go"))
+    assert text == "ok" and out is ctx
+    assert ctx == {"step_index": 2, "answers": ["x"], "extra": 1}
+
+
+def test_recipe_turn_on_a_session_state(stub, monkeypatch):
+    monkeypatch.setattr(recipe, "gateway", LLMGateway(async_client=AsyncStubClient(json.dumps(RECIPE)),
+                                                      max_retries=0))
+    ctx = SessionState(user_id="u1", preferences={
+        "number_of_people": 2, "spice_level": 5, "region_preference": "north", "preference_type": "none",
+        "allergies": [], "dislikes": []}, _in_steps=True, step_index=1)
+    text, out = asyncio.run(workflow.build_async_graph().arun_once(ctx, "give me a recipe"))
+    assert out is ctx and RECIPE["title"] in text
+    assert ctx["last_recipe"]["title"] == RECIPE["title"]
+    # the new recipe ended step-by-step; unset fields stay unset after the merge
+    assert "_in_steps" not in ctx and "step_index" not in ctx
+    assert ctx.get("expecting_feedback", "unset") == "unset"
@@ -0,0 +1,127 @@
+import json
+import sys
+
+import pytest
+
+import memory
+import prewarm
+import ratelimit
+from agents import recipe
+from cache import cache_key
+from models import Preferences
+from ratelimit import TokenBucket
+from tests.stubs import RECIPE
+
+
+class Clock:
+    """Fake monotonic clock; `sleep` advances it instead of blocking."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def _prefs(people=2, spice=5, **kw):
+    return Preferences(number_of_people=people, spice_level=spice, region_preference="north",
+                       preference_type="none", **kw)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "sleep", clock.sleep)
+    monkeypatch.setattr(recipe, "TokenBucket", lambda rate, capacity=None: TokenBucket(rate, capacity, clock=clock))
+    return clock
+
+
+def test_bucket_starts_full_and_refills_at_rate():
+    clock = Clock()
+    bucket = TokenBucket(2, capacity=3, clock=clock)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time() == pytest.approx(0.5)
+    clock.now += 0.25
+    assert not bucket.try_acquire()
+    clock.now += 0.25
+    assert bucket.try_acquire()
+    # a long idle period refills to capacity, no further
+    clock.now += 60
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert bucket.wait_time(2) == pytest.approx(1.0)
+
+
+def test_acquire_sleeps_until_a_token_is_free(clock):
+    bucket = TokenBucket(4, clock=clock)
+    start = clock.now
+    for _ in range(10):
+        bucket.acquire()
+    # the first 4 are the initial burst, the other 6 are paced at 4 per second
+    assert clock.now - start == pytest.approx(6 / 4)
+    assert all(s == pytest.approx(0.25) for s in clock.slept)
+
+
+def test_batch_generates_each_cache_key_once(stub, clock):
+    a, b = _prefs(2), _prefs(4)
+    # same cache key as `a`: list order and case do not matter
+    a2 = _prefs(2, allergies=["Peanuts", "shrimp"])
+    a3 = _prefs(2, allergies=["shrimp", "peanuts"])
+    assert cache_key(a2, recipe.PROMPT_VERSION) == cache_key(a3, recipe.PROMPT_VERSION)
+    results = recipe.generate_batch([a, b, a, a2, b, a3], max_workers=4)
+    assert len(stub.calls) == 3
+    assert [r["servings"] for r in results] == [2, 4, 2, 2, 4, 2]
+    assert all(r["title"] == RECIPE["title"] for r in results)
+    assert results[0] == results[2]
+    assert recipe.recipe_cache.get(cache_key(b, recipe.PROMPT_VERSION)) == results[1]
+
+
+def test_batch_skips_cached_keys_unless_forced(stub, clock):
+    cached = dict(RECIPE, title="Cached", servings=2)
+    recipe.recipe_cache.put(cache_key(_prefs(2), recipe.PROMPT_VERSION), cached)
+    results = recipe.generate_batch([_prefs(2), _prefs(3)])
+    assert len(stub.calls) == 1
+    assert results[0] == cached
+    assert results[1]["title"] == RECIPE["title"]
+
+    recipe.generate_batch([_prefs(2), _prefs(3)])
+    assert len(stub.calls) == 1
+
+    results = recipe.generate_batch([_prefs(2)], force=True)
+    assert len(stub.calls) == 2
+    assert results[0]["title"] == RECIPE["title"]
+
+
+def test_failed_generation_is_none_and_not_cached(stub, clock):
+    stub.replies[:] = [json.dumps(RECIPE), RuntimeError("upstream down")]
+    results = recipe.generate_batch([_prefs(2), _prefs(3)], max_workers=1)
+    assert results[0]["servings"] == 2
+    assert results[1] is None
+    assert recipe.recipe_cache.get(cache_key(_prefs(3), recipe.PROMPT_VERSION)) is None
+
+
+def test_batch_is_paced_by_the_token_bucket(stub, clock):
+    start = clock.now
+    recipe.generate_batch([_prefs(p) for p in range(1, 13)], max_workers=1, requests_per_sec=4)
+    assert len(stub.calls) == 12
+    assert clock.now - start == pytest.approx((12 - 4) / 4)
+
+
+def test_prewarm_fills_the_cache_from_popular_preferences(stub, clock, monkeypatch, capsys):
+    for people in (2, 2, 3):
+        memory.push_recipe("u1", "Dal", RECIPE, _prefs(people).dict())
+    monkeypatch.setattr(sys, "argv", ["prewarm.py", "--top", "5", "--grid", "--rps", "100"])
+    prewarm.main()
+    grid = list(prewarm.grid_preferences())
+    # people=2/3 north spice 5 are also in the grid
+    assert len(stub.calls) == len(grid)
+    assert "26 requested, 26 cached" in capsys.readouterr().out
+    for prefs in grid:
+        assert recipe.recipe_cache.get(cache_key(prefs, recipe.PROMPT_VERSION)) is not None
+
+    prewarm.main()
+    assert len(stub.calls) == len(grid)
@@ -0,0 +1,84 @@
+import pytest
+
+import memory
+import metrics
+from agents import recipe
+from cache import RecipeCache, cache_key
+
+PREFS = {"number_of_people": 2, "spice_level": 5, "region_preference": "north", "preference_type": "none",
+         "allergies": ["Peanuts", "shrimp"], "dislikes": []}
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_identical_requests_share_one_generation(stub):
+    first = recipe.generate(PREFS, user_id="a")
+    # same preferences in another order and case, from another user
+    again = recipe.generate(dict(PREFS, allergies=["SHRIMP", "peanuts"]), user_id="b")
+    assert len(stub.calls) == 1
+    assert again == first and again is not first
+
+
+def test_use_cache_false_always_generates(stub):
+    recipe.generate(PREFS, use_cache=False)
+    recipe.generate(PREFS, use_cache=False)
+    assert len(stub.calls) == 2
+
+
+def test_persistent_tier_survives_a_new_cache(stub, monkeypatch):
+    recipe.generate(PREFS)
+    memory.get_storage().flush()
+    monkeypatch.setattr(recipe, "recipe_cache", RecipeCache())
+    recipe.generate(PREFS)
+    assert len(stub.calls) == 1
+
+
+def test_loaded_rows_keep_their_stored_age(db):
+    clock = Clock()
+    key = cache_key(PREFS, "v")
+    RecipeCache(ttl=100, clock=clock).put(key, {"title": "old"})
+    db.flush()
+    clock.now += 90
+    fresh = RecipeCache(ttl=100, clock=clock)
+    assert fresh.get(key) == {"title": "old"}
+    # 110s after it was stored: expired, although this cache loaded it only 20s ago
+    clock.now += 20
+    assert fresh.get(key) is None
+
+
+def test_misses_are_remembered_briefly(db, monkeypatch):
+    clock = Clock()
+    loads = []
+    real = memory.load_cached_recipes
+    monkeypatch.setattr(memory, "load_cached_recipes", lambda *a: loads.append(a) or real(*a))
+    c = RecipeCache(clock=clock, negative_ttl=60)
+    key = cache_key(PREFS, "v")
+    for _ in range(5):
+        assert c.get(key) is None
+    assert len(loads) == 1
+    clock.now += 61
+    assert c.get(key) is None
+    assert len(loads) == 2
+    c.put(key, {"title": "new"})
+    assert c.get(key) == {"title": "new"} and len(loads) == 2
+
+
+
+def test_lookups_and_evictions_are_exported():
+    def count(result):
+        return metrics.counters("chef_recipe_cache_total").get((("result", result),), 0)
+
+    before = {r: count(r) for r in ("hit", "miss", "evict")}
+    c = RecipeCache(max_size=1, persistent=False)
+    c.get("a")
+    c.put("a", {"title": "a"})
+    c.get("a")
+    c.put("b", {"title": "b"})
+    assert {r: count(r) - before[r] for r in before} == {"hit": 1, "miss": 1, "evict": 1}
+    assert "chef_recipe_cache_total" in metrics.to_prometheus()
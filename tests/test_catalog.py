@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+import catalog
+import memory
+from tests.stubs import RECIPE
+
+PREFS = {"number_of_people": 2, "spice_level": 5, "region_preference": "north",
+         "preference_type": "cuisine", "allergies": [], "dislikes": []}
+
+
+def _store(title, **prefs):
+    memory.push_recipe("u1", title, dict(RECIPE, title=title), dict(PREFS, **prefs))
+
+
+def test_hit_is_read_back_from_the_table(db):
+    _store("Paneer Butter Masala")
+    db.flush()
+    cat = catalog.RecipeCatalog()
+    cat.refresh()
+    assert list(cat._docs) == [r[0] for r in db.query("SELECT id FROM recipes")]
+    recipe = cat.best(PREFS)
+    assert recipe == dict(RECIPE, servings=2)
+
+
+def test_preference_type_is_scored(db):
+    _store("Dietary Paneer", preference_type="dietary")
+    _store("Cuisine Paneer", preference_type="cuisine")
+    db.flush()
+    cat = catalog.RecipeCatalog()
+    cat.refresh()
+    assert cat.best(PREFS)["title"] == "Cuisine Paneer"
+    assert cat.best(dict(PREFS, preference_type="dietary"))["title"] == "Dietary Paneer"
+    scores = sorted(score for score, _ in cat.match(PREFS))
+    assert scores == [pytest.approx(1.0 - catalog.PREFERENCE_TYPE_PENALTY), 1.0]
+
+
+def test_lookup_misses_until_the_background_load_is_done(db, monkeypatch):
+    _store("Paneer Butter Masala")
+    db.flush()
+    monkeypatch.setattr(catalog, "CATALOG_ENABLED", True)
+    monkeypatch.setattr(catalog, "CATALOG_REFRESH_SEC", 3600)
+    monkeypatch.setattr(catalog, "_catalog", None)
+    monkeypatch.setattr(catalog, "_builder", None)
+    monkeypatch.setattr(catalog, "_ready", threading.Event())
+    release = threading.Event()
+    iter_recipes = memory.iter_recipes
+
+    def slow_iter(after_id=0):
+        release.wait(5)
+        return iter_recipes(after_id)
+
+    monkeypatch.setattr(memory, "iter_recipes", slow_iter)
+    assert catalog.lookup(PREFS) is None
+    release.set()
+    assert catalog.wait_ready(5)
+    assert catalog.lookup(PREFS)["title"] == RECIPE["title"]
@@ -0,0 +1,71 @@
+import pytest
+
+import utils
+from utils import configure_guardrail, guardrail, guardrail_many, scrub_pii
+
+
+@pytest.fixture
+def terms():
+    yield configure_guardrail
+    # back to the shipped term list for the other tests
+    configure_guardrail()
+
+
+@pytest.mark.parametrize("text", ["Add chilli flakes", "Serve with coleslaw", "Polish the skillet",
+                                  "A lawn-fresh herb salad", "Stockpot chicken broth"])
+def test_terms_match_whole_words_only(text):
+    assert guardrail(text) == (True, "")
+
+
+def test_word_boundaries_for_short_terms(terms):
+    terms({"forbidden": [], "non_cooking": ["hi", "law"]})
+    assert guardrail("chilli paneer")[0] and guardrail("coleslaw on the side")[0]
+    assert not guardrail("hi there")[0] and not guardrail("Is that LAW?")[0]
+
+
+@pytest.mark.parametrize("text, term", [("killing the yeast", "kill"), ("taxes on ghee", "tax"),
+                                        ("my account got hacked", "hack"), ("Bombs away", "bomb")])
+def test_simple_inflections_count(text, term):
+    # the reason names the listed term, not the inflected word
+    ok, reason = guardrail(text)
+    assert not ok and reason.rstrip(".").endswith(term)
+
+
+def test_forbidden_terms_take_priority():
+    ok, reason = guardrail("a tax question about poison")
+    assert not ok and reason == "Forbidden term detected: poison"
+    ok, reason = guardrail("tax law")
+    assert reason == "I can help with cooking only; your query mentions tax."
+
+
+def test_configure_recompiles_and_clears_the_cache(terms):
+    assert guardrail("how to temper mustard seeds")[0]
+    before = guardrail.cache_info().currsize
+    assert before > 0
+    terms({"forbidden": ["mustard"], "non_cooking": []})
+    assert guardrail.cache_info().currsize == 0
+    assert guardrail("how to temper mustard seeds") == (False, "Forbidden term detected: mustard")
+    # the old lists are gone entirely
+    assert guardrail("tax law")[0]
+    terms({})
+    assert guardrail("mustard") == (True, "")
+
+
+def test_configure_from_a_file(terms, tmp_path):
+    path = tmp_path / "terms.json"
+    path.write_text('{"forbidden": ["cleaver"], "non_cooking": ["football"]}', encoding="utf-8")
+    terms(path=path)
+    assert not guardrail("football scores")[0] and not guardrail("sharpen the cleaver")[0]
+    assert guardrail("kill the heat")[0]
+    assert utils.load_guardrail_terms(tmp_path / "missing.json") == utils.DEFAULT_TERMS
+
+
+def test_batch_agrees_with_single_checks():
+    texts = ["hello chef", "killing time", "tax tips", "coleslaw", "politics of biryani", "poison ivy tax", ""]
+    assert guardrail_many(texts) == [guardrail(t) for t in texts]
+
+
+def test_pii_is_redacted():
+    assert scrub_pii("mail cook@example.com or call +91 98765 43210") == \
+        "mail [redacted_email] or call [redacted_phone]"
+    assert scrub_pii("bake 2 cakes at 180 C for 35 min") == "bake 2 cakes at 180 C for 35 min"
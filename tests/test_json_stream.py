@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from json_stream import IncrementalJSONParser
+
+REPLY = "```json\n" + json.dumps({
+    "title": "Dal \"tadka\" \\ smoky",
+    "servings": 4,
+    "vegetarian": True,
+    "notes": None,
+    "region": "café 🌶 {north}, [east]",
+    "ingredients": [{"name": "toor dal", "qty": "1 cup"}, {"name": "ghee, \"desi\"", "qty": "2 tbsp"}],
+    "steps": ["Rinse, then soak.", "Temper: cumin \\ chilli", "Simmer } ]"],
+    "nutrition": {"kcal": 320, "tags": ["protein", "fibre"]},
+    "rating": -1.5e2,
+}) + "\n```"
+OBJECT = json.loads(REPLY[REPLY.index("{"):REPLY.rindex("}") + 1])
+
+
+def expected_events(obj):
+    events = []
+    for key, value in obj.items():
+        if isinstance(value, list):
+            events.extend(("item", key, item) for item in value)
+        events.append(("field", key, value))
+    return events
+
+
+EVENTS = expected_events(OBJECT)
+
+
+def parse(*chunks):
+    parser = IncrementalJSONParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return parser, events
+
+
+def test_reply_fed_at_once_matches_json_loads():
+    parser, events = parse(REPLY)
+    assert parser.done
+    assert events == EVENTS
+    assert {k: v for kind, k, v in events if kind == "field"} == OBJECT
+
+
+def test_every_split_offset_yields_the_same_events():
+    for cut in range(len(REPLY) + 1):
+        parser, events = parse(REPLY[:cut], REPLY[cut:])
+        assert parser.done, cut
+        assert events == EVENTS, cut
+
+
+def test_single_character_chunks():
+    parser, events = parse(*REPLY)
+    assert parser.done
+    assert events == EVENTS
+
+
+@pytest.mark.parametrize("text", ["\\\"", "\\\\", "\\u00e9", "\\ud83c\\udf36", "\\n\\t", "}],:{["])
+def test_splits_inside_escapes(text):
+    reply = '{"title": "a%sb", "steps": ["%s", "x"]}' % (text, text)
+    obj = json.loads(reply)
+    for cut in range(len(reply) + 1):
+        _, events = parse(reply[:cut], reply[cut:])
+        assert events == expected_events(obj), cut
+
+
+def test_truncated_input_only_reports_complete_values():
+    for cut in range(len(REPLY) - 4):
+        parser, events = parse(REPLY[:cut])
+        assert events == EVENTS[:len(events)], cut
+        assert not parser.done, cut
+        for kind, key, value in events:
+            if kind == "field":
+                assert OBJECT[key] == value
+
+
+def test_truncated_number_waits_for_a_delimiter():
+    parser, events = parse('{"title": "x", "servings": 1')
+    assert events == [("field", "title", "x")]
+    assert parser.feed("2}") == [("field", "servings", 12)]
+    assert parser.done
+
+
+def test_text_after_the_object_is_ignored():
+    parser, events = parse('{"a": 1} {"b": 2}')
+    assert events == [("field", "a", 1)]
+    assert parser.feed(', "c": 3}') == []
+    assert parser.text.endswith('"c": 3}')
@@ -0,0 +1,70 @@
+import asyncio
+import gc
+import threading
+import time
+
+import pytest
+
+from llm import DeadlineExceeded, LLMGateway
+from tests.stubs import AsyncStubClient, StubClient, chunks, reply
+
+
+def _slow(content, pause):
+    def create(**kwargs):
+        time.sleep(pause)
+        return reply(content)
+    return create
+
+
+def test_stream_holds_its_slot_until_closed():
+    client = StubClient(lambda **kw: chunks("one two three"), "plain")
+    gw = LLMGateway(client=client, max_concurrency=1, max_retries=0)
+    stream = gw.stream([{"role": "user", "content": "hi"}])
+    next(stream)
+    answered = threading.Event()
+    t = threading.Thread(target=lambda: (gw.chat([{"role": "user", "content": "x"}]), answered.set()))
+    t.start()
+    assert not answered.wait(0.2)
+    stream.close()
+    assert answered.wait(2)
+    t.join()
+
+
+def test_stream_past_its_deadline_is_cut_off():
+    client = StubClient(lambda **kw: chunks("a b c d e f", pause=0.05))
+    gw = LLMGateway(client=client, deadline=0.12, max_retries=0)
+    got = []
+    with pytest.raises(DeadlineExceeded):
+        for chunk in gw.stream([{"role": "user", "content": "hi"}]):
+            got.append(chunk.choices[0].delta.content)
+    assert 0 < len(got) < 6
+    assert gw._sem.acquire(blocking=False)
+
+
+@pytest.mark.parametrize("cap,calls", [(1, 1), (2, 2)])
+def test_hedge_needs_a_free_slot(cap, calls):
+    client = StubClient(_slow("late", 0.2))
+    gw = LLMGateway(client=client, max_concurrency=cap, hedge_after=0.05, max_retries=0)
+    assert gw.chat([{"role": "user", "content": "hi"}]).choices[0].message.content == "late"
+    assert len(client.calls) == calls
+    time.sleep(0.3)
+    # every slot is back once both requests are done
+    for _ in range(cap):
+        assert gw._sem.acquire(blocking=False)
+
+
+def test_async_semaphores_go_with_their_loop():
+    gw = LLMGateway(async_client=AsyncStubClient("ok"), max_retries=0)
+    for _ in range(3):
+        asyncio.run(gw.achat([{"role": "user", "content": "hi"}]))
+    gc.collect()
+    assert len(gw._async_sems) == 0
+
+
+def test_usage_keeps_the_most_recent_users():
+    gw = LLMGateway(client=StubClient(reply("ok", usage={"prompt_tokens": 3, "completion_tokens": 1})),
+                    max_users=2)
+    for user in ("a", "b", "a", "c"):
+        gw.chat([{"role": "user", "content": "hi"}], user_id=user)
+    assert list(gw.usage_by_user) == ["a", "c"]
+    assert gw.usage_for("a") == {"prompt_tokens": 6, "completion_tokens": 2, "calls": 2}
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+
+import pytest
+
+import maintenance
+import memory
+import payloads
+
+OLD = 1_600_000_000  # 2020-09
+NOW = 1_700_000_000
+
+
+def _recipe(title, spice=5):
+    return {"title": title, "ingredients": ["Paneer 200g", f"Chilli {spice}"],
+            "steps": [{"text": f"Cook the {title.lower()}.", "timer_sec": 300}], "tips": []}
+
+
+def _ids(db, sql, params=()):
+    return [r[0] for r in db.query(sql, params)]
+
+
+@pytest.fixture
+def fresh(db, monkeypatch):
+    monkeypatch.setattr(maintenance, "_packed_upto", 0)
+    return db
+
+
+def test_archive_moves_rows_blobs_and_dictionaries(fresh):
+    db = fresh
+    shared, only_old = _recipe("Dal"), _recipe("Kheer")
+    for title, payload in (("a", shared), ("b", shared), ("c", only_old), ("d", shared)):
+        memory.push_recipe("u1", title, payload)
+    memory.store_feedback("u1", 4, "nice", "k1", "Dal")
+    db.flush()
+    db.execute("UPDATE recipes SET created_at=? WHERE title IN ('a','b','c')", (OLD,))
+    db.execute("UPDATE feedback SET created_at=?", (OLD,))
+    stats = db.query("SELECT n FROM feedback_stats WHERE scope='recipe' AND key='k1'")
+    assert stats == [(1,)]
+
+    assert maintenance.archive_rows("recipes", NOW) == 3
+    assert maintenance.archive_rows("feedback", NOW) == 1
+
+    # main keeps the young row and the blob it still uses; the blob only archived rows used is freed
+    assert _ids(db, "SELECT title FROM recipes") == ["d"]
+    assert db.query("SELECT COUNT(*) FROM recipe_blobs")[0][0] == 1
+    assert memory.load_recipe(_ids(db, "SELECT id FROM recipes")[0]) == shared
+    assert db.query("SELECT COUNT(*) FROM feedback")[0][0] == 0
+    assert db.query("SELECT n FROM feedback_stats WHERE scope='recipe' AND key='k1'") == stats
+
+    archive = sqlite3.connect(maintenance.archive_path("2020-09"))
+    try:
+        assert sorted(r[0] for r in archive.execute("SELECT title FROM recipes")) == ["a", "b", "c"]
+        assert archive.execute("SELECT COUNT(*) FROM feedback").fetchone()[0] == 1
+        codec = payloads.Codec(dict(archive.execute("SELECT id, dict FROM payload_dicts")))
+        got = {title: json.loads(codec.decode(dict_id, data)) for title, dict_id, data in archive.execute(
+            "SELECT r.title, b.dict_id, b.data FROM recipes r JOIN recipe_blobs b ON b.hash=r.hash")}
+    finally:
+        archive.close()
+    assert got == {"a": shared, "b": shared, "c": only_old}
+
+
+def test_archive_stops_at_young_rows(fresh):
+    memory.push_recipe("u1", "new", _recipe("Dal"))
+    fresh.flush()
+    assert maintenance.archive_rows("recipes", NOW) == 0
+    assert _ids(fresh, "SELECT title FROM recipes") == ["new"]
+
+
+def test_identical_payloads_share_one_blob(fresh):
+    for user in ("u1", "u2", "u3"):
+        memory.push_recipe(user, "Dal", _recipe("Dal"))
+    memory.push_recipe("u1", "Kheer", _recipe("Kheer"))
+    fresh.flush()
+    assert fresh.query("SELECT COUNT(*) FROM recipes")[0][0] == 4
+    assert fresh.query("SELECT COUNT(*) FROM recipe_blobs")[0][0] == 2
+    assert len(set(_ids(fresh, "SELECT blob_id FROM recipes WHERE title='Dal'"))) == 1
+
+
+def test_legacy_json_payloads_are_packed(fresh):
+    legacy = _recipe("Rajma")
+    for user in ("u1", "u2"):
+        fresh.execute("INSERT INTO recipes(user_id,title,payload,created_at) VALUES (?,?,?,?)",
+                      (user, "Rajma", json.dumps(legacy), NOW))
+    memory.push_recipe("u3", "Rajma", legacy)
+    fresh.flush()
+    assert maintenance.pack_payloads() == 2
+    rows = fresh.query("SELECT id, payload, blob_id FROM recipes")
+    assert all(payload is None for _, payload, _ in rows)
+    assert len({blob for _, _, blob in rows}) == 1
+    assert all(memory.load_recipe(rid) == legacy for rid, _, _ in rows)
+    assert maintenance.pack_payloads() == 0
+
+
+def test_blobs_keep_decoding_after_a_new_dictionary(fresh):
+    early = [_recipe(f"Curry {i}", spice=i) for i in range(20)]
+    for i, payload in enumerate(early):
+        memory.push_recipe("u1", f"e{i}", payload)
+    fresh.flush()
+    assert maintenance.train_dictionary(min_recipes=50) is None
+    new_id = maintenance.train_dictionary(min_recipes=10, samples=100)
+    assert new_id is not None and new_id != payloads.SEED_ID
+    # trained once: the seed is no longer current
+    assert maintenance.train_dictionary(min_recipes=10, samples=100) is None
+    late = _recipe("Biryani")
+    memory.push_recipe("u1", "late", late)
+    fresh.flush()
+    dict_ids = dict(fresh.query("SELECT r.title, b.dict_id FROM recipes r JOIN recipe_blobs b ON b.id=r.blob_id"))
+    assert dict_ids["e0"] == payloads.SEED_ID and dict_ids["late"] == new_id
+    # another process, which loaded only the seed dictionary, reads both
+    memory._codec = payloads.Codec({payloads.SEED_ID: payloads.SEED_DICTIONARY})
+    stored = {title: payload for _, payload, title in
+              ((rid, memory.load_recipe(rid), title) for rid, title in fresh.query("SELECT id, title FROM recipes"))}
+    assert stored["e3"] == early[3] and stored["late"] == late
+
+
+def test_caches_and_idle_sessions_expire(fresh):
+    memory.store_cached_recipe("old-key", 0, _recipe("Dal"), OLD)
+    memory.store_cached_recipe("new-key", 0, _recipe("Dal"), NOW)
+    memory.store_chat_answer("old", "q", "a", OLD)
+    memory.store_chat_answer("new", "q", "a", NOW)
+    for user in ("idle", "active"):
+        memory.save_session(user, "{}", 0)
+        fresh.execute(memory.SQL_SPILL_HISTORY, (user, 0, "you", "hi"))
+    fresh.flush()
+    fresh.execute("UPDATE sessions SET updated_at=? WHERE user_id='idle'", (OLD,))
+    assert maintenance.expire_rows("recipe_cache", NOW - 1) == 1
+    assert maintenance.expire_rows("chat_cache", NOW - 1) == 1
+    assert maintenance.expire_rows("sessions", NOW - 1) == 1
+    assert _ids(fresh, "SELECT cache_key FROM recipe_cache") == ["new-key"]
+    assert _ids(fresh, "SELECT key FROM chat_cache") == ["new"]
+    assert _ids(fresh, "SELECT user_id FROM sessions") == ["active"]
+    assert _ids(fresh, "SELECT user_id FROM history") == ["active"]
+
+
+def test_maintenance_pass_reports_every_step(fresh):
+    report = maintenance.run_maintenance(now=NOW)
+    assert set(report) >= {"packed", "dictionary", "archived_recipes", "archived_feedback", "timers",
+                           "expired_recipe_cache", "expired_chat_cache", "expired_sessions", "vacuumed_pages"}
+    assert report["vacuumed_pages"] >= 0
@@ -0,0 +1,162 @@
+import json
+import urllib.request
+
+import pytest
+
+import metrics
+from metrics import BUCKETS
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class Clock:
+    """perf_counter stand-in that advances by `step` on every read."""
+
+    def __init__(self, step=0.001):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def samples():
+    # 100 samples: 50 / 45 / 4 on bucket bounds, 1 above the last bound
+    return [BUCKETS[2]] * 50 + [BUCKETS[5]] * 45 + [BUCKETS[10]] * 4 + [1000.0]
+
+
+def test_histogram_buckets_and_quantiles(registry):
+    h = metrics.histogram("latency")
+    for v in samples():
+        h.observe(v)
+    assert h.count == 100
+    assert h.sum == pytest.approx(sum(samples()))
+    assert h.counts[2] == 50 and h.counts[5] == 45 and h.counts[10] == 4 and h.counts[-1] == 1
+    assert sum(h.counts) == 100
+    assert h.quantile(0.50) == BUCKETS[2]
+    assert h.quantile(0.95) == BUCKETS[5]
+    assert h.quantile(0.99) == BUCKETS[10]
+    assert h.quantile(1.0) == BUCKETS[-1]
+    assert metrics.Histogram().quantile(0.5) == 0.0
+
+
+def test_value_between_bounds_lands_in_the_upper_bucket(registry):
+    h = metrics.histogram("latency")
+    h.observe((BUCKETS[3] + BUCKETS[4]) / 2)
+    assert h.counts[4] == 1
+    assert h.quantile(0.5) == BUCKETS[4]
+
+
+def test_prometheus_exposition(registry):
+    for v in samples():
+        metrics.observe("chef_test_seconds", v, node="recipe")
+    metrics.inc("chef_test_total", 2, result="hit")
+    metrics.inc("chef_test_total", result="hit")
+    lines = metrics.to_prometheus().splitlines()
+
+    assert lines[0] == "# TYPE chef_test_seconds histogram"
+    buckets = [line for line in lines if line.startswith("chef_test_seconds_bucket")]
+    assert len(buckets) == len(BUCKETS) + 1
+    assert buckets[0] == f'chef_test_seconds_bucket{{node="recipe",le="{BUCKETS[0]:g}"}} 0'
+    assert f'chef_test_seconds_bucket{{node="recipe",le="{BUCKETS[2]:g}"}} 50' in lines
+    assert f'chef_test_seconds_bucket{{node="recipe",le="{BUCKETS[5]:g}"}} 95' in lines
+    assert f'chef_test_seconds_bucket{{node="recipe",le="{BUCKETS[-1]:g}"}} 99' in lines
+    assert buckets[-1] == 'chef_test_seconds_bucket{node="recipe",le="+Inf"} 100'
+    cumulative = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert cumulative == sorted(cumulative)
+    assert 'chef_test_seconds_count{node="recipe"} 100' in lines
+    assert any(line.startswith('chef_test_seconds_sum{node="recipe"} ') for line in lines)
+    assert "# TYPE chef_test_total counter" in lines
+    assert 'chef_test_total{result="hit"} 3' in lines
+
+
+def test_json_export(registry):
+    for v in samples():
+        metrics.observe("chef_test_seconds", v, node="recipe")
+    metrics.inc("chef_test_total", 4)
+    out = json.loads(metrics.to_json())
+    summary = out["histograms"]["chef_test_seconds"]["node=recipe"]
+    assert summary["count"] == 100
+    assert summary["mean"] == pytest.approx(sum(samples()) / 100)
+    assert (summary["p50"], summary["p95"], summary["p99"]) == (BUCKETS[2], BUCKETS[5], BUCKETS[10])
+    assert out["counters"]["chef_test_total"] == {"": 4}
+
+
+def test_serve_prometheus(registry):
+    metrics.inc("chef_test_total", result="miss")
+    server = metrics.serve_prometheus(0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/metrics") as resp:
+            assert resp.headers["Content-Type"].startswith("text/plain")
+            assert 'chef_test_total{result="miss"} 1' in resp.read().decode()
+        with urllib.request.urlopen(base + "/metrics.json") as resp:
+            assert json.load(resp)["counters"]["chef_test_total"] == {"result=miss": 1}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_span_records_into_the_labelled_histogram(registry, monkeypatch):
+    monkeypatch.setattr(metrics.time, "perf_counter", Clock(0.002))
+    with metrics.span("parse", node="recipe"):
+        pass
+    with metrics.span("recipe", metric="chef_node_seconds", label="node"):
+        pass
+    (labels, h), = metrics.histograms("chef_span_seconds").items()
+    assert labels == (("node", "recipe"), ("span", "parse"))
+    assert h.count == 1 and h.sum == pytest.approx(0.002)
+    assert list(metrics.histograms("chef_node_seconds")) == [(("node", "recipe"),)]
+
+
+def test_span_records_when_the_block_raises(registry):
+    with pytest.raises(ValueError):
+        with metrics.span("boom"):
+            raise ValueError
+    assert metrics.histograms("chef_span_seconds")[(("span", "boom"),)].count == 1
+
+
+def test_disabled_metrics_record_nothing(registry, monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    with metrics.capture() as trace:
+        with metrics.span("parse"):
+            ran = True
+    metrics.inc("chef_test_total")
+    metrics.observe("chef_test_seconds", 0.1)
+    assert ran
+    assert trace.spans == []
+    assert metrics.histograms("chef_span_seconds") == {}
+    assert metrics.counters("chef_test_total") == {}
+    assert metrics.to_prometheus() == "\n"
+
+
+def test_capture_flame(registry, monkeypatch):
+    monkeypatch.setattr(metrics.time, "perf_counter", Clock(0.001))
+    with metrics.capture() as trace:
+        with metrics.span("turn"):
+            with metrics.span("recipe"):
+                with metrics.span("llm"):
+                    pass
+            with metrics.span("persist"):
+                pass
+    with metrics.span("outside"):
+        pass
+
+    assert [(name, depth) for name, depth, _, _ in trace.spans] == [
+        ("llm", 2), ("recipe", 1), ("persist", 1), ("turn", 0)]
+    lines = trace.flame().splitlines()
+    assert [line.split()[0] for line in lines] == ["turn", "recipe", "llm", "persist"]
+    assert [len(line) - len(line.lstrip()) for line in lines] == [0, 2, 4, 2]
+    # every clock read advances 1ms, so durations and bars follow the nesting
+    assert [float(line.split()[1]) for line in lines] == [7.0, 3.0, 1.0, 1.0]
+    bars = [len(line.split()[-1]) for line in lines]
+    assert bars[0] > bars[1] > bars[2] == bars[3] >= 1
+    assert [d["name"] for d in trace.to_dict()] == ["llm", "recipe", "persist", "turn"]
+    assert metrics.Trace().flame() == "(no spans recorded)"
@@ -0,0 +1,92 @@
+import hashlib
+import importlib
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import prompts
+from models import Preferences
+from tokens import count_tokens
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PREFS = {"number_of_people": 4, "spice_level": 6, "region_preference": " North", "preference_type": "dietary",
+         "allergies": ["Shrimp", "peanuts ", "shrimp"], "dislikes": []}
+
+
+def test_compact_prefs():
+    assert prompts.compact_prefs(PREFS) == "people=4; spice=6/10; region=north; focus=dietary; allergies=peanuts,shrimp"
+    model = Preferences(**dict(PREFS, region_preference="north"))
+    assert prompts.compact_prefs(model) == prompts.compact_prefs(PREFS)
+    plain = dict(PREFS, preference_type="none", allergies=[], dislikes=["Okra", "bitter gourd"])
+    assert prompts.compact_prefs(plain) == "people=4; spice=6/10; region=north; dislikes=bitter gourd,okra"
+
+
+def test_recipe_messages():
+    system, user = prompts.recipe_messages(PREFS)
+    assert system == {"role": "system", "content": prompts.system_prompt()}
+    assert user == {"role": "user", "content": prompts.USER_PREFIX + prompts.compact_prefs(PREFS)}
+
+
+def test_system_message_is_identical_across_requests():
+    other = dict(PREFS, number_of_people=1, region_preference="south", allergies=["milk"])
+    first, second = prompts.recipe_messages(PREFS)[0], prompts.recipe_messages(other)[0]
+    assert first["content"].encode("utf-8") == second["content"].encode("utf-8")
+    assert prompts.system_prompt().endswith("\n" + prompts.RULES)
+    # whitespace-normalized: no trailing spaces, blank lines or runs of spaces
+    for line in prompts.persona().splitlines():
+        assert line and line == " ".join(line.split())
+
+
+def test_system_message_is_identical_across_processes():
+    code = "import hashlib, prompts; print(hashlib.sha256(prompts.system_prompt().encode('utf-8')).hexdigest())"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == hashlib.sha256(prompts.system_prompt().encode("utf-8")).hexdigest()
+
+
+def test_recipe_max_tokens_from_the_budget(monkeypatch):
+    monkeypatch.setattr(prompts, "RECIPE_MAX_TOKENS", 0)
+    b = prompts.TOKEN_BUDGET
+    largest = (b["frame"] + b["title"] + b["cultural_note"] + prompts.MAX_INGREDIENTS * b["ingredient"]
+               + prompts.MAX_STEPS * b["step"] + prompts.MAX_TIPS * b["tip"])
+    n = prompts.recipe_max_tokens()
+    assert n == 850
+    assert n % 10 == 0 and largest * prompts.MAX_TOKENS_HEADROOM <= n < largest * prompts.MAX_TOKENS_HEADROOM + 10
+
+
+def test_largest_recipe_fits_in_max_tokens(monkeypatch):
+    monkeypatch.setattr(prompts, "RECIPE_MAX_TOKENS", 0)
+    recipe = {
+        "title": "Slow-Cooked Kashmiri Rogan Josh with Saffron Rice",
+        "cultural_note": "Rogan josh came to Kashmir with the Mughals; the deep red comes from Kashmiri chillies "
+                         "and ratan jot rather than heat.",
+        "ingredients": [f"Ingredient number {i}, 250 g, finely chopped" for i in range(prompts.MAX_INGREDIENTS)],
+        "steps": [{"text": "Heat the ghee in a heavy pot, add whole spices and fry until fragrant, then add "
+                           "the onions and cook until deep golden.", "timer_sec": 600, "timer_label": "onions"}
+                  for _ in range(prompts.MAX_STEPS)],
+        "tips": ["Marinate overnight for the most tender meat, and bloom the saffron in warm milk."]
+        * prompts.MAX_TIPS,
+    }
+    assert count_tokens(json.dumps(recipe)) <= prompts.recipe_max_tokens()
+
+
+def test_recipe_max_tokens_override(monkeypatch):
+    monkeypatch.setattr(prompts, "RECIPE_MAX_TOKENS", 1200)
+    assert prompts.recipe_max_tokens() == 1200
+
+
+@pytest.fixture
+def reload_prompts(monkeypatch):
+    yield lambda: importlib.reload(prompts)
+    monkeypatch.undo()
+    importlib.reload(prompts)
+
+
+def test_recipe_max_tokens_env_override(monkeypatch, reload_prompts):
+    monkeypatch.setenv("RECIPE_MAX_TOKENS", "640")
+    assert reload_prompts().recipe_max_tokens() == 640
+    monkeypatch.setenv("RECIPE_MAX_TOKENS", "")
+    assert reload_prompts().recipe_max_tokens() == 850
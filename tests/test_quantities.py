@@ -0,0 +1,34 @@
+import random
+
+import quantities
+from benchmarks import bench_scale
+
+
+def test_only_the_leading_quantity_is_scaled():
+    assert quantities.scale_line("Chicken 500 g, cut into 2 inch pieces", 2.5) == \
+        "Chicken 1.3 kg, cut into 2 inch pieces"
+    assert quantities.scale_line("1 (400g) can tomatoes", 2.5) == "2 1/2 (400g) can tomatoes"
+    assert quantities.scale_line("Onion 2", 1.5) == "Onion 3"
+
+
+def test_zero_stays_zero():
+    assert quantities.scale_line("Butter 0 g", 2.5) == "Butter 0 g"
+
+
+def test_lines_without_a_quantity_are_unchanged():
+    assert quantities.scale_line("Salt to taste", 3) == "Salt to taste"
+
+
+def test_unreadable_numbers_are_refused():
+    assert quantities.scale_line("3x secret spice mix", 2) is None
+    recipe = {"title": "x", "ingredients": ["Rice 1 cup", "3x secret spice mix"], "steps": [], "servings": 2}
+    assert quantities.scale_recipe(recipe, 4) is None
+
+
+def test_units_convert_and_round():
+    assert quantities.scale_line("Ghee 3 tsp", 2) == "Ghee 2 tbsp"
+    assert quantities.scale_line("Green chillies 2-3", 2) == "Green chillies 4-6"
+
+
+def test_scaling_properties_hold_on_random_recipes():
+    assert bench_scale.check_properties(random.Random(11), 300) == []
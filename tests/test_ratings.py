@@ -0,0 +1,144 @@
+import random
+
+import pytest
+
+import catalog
+import memory
+import ratings
+from tests.stubs import RECIPE
+
+PREFS = {"number_of_people": 2, "spice_level": 5, "region_preference": "north",
+         "preference_type": "cuisine", "allergies": [], "dislikes": []}
+
+# scope -> expression over feedback naming the key the triggers aggregate under
+SCOPES = {"recipe": "recipe_key", "region": "region", "spice": "CAST(spice_level AS TEXT)"}
+
+
+@pytest.fixture
+def fresh(monkeypatch):
+    monkeypatch.setattr(ratings, "_ratings", None)
+    monkeypatch.setattr(ratings, "RATINGS_REFRESH_SEC", 0)
+
+
+def _bayes(total, n):
+    prior = memory.FEEDBACK_PRIOR_MEAN * memory.FEEDBACK_PRIOR_WEIGHT
+    return (total + prior) / (n + memory.FEEDBACK_PRIOR_WEIGHT)
+
+
+def _feedback(rng, n=300):
+    for i in range(n):
+        memory.store_feedback(
+            f"u{i % 7}", rng.choice([0, 1, 2, 3, 4, 5, 5, 6]), "",
+            rng.choice([None, "k1", "k2", "k3"]), rng.choice([None, "Dal", "Dal Tadka"]),
+            rng.choice([None, "north", "south"]), rng.choice([None, 1, 3, 5]))
+
+
+def test_stats_match_a_group_by_over_feedback(db):
+    _feedback(random.Random(7))
+    db.flush()
+    for scope, expr in SCOPES.items():
+        expected = {
+            key: (n, mean, list(hist))
+            for key, n, mean, *hist in db.query(f"""
+                SELECT {expr}, COUNT(*), AVG(score), SUM(score=1), SUM(score=2), SUM(score=3), SUM(score=4),
+                       SUM(score=5)
+                FROM feedback WHERE score BETWEEN 1 AND 5 AND {expr} IS NOT NULL GROUP BY {expr}""")}
+        assert expected
+        got = {r["key"]: r for r in memory.top_rated(scope, k=100)}
+        assert set(got) == set(expected)
+        for key, (n, mean, hist) in expected.items():
+            assert got[key]["n"] == n
+            assert got[key]["mean"] == pytest.approx(mean)
+            assert got[key]["histogram"] == hist
+            assert got[key]["score"] == pytest.approx(_bayes(mean * n, n))
+
+
+def test_stats_keep_the_latest_title(db):
+    memory.store_feedback("u1", 4, "", "k1", "Dal")
+    memory.store_feedback("u1", 4, "", "k1", None)
+    memory.store_feedback("u1", 4, "", "k1", "Dal Tadka")
+    memory.store_feedback("u1", 4, "", "k1", None)
+    db.flush()
+    assert memory.rating("recipe", "k1")["title"] == "Dal Tadka"
+    assert memory.rating("recipe", "nope") is None
+
+
+def test_top_rated_orders_by_bayesian_average(db):
+    # one 5 is ranked below many 4s, and one 1 above many 2s
+    for key, scores in {"one5": [5], "many4": [4] * 10, "one1": [1], "many2": [2] * 10, "mid": [3, 3]}.items():
+        for s in scores:
+            memory.store_feedback("u1", s, "", key)
+    best = [r["key"] for r in memory.top_rated("recipe")]
+    worst = [r["key"] for r in memory.top_rated("recipe", worst=True)]
+    assert best == ["many4", "one5", "mid", "one1", "many2"]
+    assert worst == best[::-1]
+    assert [r["key"] for r in memory.top_rated("recipe", k=2)] == ["many4", "one5"]
+    assert [r["key"] for r in memory.top_rated("recipe", k=2, worst=True)] == ["many2", "one1"]
+    scores = [r["score"] for r in memory.top_rated("recipe")]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_ratings_refresh_picks_up_only_changes(db):
+    memory.store_feedback("u1", 5, "", "k1", region="north")
+    memory.store_feedback("u1", 1, "", "k2", region="north")
+    r = ratings.Ratings()
+    assert r.refresh() == 3
+    assert r.version == 1
+    assert r.scores("recipe") == {"k1": pytest.approx(_bayes(5, 1)), "k2": pytest.approx(_bayes(1, 1))}
+    assert r.score("region", "north") == pytest.approx(_bayes(6, 2))
+    assert r.refresh() == 0
+    assert r.version == 1
+
+    memory.store_feedback("u2", 5, "", "k2")
+    assert r.refresh() == 1
+    assert r.version == 2
+    assert r.score("recipe", "k2") == pytest.approx(_bayes(6, 2))
+    assert r.score("recipe", "k1") == pytest.approx(_bayes(5, 1))
+    assert list(memory.iter_changed_ratings(r.last_id)) == []
+
+
+def _store(title, **prefs):
+    recipe = dict(RECIPE, title=title)
+    memory.push_recipe("u1", title, recipe, dict(PREFS, **prefs))
+    return catalog.recipe_key(recipe)
+
+
+def _dislike(key, title):
+    for _ in range(3):
+        memory.store_feedback("u1", 1, "", key, title)
+
+
+def test_catalog_never_serves_a_disliked_recipe(db, fresh):
+    cuisine = _store("Cuisine Paneer")
+    dietary = _store("Dietary Paneer", preference_type="dietary")
+    db.flush()
+    cat = catalog.RecipeCatalog(min_score=0.0)
+    cat.refresh()
+    assert cat.best(PREFS)["title"] == "Cuisine Paneer"
+
+    _dislike(cuisine, "Cuisine Paneer")
+    cat.refresh()
+    assert ratings.get_ratings().score("recipe", cuisine) <= ratings.DISLIKED_SCORE
+    assert cat.best(PREFS)["title"] == "Dietary Paneer"
+    for p in ({"preference_type": "dietary"}, {"region_preference": "south"}, {"spice_level": 1},
+              {"number_of_people": 6}):
+        served = [cat.recipe(doc)["title"] for _, doc in cat.match(dict(PREFS, **p), k=10)]
+        assert "Cuisine Paneer" not in served, p
+
+    _dislike(dietary, "Dietary Paneer")
+    cat.refresh()
+    assert cat.match(PREFS) == []
+    assert cat.best(PREFS) is None
+
+
+def test_liked_recipe_is_served_first(db, fresh):
+    _store("Old Paneer")
+    _store("New Paneer")
+    db.flush()
+    cat = catalog.RecipeCatalog()
+    cat.refresh()
+    old = catalog.recipe_key(dict(RECIPE, title="Old Paneer"))
+    for _ in range(5):
+        memory.store_feedback("u1", 5, "", old, "Old Paneer")
+    cat.refresh()
+    assert cat.best(PREFS)["title"] == "Old Paneer"
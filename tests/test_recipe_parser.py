@@ -0,0 +1,36 @@
+import json
+
+import recipe_parser
+from agents import recipe
+from tests.stubs import RECIPE, reply
+
+PREFS = {"number_of_people": 2, "spice_level": 5, "region_preference": "north", "preference_type": "none",
+         "allergies": [], "dislikes": []}
+FULL = json.dumps(RECIPE)
+# cut off inside the second step, before "tips"
+CUT = FULL[:FULL.index('"tomatoes"}') + 5]
+
+
+def test_cut_off_reply_goes_to_repair():
+    result = recipe_parser.parse_recipe(CUT, truncated=True)
+    assert result.recipe is None
+    assert set(result.errors) == {"steps", "tips"}
+    assert result.data["title"] == RECIPE["title"]
+
+
+def test_without_finish_reason_the_tail_is_closed_off():
+    result = recipe_parser.parse_recipe(CUT)
+    assert result.recipe is not None and result.repaired
+
+
+def test_complete_object_at_the_limit_is_served():
+    assert recipe_parser.parse_recipe(FULL, truncated=True).recipe is not None
+
+
+def test_truncated_generation_is_repaired(stub):
+    fix = json.dumps({"steps": RECIPE["steps"], "tips": RECIPE["tips"]})
+    stub.replies[:] = [reply(CUT, finish_reason="length"), fix]
+    out = recipe.generate(PREFS, use_cache=False)
+    assert out["steps"] == RECIPE["steps"] and out["tips"] == RECIPE["tips"]
+    assert len(stub.calls) == 2
+    assert "steps" in stub.calls[1]["messages"][1]["content"]
@@ -0,0 +1,98 @@
+import pytest
+
+import memory
+import semantic_cache
+from agents import regular_chat
+from semantic_cache import SemanticCache
+
+FOODS = ["rice", "dal", "potatoes", "paneer"]
+
+
+def _cache(**kw):
+    return SemanticCache(persistent=False, **kw)
+
+
+@pytest.fixture(params=["numpy", "pure-python"])
+def backend(request, monkeypatch):
+    if request.param == "pure-python":
+        monkeypatch.setattr(semantic_cache, "np", None)
+    elif semantic_cache.np is None:
+        pytest.skip("numpy is not installed")
+    return request.param
+
+
+def test_paraphrase_hits_and_unrelated_question_misses(backend):
+    cache = _cache()
+    assert (cache._matrix is None) == (backend == "pure-python")
+    cache.put("how do I make rice fluffy", "RICE")
+    assert cache.get("how do i make the rice fluffy?") == "RICE"
+    assert cache.get("best way to store coriander") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_threshold_decides_a_near_match(backend):
+    strict, loose = _cache(threshold=0.9), _cache(threshold=0.5)
+    for cache in (strict, loose):
+        cache.put("how do I make rice fluffy", "RICE")
+    score = loose.search("how to keep rice fluffy", 1)[0].score
+    assert 0.5 <= score < 0.9
+    assert loose.get("how to keep rice fluffy") == "RICE"
+    assert strict.get("how to keep rice fluffy") is None
+    # filler words aside, a repeat is the same key and skips the threshold
+    assert strict.get("please, how do I make rice fluffy") == "RICE"
+
+
+def test_rare_words_decide_the_match(backend):
+    cache = _cache(threshold=0.5)
+    for food in FOODS:
+        cache.put(f"how long to cook {food}", food.upper())
+    plain = semantic_cache.cosine(semantic_cache.embed("how long to cook rice"),
+                                  semantic_cache.embed("how long to cook chicken"))
+    assert plain >= 0.5
+    # the shared framing words are common among the cached questions, the food is not
+    assert cache.search("how long to cook chicken", 1)[0].score < 0.5
+    assert cache.get("how long to cook chicken") is None
+    assert cache.get("how long should I cook paneer") == "PANEER"
+
+
+def test_least_recently_used_is_evicted(backend):
+    cache = _cache(max_size=2)
+    cache.put("how long to cook rice", "RICE")
+    cache.put("how long to cook dal", "DAL")
+    cache.get("how long to cook rice")
+    cache.put("how long to cook paneer", "PANEER")
+    assert len(cache) == 2 and cache.stats()["evictions"] == 1
+    assert cache.get("how long to cook dal") is None
+    assert cache.get("how long to cook rice") == "RICE"
+
+
+def test_answers_persist_and_reload(db):
+    cache = SemanticCache(max_size=2)
+    cache.put("how long to cook rice", "RICE")
+    cache.put("how long to cook dal", "DAL")
+    cache.put("how long to cook paneer", "PANEER")
+    db.flush()
+    reloaded = SemanticCache(max_size=2)
+    assert reloaded.get("how long to cook paneer") == "PANEER"
+    assert reloaded.get("how long to cook dal") == "DAL"
+    # the evicted entry is gone from the DB too
+    assert [q for _, q, _ in memory.load_chat_answers(10) if "rice" in q] == []
+
+
+def test_pii_is_scrubbed_before_storage(db):
+    cache = SemanticCache()
+    cache.put("mail me at cook@example.com how to fry okra", "Call +91 98765 43210 for tips")
+    db.flush()
+    ((_, question, answer),) = memory.load_chat_answers(10)
+    assert "cook@example.com" not in question and "[redacted_email]" in question
+    assert "98765" not in answer and "[redacted_phone]" in answer
+    assert "example.com" not in cache.search("how to fry okra", 1)[0].question
+
+
+def test_cached_chat_answer_quotes_the_current_question(monkeypatch):
+    monkeypatch.setattr(regular_chat, "chat_cache", _cache())
+    first = regular_chat.reply("how do I make rice fluffy")["text"]
+    again = regular_chat.reply("how do i make the rice fluffy")["text"]
+    assert "'how do I make rice fluffy'" in first
+    assert "'how do i make the rice fluffy'" in again and "'how do I make rice fluffy'" not in again
+    assert regular_chat.chat_cache.stats()["hits"] == 1
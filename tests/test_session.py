@@ -0,0 +1,90 @@
+import copy
+import pickle
+import threading
+import time
+
+import pytest
+
+from session import InMemorySessionBackend, SessionBusy, SessionState, SessionStore, SQLiteSessionBackend
+
+
+def _append(calls, text, pause=0.0):
+    def fn(sess):
+        calls.append(text)
+        time.sleep(pause)
+        sess.history.append("you", text)
+    return fn
+
+
+def test_turn_sees_another_workers_save_and_runs_once():
+    backend = InMemorySessionBackend()
+    a, b = SessionStore(backend), SessionStore(backend)
+    calls = []
+    a.run_turn("u1", _append(calls, "first"))
+    b.run_turn("u1", _append(calls, "second"))
+    # a's cached copy is stale: it is reloaded, not raced and retried
+    a.run_turn("u1", _append(calls, "third"))
+    assert calls == ["first", "second", "third"]
+    assert [t for _, t in a.get("u1").history] == ["first", "second", "third"]
+
+
+def test_concurrent_turns_run_one_at_a_time():
+    backend = InMemorySessionBackend()
+    stores = [SessionStore(backend) for _ in range(4)]
+    calls = []
+    threads = [threading.Thread(target=s.run_turn, args=("u1", _append(calls, f"m{i}", 0.02)))
+               for i, s in enumerate(stores)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 4
+    assert sorted(t for _, t in stores[0].get("u1").history) == ["m0", "m1", "m2", "m3"]
+
+
+def test_failed_turn_leaves_the_saved_session():
+    store = SessionStore(InMemorySessionBackend())
+    store.run_turn("u1", _append([], "kept"))
+
+    def broken(sess):
+        sess.history.append("you", "lost")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        store.run_turn("u1", broken)
+    assert [t for _, t in store.get("u1").history] == ["kept"]
+
+
+def test_busy_session_times_out(db):
+    backend = SQLiteSessionBackend()
+    assert backend.acquire("u1", "other", 60)
+    store = SessionStore(backend, lease_wait=0.05)
+    with pytest.raises(SessionBusy):
+        store.run_turn("u1", _append([], "x"))
+    backend.release("u1", "other")
+    store.run_turn("u1", _append([], "x"))
+    # an expired lease is taken over
+    assert backend.acquire("u1", "crashed", -1)
+    assert backend.acquire("u1", "next", 60)
+    assert not backend.acquire("u1", "late", 60)
+
+
+def test_copies_keep_unset_fields_unset():
+    state = SessionState(user_id="u", preferences={"spice_level": 5}, custom=[1])
+    for twin in (copy.copy(state), copy.deepcopy(state), pickle.loads(pickle.dumps(state)),
+                 SessionState.restore(state.snapshot())):
+        assert twin.get("last_recipe", "DEFAULT") == "DEFAULT"
+        assert "last_recipe" not in twin and "step_index" not in twin
+        assert twin.snapshot() == state.snapshot()
+    deep = copy.deepcopy(state)
+    deep["preferences"]["spice_level"] = 9
+    deep["custom"].append(2)
+    assert state["preferences"] == {"spice_level": 5} and state["custom"] == [1]
+
+
+def test_clear_unsets_every_field():
+    state = SessionState(user_id="u", _in_steps=True, custom=1)
+    state.clear()
+    assert list(state.keys()) == [] and "user_id" not in state
+    state["user_id"] = "v"
+    assert state.snapshot() == {"user_id": "v"}
@@ -0,0 +1,83 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import memory
+from benchmarks import bench_startup
+from llm import LLMGateway
+
+ROOT = Path(__file__).resolve().parent.parent
+
+GREETING = r"""
+import json, sys, tempfile
+from pathlib import Path
+import memory
+from benchmarks import bench_startup
+memory.DB = Path(tempfile.mkdtemp()) / "startup.db"
+from workflow import build_graph
+memory.init_db()
+import llm
+llm.LLMGateway(api_key="x")
+text, ctx = build_graph().run_once({"user_id": "startup"}, "hello")
+print(json.dumps(sorted(m for m in ("agents.recipe", "openai", "pydantic", "httpx") if m in sys.modules)))
+"""
+
+
+def test_greeting_turn_does_not_load_the_llm_stack():
+    # a fresh interpreter: this one has imported everything already
+    proc = subprocess.run([sys.executable, "-c", GREETING], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert json.loads(proc.stdout.strip().splitlines()[-1]) == []
+
+
+def test_gateway_builds_its_client_on_first_use():
+    pytest.importorskip("httpx")
+    gw = LLMGateway(api_key="x")
+    assert gw._client is None and gw._async_client is None
+    assert gw.client is gw.client
+    assert gw._async_client is None
+
+
+def test_init_db_runs_each_migration_once(db):
+    with db.connection() as conn:
+        versions = [r[0] for r in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [v for v, _ in memory.MIGRATIONS]
+    memory._migrated.discard(db.path)
+    memory.init_db()
+    with db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(memory.MIGRATIONS)
+
+
+def test_init_db_upgrades_an_older_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "DB", tmp_path / "old.db")
+    monkeypatch.setattr(memory, "_storage", None)
+    monkeypatch.setattr(memory, "MIGRATIONS", memory.MIGRATIONS[:5])
+    monkeypatch.setattr(memory, "SCHEMA_VERSION", 5)
+    memory.init_db()
+    store = memory.get_storage()
+    monkeypatch.undo()
+    monkeypatch.setattr(memory, "DB", tmp_path / "old.db")
+    monkeypatch.setattr(memory, "_storage", store)
+    memory._migrated.discard(store.path)
+    try:
+        memory.init_db()
+        assert memory.acquire_session_lease("u1", "worker-a", 30)
+    finally:
+        store.close()
+
+
+def test_recipe_agent_resolves_the_gateway_on_first_call():
+    code = "import llm; from agents import recipe; print(llm._gateway is None, recipe._gateway() is llm._gateway)"
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert proc.stdout.split() == ["True", "True"]
+
+
+def test_cold_start_within_limits():
+    # fresh interpreters, against the limits bench_startup.py gates CI with
+    import_ms, _ = bench_startup.import_profile(1)
+    res = bench_startup.first_response()
+    assert import_ms <= bench_startup.MAX_IMPORT_MS
+    assert res["first_response_ms"] <= bench_startup.MAX_FIRST_RESPONSE_MS
+    assert res["loaded"] == []
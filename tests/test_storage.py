@@ -0,0 +1,71 @@
+import threading
+import time
+
+import memory
+import metrics
+
+
+def test_flush_waits_only_for_earlier_writes(tmp_path):
+    store = memory.Storage(tmp_path / "t.db")
+    store.execute("CREATE TABLE t(x INTEGER)")
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            store.enqueue("INSERT INTO t VALUES (?)", (1,))
+            time.sleep(0.0005)
+
+    threads = [threading.Thread(target=writer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    try:
+        time.sleep(0.2)
+        store.enqueue("INSERT INTO t VALUES (?)", (2,))
+        start = time.perf_counter()
+        store.flush()
+        took = time.perf_counter() - start
+        assert store.query("SELECT COUNT(*) FROM t WHERE x=2")[0][0] == 1
+        assert took < 1.0
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        store.close()
+
+
+def test_bad_write_loses_only_itself(tmp_path):
+    store = memory.Storage(tmp_path / "t.db")
+    store.execute("CREATE TABLE t(x INTEGER NOT NULL)")
+    before = sum(metrics.counters("chef_db_write_errors_total").values())
+    for x in (1, None, 3):
+        store.enqueue("INSERT INTO t VALUES (?)", (x,))
+    store.flush()
+    assert [r[0] for r in store.query("SELECT x FROM t ORDER BY x")] == [1, 3]
+    assert sum(metrics.counters("chef_db_write_errors_total").values()) == before + 1
+    store.close()
+
+
+def test_flush_after_close_returns(tmp_path):
+    store = memory.Storage(tmp_path / "t.db")
+    store.execute("CREATE TABLE t(x INTEGER)")
+    store.enqueue("INSERT INTO t VALUES (?)", (1,))
+    store.close()
+    store.flush()
+
+
+def test_writer_survives_a_non_sqlite_error(tmp_path, capsys):
+    store = memory.Storage(tmp_path / "t.db")
+    store.execute("CREATE TABLE t(x INTEGER)")
+    before = sum(metrics.counters("chef_db_write_errors_total").values())
+    store.enqueue("INSERT INTO t VALUES (?)", (1,))
+    # not a parameter sequence: a TypeError, not an sqlite3.Error
+    store.enqueue("INSERT INTO t VALUES (?)", 42)
+    store.flush()
+    store.enqueue("INSERT INTO t VALUES (?)", (2,))
+    done = threading.Event()
+    threading.Thread(target=lambda: (store.flush(), done.set()), daemon=True).start()
+    assert done.wait(5), "flush() hung: the writer thread died"
+    assert [r[0] for r in store.query("SELECT x FROM t ORDER BY x")] == [1, 2]
+    assert sum(metrics.counters("chef_db_write_errors_total").values()) == before + 1
+    assert capsys.readouterr().err == ""
+    store.close()
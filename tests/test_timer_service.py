@@ -0,0 +1,37 @@
+import time
+
+import memory
+from timer_service import TimerService
+
+
+def _worker(db, delivered):
+    # a second process: its own scheduler over the same database
+    return TimerService(memory.TimerScheduler(db), deliver=lambda uid, labels: delivered.append((uid, labels)))
+
+
+def test_only_the_worker_the_session_waits_on_claims(db):
+    here, there = [], []
+    a, b = _worker(db, here), _worker(db, there)
+    try:
+        a.scheduler.add("u1", "simmer", int(time.time()) + 1)
+        b.watch("u1")
+        assert b.wait("u1", 5) == ["simmer"]
+        time.sleep(0.1)
+        assert there == [("u1", ["simmer"])] and here == []
+        assert not b.has_pending("u1")
+    finally:
+        a.stop()
+        b.stop()
+
+
+def test_due_timer_is_claimed_by_the_next_wait(db):
+    delivered = []
+    service = _worker(db, delivered)
+    try:
+        service.scheduler.add("u1", "rest", int(time.time()) - 1)
+        time.sleep(0.1)
+        assert delivered == []
+        assert service.wait("u1", 5) == ["rest"]
+        assert delivered == [("u1", ["rest"])]
+    finally:
+        service.stop()
@@ -0,0 +1,26 @@
+import memory
+
+
+def test_heap_dropped_once_empty(db):
+    sched = memory.get_timer_scheduler()
+    sched.add("u1", "rice", 100)
+    sched.add("u1", "dal", 200)
+    assert sched.fetch_due("u1", 150) and "u1" in sched._heaps
+    assert [label for _, label in sched.fetch_due("u1", 250)] == ["dal"]
+    assert "u1" not in sched._heaps
+    # nothing pending: a later poll finds nothing and keeps no heap
+    assert sched.fetch_due("u1", 300) == [] and sched.next_wake("u1") is None
+    assert "u1" not in sched._heaps
+
+
+def test_cancel_drops_heap_and_pending_rows(db):
+    sched = memory.get_timer_scheduler()
+    sched.add("u2", "simmer", 100)
+    sched.cancel("u2")
+    assert "u2" not in sched._heaps
+    assert sched.next_wake("u2") is None
+
+
+def test_compaction_uses_fired_index(db):
+    plan = db.query("EXPLAIN QUERY PLAN " + memory.SQL_COMPACT_TIMERS, (0,))
+    assert any("idx_timers_fired" in row[-1] for row in plan)
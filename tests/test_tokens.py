@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+import tokens
+
+MESSAGES = [{"role": "system", "content": "You are a chef."}, {"role": "user", "content": "Recipe for: people=2"}]
+
+
+@pytest.fixture
+def estimate(monkeypatch):
+    """Count with the pre-tokenizer estimate whether or not tiktoken is installed."""
+    monkeypatch.setattr(tokens, "_encoding", lambda model: None)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.mark.parametrize("text, n", [
+    ("", 0),
+    ("hello", 1),
+    ("hello world", 2),
+    ("internationalization", 4),
+    ("12345", 2),
+    ("!!!!", 2),
+    ("don't", 2),
+    ("a\n  b", 3),
+    ('{"title": "Dal"}', 6),
+])
+def test_estimate(estimate, text, n):
+    assert tokens.estimate_tokens(text) == n
+    assert tokens.count_tokens(text) == n
+
+
+def test_count_tokens_uses_the_encoding_when_available(monkeypatch):
+    seen = []
+
+    def encoding(model):
+        seen.append(model)
+        return SimpleNamespace(encode=lambda text: text.split())
+
+    monkeypatch.setattr(tokens, "_encoding", encoding)
+    assert tokens.count_tokens("one two three four", model="gpt-4o") == 4
+    assert seen == ["gpt-4o"]
+    assert tokens.count_tokens("") == 0
+
+
+def test_count_messages_adds_chat_framing(estimate):
+    body = sum(tokens.count_tokens(m["content"]) for m in MESSAGES)
+    n = tokens.count_messages(MESSAGES)
+    assert n == body + len(MESSAGES) * tokens.MESSAGE_OVERHEAD + tokens.REPLY_OVERHEAD
+    assert tokens.count_messages([{"role": "user", "content": None}]) == \
+        tokens.MESSAGE_OVERHEAD + tokens.REPLY_OVERHEAD
+
+
+def test_estimate_usage(estimate):
+    usage = tokens.estimate_usage(MESSAGES, "hello world")
+    assert usage == {"prompt_tokens": tokens.count_messages(MESSAGES), "completion_tokens": 2,
+                     "total_tokens": tokens.count_messages(MESSAGES) + 2}
+
+
+def test_cost_charges_cached_prompt_tokens_at_the_cached_price(monkeypatch):
+    monkeypatch.setattr(tokens, "PRICE_PROMPT_PER_M", 0.15)
+    monkeypatch.setattr(tokens, "PRICE_CACHED_PER_M", 0.075)
+    monkeypatch.setattr(tokens, "PRICE_COMPLETION_PER_M", 0.60)
+    assert tokens.cost(1e6, 1e6) == pytest.approx(0.75)
+    assert tokens.cost(1e6, 1e6, cached=5e5) == pytest.approx(0.5 * 0.15 + 0.5 * 0.075 + 0.60)
+    assert tokens.cost(0, 0) == 0
+
+
+def test_report_per_node(registry):
+    for _ in range(4):
+        metrics.record_llm_usage("recipe", {"prompt_tokens": 500, "completion_tokens": 300,
+                                            "prompt_tokens_details": {"cached_tokens": 400}})
+        metrics.observe("chef_llm_seconds", metrics.BUCKETS[12], node="recipe")
+    metrics.record_llm_usage("chat", {"prompt_tokens": 100, "completion_tokens": 20})
+    metrics.inc("chef_llm_usage_estimated_total", node="chat")
+
+    nodes = tokens.report()
+    assert set(nodes) == {"recipe", "chat"}
+    r = nodes["recipe"]
+    assert (r["calls"], r["prompt"], r["cached"], r["completion"], r["estimated"]) == (4, 2000, 1600, 1200, 0)
+    assert (r["prompt_per_call"], r["completion_per_call"]) == (500, 300)
+    assert r["cost_usd"] == pytest.approx(tokens.cost(2000, 1200, 1600))
+    assert r["cost_per_call_usd"] == pytest.approx(r["cost_usd"] / 4)
+    assert r["p50_s"] == r["p95_s"] == metrics.BUCKETS[12]
+    c = nodes["chat"]
+    assert (c["calls"], c["cached"], c["estimated"], c["p50_s"]) == (1, 0, 1, 0.0)
+
+    lines = tokens.format_report(nodes).splitlines()
+    assert lines[0].split()[:2] == ["node", "calls"]
+    assert lines[1].startswith("chat") and lines[1].endswith("(estimated)")
+    assert lines[2].startswith("recipe") and "80%" in lines[2].split()
+
+
+def test_empty_report(registry):
+    assert tokens.report() == {}
+    assert len(tokens.format_report().splitlines()) == 1
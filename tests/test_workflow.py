@@ -0,0 +1,69 @@
+import pytest
+
+import memory
+import workflow
+from tests.stubs import RECIPE
+
+PREFS = {"number_of_people": 2, "spice_level": 5, "region_preference": "north",
+         "preference_type": "none", "allergies": [], "dislikes": []}
+
+
+@pytest.fixture
+def graph(db):
+    return workflow.build_graph()
+
+
+def _ctx():
+    return {"user_id": "u1", "preferences": dict(PREFS), "last_recipe": dict(RECIPE, servings=2)}
+
+
+@pytest.mark.parametrize("message", ["What should I serve with dal?", "does this serve well cold"])
+def test_serve_questions_are_not_scaling(message):
+    assert workflow.router.route(_ctx(), message)[0] != "scale"
+
+
+def test_people_count_scales():
+    assert workflow.router.route(_ctx(), "make it for 6 people")[0] == "scale"
+
+
+def test_bare_number_answers_the_servings_question(graph):
+    ctx = _ctx()
+    text, ctx = graph.run_once(ctx, "how many portions?")
+    assert text.startswith("How many people") and ctx["expecting_servings"]
+    text, ctx = graph.run_once(ctx, "4")
+    assert "expecting_servings" not in ctx
+    assert ctx["last_recipe"]["servings"] == 4 and ctx["preferences"]["number_of_people"] == 4
+
+
+def test_unanswered_servings_question_is_dropped(graph):
+    ctx = _ctx()
+    _, ctx = graph.run_once(ctx, "how many portions?")
+    graph.run_once(ctx, "is ghee better than butter")
+    assert "expecting_servings" not in ctx
+    assert workflow.router.route(ctx, "4")[0] != "scale"
+
+
+def _cooked(graph):
+    """A context at the end of step-by-step, with the last step's timer running."""
+    ctx = _ctx()
+    for message in ("yes", "next", "next"):
+        text, ctx = graph.run_once(ctx, message)
+    assert text.startswith("That was the last step") and ctx["expecting_feedback"]
+    return ctx
+
+
+def test_last_step_leaves_its_timer_running(graph):
+    ctx = _cooked(graph)
+    assert memory.get_timer_scheduler().next_wake("u1") is not None
+    text, ctx = graph.run_once(ctx, "5/5 lovely")
+    assert text != "Please provide feedback starting with a number 1-5."
+    assert "_in_steps" not in ctx and "last_recipe" not in ctx
+    assert memory.get_timer_scheduler().next_wake("u1") is not None
+
+
+def test_question_after_the_last_step_is_not_feedback(graph):
+    ctx = _cooked(graph)
+    assert workflow.router.route(ctx, "is ghee better than butter")[0] == "feedback"
+    graph.run_once(ctx, "is ghee better than butter")
+    assert "expecting_feedback" not in ctx and ctx["last_recipe"]
+    assert workflow.router.route(ctx, "4")[0] != "feedback"
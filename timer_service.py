@@ -0,0 +1,165 @@
+"""
+timer_service.py
+
+Background timer service that pushes fired timers to sessions.
+
+The service keeps one min-heap of (wake_at, user_id), at most one entry per
+user, and a single thread that sleeps until the earliest wake time. When a
+timer is due and the user has a session waiting in this process (wait()), it
+claims that user's due rows through memory.TimerScheduler (the only database
+round trip), hands the labels to `deliver` on a small worker pool (it may
+wait on the session's lease; other users' timers do not wait for it) and
+then wakes the waiting session.
+
+With several workers, each process runs its own service, so a due timer is
+claimed only where the user's session is waiting; the others leave it in
+the table. `deliver` should write the labels somewhere every worker reads
+(app.py appends them to the stored session), so a claimed timer is never
+lost in one process's memory. A user with no session waiting anywhere keeps
+their due timers until the next wait(), which claims them at once.
+"""
+
+import heapq
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from memory import TimerScheduler, get_timer_scheduler
+from metrics import inc
+
+
+class TimerService:
+    def __init__(self, scheduler: Optional[TimerScheduler] = None,
+                 deliver: Optional[Callable[[str, List[str]], None]] = None):
+        self.scheduler = scheduler or get_timer_scheduler()
+        self.deliver = deliver
+        self._heap: List[Tuple[int, str]] = []
+        # user_id -> the wake time of that user's live heap entry
+        self._armed: Dict[str, int] = {}
+        # user_id -> sessions blocked in wait()
+        self._waiters: Dict[str, int] = {}
+        # user_id -> a wake that came due while no session waited here
+        self._unclaimed: Dict[str, int] = {}
+        self._queues: Dict[str, "queue.Queue[str]"] = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="timer-deliver")
+        self.scheduler.listeners.append(self._arm)
+        self._thread = threading.Thread(target=self._loop, name="timer-service", daemon=True)
+        self._thread.start()
+
+    def _arm(self, user_id: str, wake_at: int) -> None:
+        with self._cond:
+            armed = self._armed.get(user_id)
+            if armed is not None and armed <= wake_at:
+                return
+            # an entry for a later wake stays in the heap and is skipped when popped
+            self._armed[user_id] = wake_at
+            heapq.heappush(self._heap, (wake_at, user_id))
+            if self._heap[0] == (wake_at, user_id):
+                self._cond.notify()
+
+    def _queue(self, user_id: str) -> "queue.Queue[str]":
+        q = self._queues.get(user_id)
+        if q is None:
+            with self._cond:
+                q = self._queues.setdefault(user_id, queue.Queue())
+        return q
+
+    def watch(self, user_id: str) -> None:
+        """Pick up this user's timers from the table, including any another worker added."""
+        self._queue(user_id)
+        wake = self.scheduler.reload(user_id)
+        with self._cond:
+            self._unclaimed.pop(user_id, None)
+        if wake is not None:
+            self._arm(user_id, wake)
+
+    def next_wake(self, user_id: str) -> Optional[int]:
+        return self.scheduler.next_wake(user_id)
+
+    def has_pending(self, user_id: str) -> bool:
+        return self.scheduler.next_wake(user_id) is not None or not self._queue(user_id).empty()
+
+    def drain(self, user_id: str) -> List[str]:
+        """Labels of timers that fired for this user since the last drain (never blocks)."""
+        q = self._queue(user_id)
+        out = []
+        while True:
+            try:
+                out.append(q.get_nowait())
+            except queue.Empty:
+                return out
+
+    def wait(self, user_id: str, timeout: float) -> List[str]:
+        """Block up to `timeout` seconds for this user's next fired timers; returns their labels."""
+        q = self._queue(user_id)
+        with self._cond:
+            self._waiters[user_id] = self._waiters.get(user_id, 0) + 1
+            wake = self._unclaimed.pop(user_id, None)
+        try:
+            if wake is not None:
+                self._arm(user_id, wake)
+            try:
+                first = q.get(timeout=timeout)
+            except queue.Empty:
+                return []
+            return [first] + self.drain(user_id)
+        finally:
+            with self._cond:
+                left = self._waiters[user_id] - 1
+                if left:
+                    self._waiters[user_id] = left
+                else:
+                    del self._waiters[user_id]
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.time()):
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                now = int(time.time())
+                users = []
+                while self._heap and self._heap[0][0] <= now:
+                    wake_at, user_id = heapq.heappop(self._heap)
+                    if self._armed.get(user_id) != wake_at:
+                        continue
+                    del self._armed[user_id]
+                    # nobody waiting here: the next wait(), here or on another worker, claims it
+                    if user_id in self._waiters:
+                        users.append(user_id)
+                    else:
+                        self._unclaimed[user_id] = wake_at
+            for user_id in users:
+                try:
+                    labels = [label for _tid, label in self.scheduler.fetch_due(user_id, now)]
+                except Exception:
+                    inc("chef_timer_errors_total", stage="fetch")
+                    continue
+                if labels:
+                    self._pool.submit(self._hand_over, user_id, labels)
+                wake = self.scheduler.next_wake(user_id)
+                if wake is not None:
+                    self._arm(user_id, wake)
+
+    def _hand_over(self, user_id: str, labels: List[str]) -> None:
+        if self.deliver is not None:
+            try:
+                self.deliver(user_id, labels)
+            except Exception:
+                inc("chef_timer_errors_total", stage="deliver")
+        q = self._queue(user_id)
+        for label in labels:
+            q.put(label)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+        self._pool.shutdown()
@@ -0,0 +1,135 @@
+"""
+tokens.py
+
+Offline token counting and a per-node token/cost report.
+
+count_tokens() uses tiktoken's encoding for the model when tiktoken is
+installed. Without it, text is split the way the GPT pre-tokenizer splits it
+(words with their leading space, runs of up to three digits, punctuation
+runs, whitespace) and long pieces are charged by length. That is an
+estimate, close enough to compare prompts and size budgets; install tiktoken
+for exact counts. Nothing here calls the network.
+
+The LLM gateway records the usage the provider reports per node; when a
+reply carries none (many streams, local stubs) it records these estimates
+instead and counts chef_llm_usage_estimated_total. report() turns the
+counters and chef_llm_seconds into prompt, cached and completion tokens,
+latency and cost per node.
+"""
+
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+# USD per million tokens; defaults are gpt-4o-mini's list prices
+PRICE_PROMPT_PER_M = float(os.getenv("LLM_PRICE_PROMPT_PER_M") or 0.15)
+PRICE_CACHED_PER_M = float(os.getenv("LLM_PRICE_CACHED_PER_M") or 0.075)
+PRICE_COMPLETION_PER_M = float(os.getenv("LLM_PRICE_COMPLETION_PER_M") or 0.60)
+# chat framing: tokens added per message and once per reply
+MESSAGE_OVERHEAD = 3
+REPLY_OVERHEAD = 3
+
+_PIECE_RE = re.compile(r"'(?:s|t|re|ve|m|ll|d)|[^\W\d_]+|\d{1,3}|[^\w\s]+|\s+", re.IGNORECASE)
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: Optional[str]):
+    try:
+        import tiktoken
+    except ImportError:  # optional: the estimate below is used instead
+        return None
+    try:
+        return tiktoken.encoding_for_model(model or "gpt-4o-mini")
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def estimate_tokens(text: str) -> int:
+    """The pre-tokenizer estimate count_tokens() falls back to."""
+    n = 0
+    prev_space = False
+    for m in _PIECE_RE.finditer(text):
+        piece = m.group()
+        if piece.isspace():
+            # a single space joins the next word; newlines and indentation are a token of their own
+            prev_space = piece == " "
+            n += 0 if prev_space else 1
+            continue
+        if piece[0].isalpha():
+            n += max(1, math.ceil(len(piece) / 6))
+        elif piece[0].isdigit():
+            n += 1
+        else:
+            n += math.ceil(len(piece) / 2)
+        prev_space = False
+    return n
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    enc = _encoding(model)
+    return len(enc.encode(text)) if enc is not None else estimate_tokens(text)
+
+
+def count_messages(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    """Prompt tokens of a chat request."""
+    return sum(MESSAGE_OVERHEAD + count_tokens(m.get("content") or "", model) for m in messages) + REPLY_OVERHEAD
+
+
+def estimate_usage(messages: List[Dict[str, str]], completion: str, model: Optional[str] = None) -> Dict[str, int]:
+    """A `usage` dict for a reply the provider reported none for."""
+    prompt, done = count_messages(messages, model), count_tokens(completion, model)
+    return {"prompt_tokens": prompt, "completion_tokens": done, "total_tokens": prompt + done}
+
+
+def cost(prompt: float, completion: float, cached: float = 0) -> float:
+    """USD for the given token counts; `cached` prompt tokens are part of `prompt`."""
+    return ((prompt - cached) * PRICE_PROMPT_PER_M + cached * PRICE_CACHED_PER_M
+            + completion * PRICE_COMPLETION_PER_M) / 1e6
+
+
+def report() -> Dict[str, Dict[str, Any]]:
+    """
+    Per node: calls, prompt/cached/completion tokens (totals and per call),
+    how many calls were estimated, LLM latency p50/p95 and cost in USD.
+    """
+    nodes: Dict[str, Dict[str, Any]] = {}
+
+    def entry(labels) -> Dict[str, Any]:
+        node = dict(labels).get("node", "")
+        return nodes.setdefault(node, {"calls": 0, "estimated": 0, "prompt": 0, "cached": 0, "completion": 0})
+
+    for labels, v in metrics.counters("chef_llm_calls_total").items():
+        entry(labels)["calls"] += v
+    for labels, v in metrics.counters("chef_llm_usage_estimated_total").items():
+        entry(labels)["estimated"] += v
+    for labels, v in metrics.counters("chef_llm_tokens_total").items():
+        entry(labels)[dict(labels)["kind"]] += v
+    latency = {dict(labels).get("node"): h for labels, h in metrics.histograms("chef_llm_seconds").items()}
+    for node, e in nodes.items():
+        calls = e["calls"] or 1
+        e.update(prompt_per_call=e["prompt"] / calls, completion_per_call=e["completion"] / calls,
+                 cost_usd=cost(e["prompt"], e["completion"], e["cached"]))
+        e["cost_per_call_usd"] = e["cost_usd"] / calls
+        h = latency.get(node)
+        e["p50_s"], e["p95_s"] = (h.quantile(0.5), h.quantile(0.95)) if h is not None else (0.0, 0.0)
+    return nodes
+
+
+def format_report(nodes: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    nodes = report() if nodes is None else nodes
+    lines = [f"{'node':<14} {'calls':>6} {'prompt/call':>11} {'cached':>7} {'compl/call':>10} "
+             f"{'p50 s':>6} {'p95 s':>6} {'USD/call':>10} {'USD':>9}"]
+    for node, e in sorted(nodes.items()):
+        cached = e["cached"] / e["prompt"] if e["prompt"] else 0.0
+        est = " (estimated)" if e["estimated"] and e["estimated"] >= e["calls"] else \
+            f" ({e['estimated']:.0f} estimated)" if e["estimated"] else ""
+        lines.append(f"{node:<14} {e['calls']:6.0f} {e['prompt_per_call']:11.0f} {cached:7.0%} "
+                     f"{e['completion_per_call']:10.0f} {e['p50_s']:6.2f} {e['p95_s']:6.2f} "
+                     f"{e['cost_per_call_usd']:10.6f} {e['cost_usd']:9.4f}{est}")
+    return "\n".join(lines)
@@ -1,21 +1,101 @@
+import json
+import os
 import re
-from typing import Tuple
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# one pass for both kinds of PII; the email alternative wins where both could match
+_PII_RE = re.compile(r"(?P<email>\S+@\S+\.\S+)|(?P<phone>\+?\d[\d\-\s]{7,}\d)")
+_PII_REPLACEMENTS = {"email": "[redacted_email]", "phone": "[redacted_phone]"}
+
+DEFAULT_TERMS = {
+    "forbidden": ["bomb", "weapon", "kill", "poison", "manufacture", "bombs"],
+    "non_cooking": ["law", "divorce", "tax", "stocks", "politics", "programming", "hack"],
+}
+TERMS_FILE = Path(os.getenv("GUARDRAIL_TERMS_FILE") or Path(__file__).parent / "guardrail_terms.json")
+
+# simple inflections still count as the term ("killing", "hacked", "taxes")
+_SUFFIXES = r"(?:s|es|ed|ing)?"
+
 
 def scrub_pii(text: str) -> str:
     # redact emails and phone numbers
-    text = re.sub(r"\S+@\S+\.\S+", "[redacted_email]", text)
-    text = re.sub(r"\+?\d[\d\-\s]{7,}\d", "[redacted_phone]", text)
-    return text
+    return _PII_RE.sub(lambda m: _PII_REPLACEMENTS[m.lastgroup], text)
+
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """
+    Regex alternation factored by common prefixes, so matching cost grows with
+    the length of the text rather than with the number of terms.
+    """
+    trie: Dict[str, dict] = {}
+    for t in terms:
+        node = trie
+        for ch in t:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if end:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+def _compile_guardrail(terms: Dict[str, List[str]]) -> "re.Pattern":
+    forbidden = sorted({t.strip().lower() for t in terms.get("forbidden", []) if t.strip()})
+    non_cooking = sorted({t.strip().lower() for t in terms.get("non_cooking", []) if t.strip()})
+    groups = []
+    if forbidden:
+        groups.append(f"(?P<forbidden>{_trie_pattern(forbidden)})")
+    if non_cooking:
+        groups.append(f"(?P<non_cooking>{_trie_pattern(non_cooking)})")
+    if not groups:
+        return re.compile(r"(?!x)x")
+    return re.compile(r"\b(?:" + "|".join(groups) + ")" + _SUFFIXES + r"\b", re.IGNORECASE)
 
+
+def load_guardrail_terms(path: Optional[Path] = None) -> Dict[str, List[str]]:
+    """Term lists from a JSON file ({"forbidden": [...], "non_cooking": [...]}), or the defaults."""
+    path = Path(path or TERMS_FILE)
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return DEFAULT_TERMS
+
+
+_guardrail_re = _compile_guardrail(load_guardrail_terms())
+
+
+def configure_guardrail(terms: Optional[Dict[str, List[str]]] = None, path: Optional[Path] = None) -> None:
+    """Recompile the guardrail from `terms` or a terms file and drop cached results."""
+    global _guardrail_re
+    _guardrail_re = _compile_guardrail(terms if terms is not None else load_guardrail_terms(path))
+    guardrail.cache_clear()
+
+
+@lru_cache(maxsize=4096)
 def guardrail(text: str) -> Tuple[bool, str]:
-    # simple forbidden word list + non-cooking topics
-    forbidden = ["bomb", "weapon", "kill", "poison", "manufacture", "bombs"]
-    non_cooking = ["law", "divorce", "tax", "stocks", "politics", "programming", "hack"]
-    low = text.lower()
-    for f in forbidden:
-        if f in low:
-            return False, f"Forbidden term detected: {f}"
-    for n in non_cooking:
-        if n in low:
-            return False, f"I can help with cooking only; your query mentions {n}."
+    # forbidden terms take priority over non-cooking topics wherever they appear
+    non_cooking = None
+    for m in _guardrail_re.finditer(text):
+        groups = m.groupdict()
+        if groups.get("forbidden"):
+            return False, f"Forbidden term detected: {groups['forbidden'].lower()}"
+        if non_cooking is None:
+            non_cooking = groups.get("non_cooking")
+    if non_cooking:
+        return False, f"I can help with cooking only; your query mentions {non_cooking.lower()}."
     return True, ""
+
+
+def guardrail_many(texts: Iterable[str]) -> List[Tuple[bool, str]]:
+    """guardrail() for a batch of messages."""
+    return [guardrail(t) for t in texts]
@@ -5,52 +5,185 @@ Defines a LangGraph-style workflow using langgraph_runtime.Graph and Node object
 This file wires the Supervisor and the agent nodes.
 """
 
-from langgraph_runtime import Graph, Node
+import asyncio
+import os
+import re
+from langgraph_runtime import AsyncGraph, AsyncNode, Graph, Node, emit
 from typing import Dict, Any, Tuple, Optional
-from agents import (
-    greeting, preference, recipe as recipe_agent,
-    regular_chat, step_by_step, feedback as feedback_agent
-)
+# agents are attributes of the package, loaded on first use (see agents/__init__.py)
+import agents
 from utils import scrub_pii, guardrail
-from models import Preferences
 from memory import push_recipe
+from metrics import span
+from router import Route, Router
+from cache import canonical_prefs
+import quantities
+
+
+def _needs_preferences(ctx: Dict[str, Any]) -> bool:
+    # preferences not collected or mid-flow
+    return "preferences" not in ctx or ctx.get("_expecting_pref_answer", False)
+
+
+# Routing table for the supervisor, tried in priority order (see router.py).
+# `examples` only train the optional local classifier (ROUTER_CLASSIFIER=1).
+ROUTES = [
+    Route("greeting", "routing to greeting", priority=90,
+          keywords=("hi", "hello", "namaste", "hey"),
+          examples=("hi there", "hello chef", "namaste", "hey", "good morning chef")),
+    Route("preference", "need preferences", priority=80, when=_needs_preferences),
+    # "make it for 6 people" rescales the last recipe instead of generating a new one
+    Route("scale", "rescale recipe", priority=75,
+          keywords=("people", "persons", "servings", "guests", "portions"),
+          when=lambda ctx: bool(ctx.get("last_recipe") and ctx.get("preferences"))),
+    # a bare number answering scale's "How many people...?"
+    Route("scale", "servings answer", priority=75, exact=tuple(str(n) for n in range(1, 100)),
+          when=lambda ctx: bool(ctx.get("expecting_servings") and ctx.get("last_recipe"))),
+    Route("recipe", "user wants a recipe", priority=70,
+          keywords=("recipe", "recipes", "cook", "cooking", "make", "making",
+                    "i want to cook", "i want to make"),
+          examples=("give me a recipe", "what should i cook tonight", "suggest a dinner dish",
+                    "something spicy for lunch", "i feel like biryani", "dinner idea please",
+                    "what can i prepare with paneer")),
+    # yes/no after recipe offer to start step-by-step
+    Route("step_by_step", "start step", priority=60,
+          exact=("yes", "y", "sure", "please"),
+          when=lambda ctx: bool(ctx.get("last_recipe") and not ctx.get("_in_steps"))),
+    # during step-by-step navigation (see agents/step_by_step.py for the commands)
+    Route("step_by_step", "step nav", priority=50,
+          exact=("next", "n", "repeat", "r", "slow", "s", "back", "b", "previous", "prev"),
+          keywords=("step", "jump"),
+          when=lambda ctx: bool(ctx.get("_in_steps"))),
+    Route("feedback", "collect feedback", priority=40,
+          when=lambda ctx: bool(ctx.get("_in_steps") and ctx.get("expecting_feedback"))),
+]
+
+# general cooking questions that should stay with regular chat
+CHAT_EXAMPLES = ("how do i keep rice fluffy", "is ghee better than butter", "why is my dough sticky",
+                 "which chilli is the hottest", "substitute for paneer", "how long do lentils keep")
+
+router = Router(ROUTES, default_node="regular_chat", default_reason="fallback to regular chat",
+                classifier=os.getenv("ROUTER_CLASSIFIER", "0") == "1", default_examples=CHAT_EXAMPLES)
 
 
 def supervisor_action(ctx: Dict[str, Any], message: str) -> Tuple[str, Optional[str], Dict[str, Any]]:
     """
     Supervisor returns a node key to execute (the next node).
-    We implement a ReAct-style decision heuristic here; replace with LLM prompt if desired.
+    Guardrail first, then the ROUTES table; replace with LLM prompt if desired.
     """
-    m = message.strip().lower()
-    ok, reason = guardrail(message)
+    with span("guardrail"):
+        ok, reason = guardrail(message)
     if not ok:
         return reason, "regular_chat", {}
+    if ctx.get("expecting_feedback") and not _SCORE_RE.match(message):
+        # the rating request went unanswered: an ordinary question is routed as usual
+        ctx.pop("expecting_feedback", None)
+    with span("route"):
+        node_key, why = router.route(ctx, message)
+    if node_key != "scale":
+        # the servings question went unanswered
+        ctx.pop("expecting_servings", None)
+    else:
+        people = _people(message)
+        if people is not None and _rescaled(ctx, people) is None:
+            # quantities we cannot read: generate for the new count instead, as a
+            # "recipe" turn so admission control (admission.py) gates the LLM call
+            ctx.pop("expecting_servings", None)
+            ctx["preferences"] = dict(ctx["preferences"], number_of_people=people)
+            node_key, why = "recipe", "regenerate for a new count"
+    return why, node_key, {}
 
-    # greeting
-    if any(w in m for w in ["hi", "hello", "namaste", "hey"]):
-        return "routing to greeting", "greeting", {}
 
-    # preferences not collected or mid-flow
-    if "preferences" not in ctx or ctx.get("_expecting_pref_answer", False):
-        return "need preferences", "preference", {}
+_PEOPLE_RE = re.compile(r"\b(\d{1,2})\b")
 
-    # explicit recipe intent
-    if any(w in m for w in ["recipe", "cook", "make", "i want to cook", "i want to make"]):
-        return "user wants a recipe", "recipe", {}
 
-    # yes/no after recipe offer to start step-by-step
-    if m in ("yes", "y", "sure", "please") and ctx.get("last_recipe"):
-        return "start step", "step_by_step", {}
+def _people(message: str) -> Optional[int]:
+    m = _PEOPLE_RE.search(message)
+    return int(m.group(1)) if m and 1 <= int(m.group(1)) <= 20 else None
+
+
+def _rescaled(ctx: Dict[str, Any], people: int) -> Optional[Dict[str, Any]]:
+    """The last recipe scaled to `people`, or None when it cannot be done locally."""
+    last = ctx["last_recipe"]
+    servings = last.get("servings") or ctx["preferences"].get("number_of_people")
+    with span("scale"):
+        return quantities.scale_recipe(dict(last, servings=servings), people)
+
+# feedback starts with its 1-5 score: "4", "5/5 loved it", "3 - a bit salty"
+_SCORE_RE = re.compile(r"^\s*([1-5])(?!\d)\W*(.*)$", re.DOTALL)
+
+# while admission control sheds load (admission.py), catalog recipes down to
+# this match score are served instead of an LLM call
+SHED_MIN_SCORE = float(os.getenv("ADMISSION_SHED_MIN_SCORE") or 0.5)
+BUSY_TEXT = "I'm cooking for a lot of people right now. Please ask me again in a minute!"
+
+
+def _recipe_prefs(ctx: Dict[str, Any]):
+    """Return (Preferences, None), or (None, node_result) when preferences are missing/invalid."""
+    prefs = ctx.get("preferences")
+    if not prefs:
+        return None, ("I need your preferences first.", "preference", {})
+    # convert to Pydantic object for LLM call (models is imported here so the
+    # workflow loads without pydantic until a recipe is needed)
+    from models import Preferences
+    try:
+        return Preferences(**prefs), None
+    except Exception as e:
+        return None, (f"Preferences appear invalid: {e}", "preference", {})
+
+
+_STEP_KEYS = ("step_index", "_armed_steps", "_in_steps", "expecting_feedback")
+
+
+def _clear_steps(ctx: Dict[str, Any]) -> None:
+    """Leave step-by-step mode; timers still running keep running."""
+    for k in _STEP_KEYS:
+        ctx.pop(k, None)
 
-    # during step-by-step navigation
+
+def _end_steps(ctx: Dict[str, Any]) -> None:
+    """Leave step-by-step mode, cancelling the timers of the recipe being cooked."""
     if ctx.get("_in_steps"):
-        if m in ("next", "n", "repeat", "r", "slow", "s"):
-            return "step nav", "step_by_step", {}
-        if ctx.get("expecting_feedback"):
-            return "collect feedback", "feedback", {}
+        agents.step_by_step.finish_steps(ctx.get("user_id", "anonymous"))
+    _clear_steps(ctx)
+
+
+def _finish_recipe(ctx: Dict[str, Any], recipe_obj: Dict[str, Any]):
+    """Store the generated recipe on ctx and in the DB, and format it for the user."""
+    # a new recipe ends the one being cooked
+    _end_steps(ctx)
+    ctx["last_recipe"] = recipe_obj
+    # persist recipe
+    uid = ctx.get("user_id", "anonymous")
+    try:
+        push_recipe(uid, recipe_obj.get("title", "untitled"), recipe_obj,
+                    canonical_prefs(ctx["preferences"]) if ctx.get("preferences") else None)
+    except Exception:
+        pass
+    # format output
+    parts = []
+    parts.append(f"{recipe_obj.get('title')}\n")
+    parts.append(f"Cultural note: {recipe_obj.get('cultural_note')}\n")
+    parts.append("Ingredients:")
+    for i in recipe_obj.get("ingredients", []):
+        parts.append(f"- {i}")
+    parts.append("\nMethod:")
+    for idx, s in enumerate(recipe_obj.get("steps", []), start=1):
+        parts.append(f"{idx}. {s.get('text')}")
+    parts.append("\nTips:")
+    for t in recipe_obj.get("tips", []):
+        parts.append(f"- {t}")
+    parts.append("\nWould you like step-by-step guidance? (yes/no)")
+    return "\n".join(parts), None, {"last_recipe": recipe_obj}
 
-    # fallback
-    return "fallback to regular chat", "regular_chat", {}
+
+async def async_recipe_action(ctx: Dict[str, Any], message: str):
+    prefs_obj, err = _recipe_prefs(ctx)
+    if err:
+        return err
+    recipe_obj = await agents.recipe.agenerate(prefs_obj, user_id=ctx.get("user_id"))
+    # cancels timers and stores the recipe: blocking work, done off the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, _finish_recipe, ctx, recipe_obj)
 
 
 def build_graph() -> Graph:
@@ -63,7 +196,7 @@ def build_graph() -> Graph:
     # Greeting Node
     def greeting_action(ctx: Dict[str, Any], message: str):
         name = ctx.get("user_name", "friend")
-        text = greeting.greet(name)
+        text = agents.greeting.greet(name)
         return text, None, {}
 
     g.add_node(Node("greeting", greeting_action))
@@ -74,7 +207,7 @@ def build_graph() -> Graph:
         # Flow: store answers until done, validate with Pydantic
         if "preferences" in ctx:
             return "Preferences already set.", None, {}
-        questions = preference.ask_preferences()["questions"]
+        questions = agents.preference.ask_preferences()["questions"]
         stage = ctx.get("_pref_stage", 0)
         answers = ctx.get("_pref_answers", [])
 
@@ -94,7 +227,8 @@ def build_graph() -> Graph:
         keys = [q['key'] for q in questions]
         for k, v in zip(keys, answers):
             raw[k] = v
-        valid, prefs_or_err = preference.validate_preferences(raw)
+        with span("preference_validation"):
+            valid, prefs_or_err = agents.preference.validate_preferences(raw)
         if not valid:
             # reset on error
             ctx.pop("_pref_stage", None)
@@ -111,52 +245,68 @@ def build_graph() -> Graph:
 
     # Recipe Node
     def recipe_action(ctx: Dict[str, Any], message: str):
-        prefs = ctx.get("preferences")
-        if not prefs:
-            return "I need your preferences first.", "preference", {}
-        # convert to Pydantic object for LLM call
-        try:
-            prefs_obj = Preferences(**prefs)
-        except Exception as e:
-            return f"Preferences appear invalid: {e}", "preference", {}
-        recipe_obj = recipe_agent.generate(prefs_obj)
-        ctx["last_recipe"] = recipe_obj
-        # persist recipe
-        uid = ctx.get("user_id", "anonymous")
-        try:
-            push_recipe(uid, recipe_obj.get("title", "untitled"), recipe_obj)
-        except Exception:
-            pass
-        # format output
-        parts = []
-        parts.append(f"{recipe_obj.get('title')}\n")
-        parts.append(f"Cultural note: {recipe_obj.get('cultural_note')}\n")
-        parts.append("Ingredients:")
-        for i in recipe_obj.get("ingredients", []):
-            parts.append(f"- {i}")
-        parts.append("\nMethod:")
-        for idx, s in enumerate(recipe_obj.get("steps", []), start=1):
-            parts.append(f"{idx}. {s.get('text')}")
-        parts.append("\nTips:")
-        for t in recipe_obj.get("tips", []):
-            parts.append(f"- {t}")
-        parts.append("\nWould you like step-by-step guidance? (yes/no)")
-        return "\n".join(parts), None, {"last_recipe": recipe_obj}
+        prefs_obj, err = _recipe_prefs(ctx)
+        if err:
+            return err
+        # stream partial fields to any listener (app.py renders them as they arrive)
+        recipe_obj = None
+        for kind, key, value in agents.recipe.generate_stream(prefs_obj, user_id=ctx.get("user_id")):
+            if kind == "done":
+                recipe_obj = value
+            else:
+                emit(kind, key, value)
+        return _finish_recipe(ctx, recipe_obj)
 
     g.add_node(Node("recipe", recipe_action))
 
+    # Shed recipe Node: not routed to; admission.py runs it instead of "recipe" when overloaded
+    def recipe_offline_action(ctx: Dict[str, Any], message: str):
+        prefs_obj, err = _recipe_prefs(ctx)
+        if err:
+            return err
+        recipe_obj = agents.recipe.offline(prefs_obj, min_score=SHED_MIN_SCORE)
+        if recipe_obj is None:
+            return BUSY_TEXT, None, {}
+        text, next_node, data = _finish_recipe(ctx, recipe_obj)
+        return "It's a busy kitchen right now, so here is a tried and tested recipe.\n\n" + text, next_node, data
+
+    g.add_node(Node("recipe_offline", recipe_offline_action))
+
+    # Scale Node: new number_of_people for the last recipe, without an LLM call
+    def scale_action(ctx: Dict[str, Any], message: str):
+        people = _people(message)
+        if people is None:
+            ctx["expecting_servings"] = True
+            return "How many people should the recipe serve? (1-20)", None, {}
+        ctx.pop("expecting_servings", None)
+        scaled = _rescaled(ctx, people)
+        ctx["preferences"] = dict(ctx["preferences"], number_of_people=people)
+        if scaled is None:
+            # the supervisor routes these to "recipe"; only a direct call gets here
+            return recipe_action(ctx, message)
+        return _finish_recipe(ctx, scaled)
+
+    g.add_node(Node("scale", scale_action))
+
     # Step-by-step Node
     def step_action(ctx: Dict[str, Any], message: str):
         recipe_obj = ctx.get("last_recipe")
         if not recipe_obj:
             return "No recipe to guide. Ask for a recipe first.", None, {}
         uid = ctx.get("user_id", "anonymous")
-        res = step_by_step.start_step_by_step(uid, recipe_obj)
-        # expected res: {'agent':'step','current_step':..., 'remaining':[...]}
-        ctx["step_state"] = res
-        ctx["_in_steps"] = True
-        # return first step text
-        return f"Starting step-by-step. Step: {res['current_step'].get('text')}", None, {}
+        if ctx.get("_in_steps"):
+            command, target = agents.step_by_step.parse_command(message)
+            res = agents.step_by_step.navigate(uid, recipe_obj, ctx.get("step_index", 0), command, target,
+                                               armed=ctx.get("_armed_steps", 0))
+        else:
+            res = agents.step_by_step.start_step_by_step(uid, recipe_obj)
+            ctx["_in_steps"] = True
+        # expected res: {'agent':'step','current_step':..., 'index':i, 'total':n, 'armed':mask, 'done':bool, 'text':...}
+        ctx["step_index"] = res["index"]
+        ctx["_armed_steps"] = res["armed"]
+        if res["done"]:
+            ctx["expecting_feedback"] = True
+        return res["text"], None, {}
 
     g.add_node(Node("step_by_step", step_action))
 
@@ -164,14 +314,13 @@ def build_graph() -> Graph:
     def feedback_action(ctx: Dict[str, Any], message: str):
         uid = ctx.get("user_id", "anonymous")
         try:
-            parts = message.strip().split(None, 1)
-            score = int(parts[0])
-            comment = parts[1] if len(parts) > 1 else ""
-            out = feedback_agent.collect_feedback(uid, score, comment)
-            # clear context fields to end session
-            ctx_keys = ["last_recipe", "step_state", "_in_steps", "expecting_feedback"]
-            for k in ctx_keys:
-                ctx.pop(k, None)
+            m = _SCORE_RE.match(message)
+            score, comment = int(m.group(1)), m.group(2).strip()
+            out = agents.feedback.collect_feedback(uid, score, comment, recipe=ctx.get("last_recipe"),
+                                                   prefs=ctx.get("preferences"))
+            # clear context fields to end session; the last step's timer may still be running
+            _clear_steps(ctx)
+            ctx.pop("last_recipe", None)
             return out.get("text", "Thanks for the feedback!"), None, {}
         except Exception:
             return "Please provide feedback starting with a number 1-5.", None, {}
@@ -180,8 +329,26 @@ def build_graph() -> Graph:
 
     # Regular Chat Node
     def regular_action(ctx: Dict[str, Any], message: str):
-        return regular_chat.reply(message).get("text", "I can help with cooking topics."), None, {}
+        return agents.regular_chat.reply(message).get("text", "I can help with cooking topics."), None, {}
 
     g.add_node(Node("regular_chat", regular_action))
 
     return g
+
+
+# an LLM call slower than this answers the turn with AsyncGraph.timeout_text
+RECIPE_TIMEOUT_SEC = 60.0
+
+
+def build_async_graph(executor=None) -> AsyncGraph:
+    """
+    Same nodes as build_graph(), on an AsyncGraph. The recipe node awaits the
+    async OpenAI client; the other (cheap, sync) nodes run in the thread pool.
+    """
+    sync_graph = build_graph()
+    g = AsyncGraph(executor=executor)
+    for node in sync_graph.nodes.values():
+        g.add_node(node)
+    g.set_supervisor(sync_graph.supervisor_key)
+    g.add_node(AsyncNode("recipe", async_recipe_action, timeout=RECIPE_TIMEOUT_SEC))
+    return g